@@ -0,0 +1,92 @@
+import asyncio
+from typing import Dict, FrozenSet, Optional
+
+from telegram.constants import ChatMemberStatus
+
+from cache import TTLCache
+from config import logger, ADMIN_CACHE_SIZE, ADMIN_CACHE_TTL
+
+_ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+
+class AdminCache:
+    """
+    Conjunto de administradores por chat, obtenido con un único get_chat_administrators.
+    Se renueva por TTL y se corrige al vuelo con las actualizaciones chat_member.
+    """
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 600):
+        self._admins = TTLCache(maxsize, ttl)
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    async def get_admins(self, bot, chat_id: int) -> Optional[FrozenSet[int]]:
+        """Ids de los administradores del chat, o None si Telegram no los devuelve (chat privado, sin acceso...)"""
+        if chat_id > 0:
+            return None  # chat privado: no tiene administradores
+        admins = self._admins.get(chat_id)
+        if admins is not None:
+            return admins
+
+        # Varias comprobaciones simultáneas del mismo chat comparten una sola llamada
+        pending = self._inflight.get(chat_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[chat_id] = future
+        try:
+            self.fetches += 1
+            members = await bot.get_chat_administrators(chat_id)
+            admins = frozenset(m.user.id for m in members)
+            self._admins.set(chat_id, admins)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # Los fallos no se cachean: el siguiente intento vuelve a preguntar
+            self.fetch_errors += 1
+            logger.warning(f"No se pudieron obtener los administradores de {chat_id}: {e}")
+            admins = None
+        finally:
+            self._inflight.pop(chat_id, None)
+        future.set_result(admins)
+        return admins
+
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        admins = await self.get_admins(bot, chat_id)
+        return bool(admins) and user_id in admins
+
+    def peek(self, chat_id: int, user_id: int) -> Optional[bool]:
+        """Consulta sin llamar a Telegram: None si el chat no está en caché (para comprobaciones síncronas)"""
+        admins = self._admins.get(chat_id)
+        return None if admins is None else user_id in admins
+
+    def invalidate(self, chat_id: int):
+        self._admins.pop(chat_id)
+
+    def apply_chat_member_update(self, chat_member_updated):
+        """Aplica un ChatMemberUpdated: promociones y degradaciones sin volver a pedir la lista"""
+        chat_id = chat_member_updated.chat.id
+        user_id = chat_member_updated.new_chat_member.user.id
+        was_admin = chat_member_updated.old_chat_member.status in _ADMIN_STATUSES
+        is_admin = chat_member_updated.new_chat_member.status in _ADMIN_STATUSES
+        if was_admin == is_admin:
+            return
+        admins = self._admins.get(chat_id)
+        if admins is None:
+            return
+        self._admins.set(chat_id, admins | {user_id} if is_admin else admins - {user_id})
+
+    def metrics(self) -> dict:
+        return {
+            "chats": len(self._admins),
+            "hits": self._admins.hits,
+            "misses": self._admins.misses,
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors
+        }
+
+
+admin_cache = AdminCache(ADMIN_CACHE_SIZE, ADMIN_CACHE_TTL)
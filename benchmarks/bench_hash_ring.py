@@ -0,0 +1,39 @@
+"""
+Reparto por hash consistente del modo multiproceso: equilibrio entre workers,
+chats que cambian de worker al caer uno y coste de enrutar un update.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_hash_ring
+"""
+import timeit
+from collections import Counter
+
+from sharding import HashRing, shard_key
+
+WORKERS = 4
+CHATS = range(-1001000000000, -1001000000000 + 100000)
+NUMBER = 100000
+
+
+def main():
+    ring = HashRing()
+    for worker in range(WORKERS):
+        ring.add(worker)
+
+    owners = {chat: ring.get(chat) for chat in CHATS}
+    counts = Counter(owners.values())
+    ideal = len(CHATS) / WORKERS
+    print("reparto:", ", ".join(f"w{w}={c / ideal:.2f}" for w, c in sorted(counts.items())), "(1.00 = ideal)")
+
+    ring.remove(WORKERS - 1)
+    moved = [chat for chat in CHATS if owners[chat] != ring.get(chat)]
+    assert all(owners[chat] == WORKERS - 1 for chat in moved), "solo deben moverse los chats del worker caído"
+    print(f"al caer un worker se mueven {len(moved) / len(CHATS):.1%} de los chats (ideal {1 / WORKERS:.1%})")
+
+    update = {"update_id": 1, "message": {"message_id": 7, "chat": {"id": -1001234567890}, "text": "hola"}}
+    elapsed = timeit.timeit(lambda: ring.get(shard_key(update)), number=NUMBER)
+    print(f"enrutar un update: {elapsed / NUMBER * 1e6:.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Router de callbacks: compara la cadena if/elif de startswith anterior (solo la
+resolución y el parseo de argumentos) con CallbackRouter, con y sin caché.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_router
+"""
+import timeit
+from types import SimpleNamespace
+
+from callbacks import CallbackHandlers
+
+NUMBER = 20000
+
+# Mezcla representativa: navegación pública (lo más frecuente) y paneles de admin
+SAMPLE = [
+    "wb_home_-1001234567890", "wb_42", "wb_1337", "wb_7",
+    "admin_panel", "view_groups", "manage_welcomes",
+    "config_welcome_-1001234567890", "group_settings_-1001234567890",
+    "node_mgr_-1001234567890_42", "node_set_parse_42_MarkdownV2",
+    "groups_next_2024-01-01T10:00:00.123456_-1001234567890",
+    "gs_parse_HTML", "back_welcome_-1001234567890", "refresh_stats_-1001234567890",
+    "clear_welcome_topic_-1001234567890",
+]
+
+_CHAT_ID_PREFIXES = (
+    "config_welcome_", "group_settings_", "group_stats_", "config_group_",
+    "edit_welcome_buttons_", "edit_welcome_message_", "edit_welcome_image_",
+    "toggle_welcome_", "test_welcome_", "update_group_", "deactivate_group_",
+    "refresh_stats_", "set_welcome_topic_instr_", "clear_welcome_topic_",
+)
+_NODE_ID_PREFIXES = (
+    "node_add_url_", "node_add_sub_", "node_clear_btns_", "node_set_image_",
+    "node_rename_", "node_del_", "node_parse_",
+)
+
+
+def legacy_resolve(data: str):
+    """Copia del orden de comprobaciones de la cadena if/elif anterior"""
+    if data.startswith("wb_home_"):
+        return "wb_home", {"chat_id": int(data.split("_")[-1])}
+    if data.startswith("wb_") and data[3:].isdigit():
+        return "wb", {"node_id": int(data.split("_")[1])}
+    if data in ("admin_panel", "view_groups", "bot_info", "manage_welcomes", "global_settings", "general_stats"):
+        return data, {}
+    if data.startswith("groups_next_") or data.startswith("groups_prev_"):
+        _, direction, added_date, chat_id = data.split("_", 3)
+        return "groups_" + direction, {"added_date": added_date, "chat_id": int(chat_id)}
+    for prefix in _CHAT_ID_PREFIXES[:4]:
+        if data.startswith(prefix):
+            return prefix, {"chat_id": int(data.split("_")[-1])}
+    if data.startswith("edit_welcome_buttons_"):
+        return "edit_welcome_buttons_", {"chat_id": int(data.split("_")[-1])}
+    if data.startswith("node_mgr_"):
+        parts = data.split("_")
+        return "node_mgr_", {"chat_id": int(parts[-2]), "node_id": int(parts[-1])}
+    for prefix in _NODE_ID_PREFIXES[:5]:
+        if data.startswith(prefix):
+            return prefix, {"node_id": int(data.split("_")[-1])}
+    if data.startswith("node_list_children_"):
+        parts = data.split("_")
+        return "node_list_children_", {"chat_id": int(parts[-2]), "node_id": int(parts[-1])}
+    if data.startswith("node_del_"):
+        return "node_del_", {"node_id": int(data.split("_")[-1])}
+    for prefix in _CHAT_ID_PREFIXES[5:12]:
+        if data.startswith(prefix):
+            return prefix, {"chat_id": int(data.split("_")[-1])}
+    for prefix in ("gs_lang_", "gs_datefmt_", "gs_parse_"):
+        if data.startswith(prefix):
+            return prefix, {"value": data.split("_")[-1]}
+    if data.startswith("node_parse_"):
+        return "node_parse_", {"node_id": int(data.split("_")[-1])}
+    if data.startswith("node_set_parse_"):
+        parts = data.split("_")
+        return "node_set_parse_", {"node_id": int(parts[-2]), "mode": parts[-1]}
+    for prefix in _CHAT_ID_PREFIXES[12:]:
+        if data.startswith(prefix):
+            return prefix, {"chat_id": int(data.split("_")[-1])}
+    if data.startswith("back_"):
+        parts = data.split("_")
+        return "back_" + parts[1], {"chat_id": int(parts[-1])} if len(parts) > 2 else {}
+    return None, None
+
+
+def check_identical(router):
+    # Mismos argumentos (valores) que la cadena anterior para cada callback de la muestra
+    for data in SAMPLE:
+        route, kwargs = router.resolve(data)
+        _, legacy = legacy_resolve(data)
+        assert route is not None, data
+        assert list(kwargs.values()) == list(legacy.values()), (data, kwargs, legacy)
+    # Lo que antes no casaba sigue sin casar
+    for data in ("config_welcome_x", "wb_abc", "unknown", "node_mgr_1"):
+        assert router.resolve(data) == (None, None), data
+
+
+def main():
+    router = CallbackHandlers(SimpleNamespace(), SimpleNamespace(scheduler=None)).router
+    check_identical(router)
+    print(f"Mismos argumentos en {len(SAMPLE)} callbacks ({len(router.routes)} rutas)")
+
+    def run(resolve):
+        for data in SAMPLE:
+            resolve(data)
+
+    legacy = timeit.timeit(lambda: run(legacy_resolve), number=NUMBER)
+    uncached = timeit.timeit(lambda: run(router._resolve), number=NUMBER)
+    cached = timeit.timeit(lambda: run(router.resolve), number=NUMBER)
+    per_call = NUMBER * len(SAMPLE)
+    print(
+        f"if/elif: {legacy / per_call * 1e6:6.2f} µs  "
+        f"trie: {uncached / per_call * 1e6:6.2f} µs  "
+        f"trie+caché: {cached / per_call * 1e6:6.2f} µs  "
+        f"x{legacy / cached:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Pantallas estáticas: comprueba que el texto cacheado es idéntico byte a byte al que
+producían los handlers originales (benchmarks/screens_baseline.py) y mide la diferencia.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_screens
+"""
+import timeit
+
+import callbacks  # noqa: F401 (registra sus pantallas)
+import commands  # noqa: F401
+import messages  # noqa: F401
+from emoji_registry import emoji_registry
+from helpers import add_premium_emojis
+from screens import StaticScreen, _registry
+
+from benchmarks.screens_baseline import BASELINE
+
+NUMBER = 20000
+
+
+def _screens():
+    """Pantallas registradas por módulo, con el mismo nombre que en BASELINE"""
+    found = {}
+    for module in (callbacks, commands, messages):
+        for name, value in vars(module).items():
+            if isinstance(value, StaticScreen):
+                found[f"{module.__name__}.{name}"] = value
+    return found
+
+
+def _compare(screens):
+    for name, screen in screens.items():
+        # Los handlers originales siempre usaban MarkdownV2
+        expected = add_premium_emojis(BASELINE[name], "MarkdownV2")
+        assert screen.text.encode() == expected.encode(), name
+
+
+def check_identical():
+    screens = _screens()
+    assert set(screens) == set(BASELINE), set(screens) ^ set(BASELINE)
+    assert len(screens) == len(_registry)
+    _compare(screens)
+    # Recargar el registro debe invalidar el texto cacheado
+    emoji_registry.load([{"code": ":crown_premium:", "emoji": "🤴", "emoji_id": None}])
+    _compare(screens)
+    emoji_registry.load([])
+
+
+def main():
+    check_identical()
+    print(f"Salida idéntica en las {len(_registry)} pantallas")
+
+    screen = max(_registry, key=lambda s: len(s.template))
+    live = timeit.timeit(screen.render, number=NUMBER)
+    cached = timeit.timeit(lambda: screen.text, number=NUMBER)
+    print(
+        f"en vivo: {live / NUMBER * 1e6:7.2f} µs  "
+        f"cacheado: {cached / NUMBER * 1e6:7.2f} µs  "
+        f"x{live / cached:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Microbenchmark: format_welcome_message vs plantilla precompilada.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_templates
+"""
+import timeit
+from types import SimpleNamespace
+
+from config import DEFAULT_WELCOME_MESSAGE
+from helpers import format_welcome_message
+from templates import CompiledTemplate
+
+USERS = [
+    SimpleNamespace(id=1742433244, first_name="Ana", username="ana_dev"),
+    SimpleNamespace(id=55, first_name="José <b>", username=None),
+    SimpleNamespace(id=56, first_name="Mr. Smith (admin)", username="smith"),
+    SimpleNamespace(id=57, first_name="{group_name}:fire_premium:", username=None),
+    SimpleNamespace(id=58, first_name="crown_premium", username="username"),
+    None,
+]
+GROUP = "Comunidad Premium 2.0"
+TEMPLATES = [
+    DEFAULT_WELCOME_MESSAGE,
+    "Hola {mention} :crown_premium: bienvenido a {group_name} :fire_premium:",
+    "Sin placeholders :star_premium:",
+    ":star_premium:{name}:fire_premium: {{username}} {mention}{name}",
+]
+PARSE_MODES = ["HTML", "MarkdownV2", None, "plain"]
+NUMBER = 20000
+
+
+def check_identical():
+    for template in TEMPLATES:
+        for pm in PARSE_MODES:
+            compiled = CompiledTemplate(template, pm)
+            for user in USERS + [USERS[:3]]:
+                expected = format_welcome_message(template, user, GROUP, parse_mode=pm)
+                got = compiled.render(user, GROUP)
+                assert got == expected, (template, pm, user, got, expected)
+
+
+def main():
+    check_identical()
+    print("Salida idéntica en todas las combinaciones")
+
+    user = USERS[0]
+    for pm in ("HTML", "MarkdownV2"):
+        compiled = CompiledTemplate(DEFAULT_WELCOME_MESSAGE, pm)
+        legacy = timeit.timeit(lambda: format_welcome_message(DEFAULT_WELCOME_MESSAGE, user, GROUP, parse_mode=pm), number=NUMBER)
+        fast = timeit.timeit(lambda: compiled.render(user, GROUP), number=NUMBER)
+        print(
+            f"{pm:<10} clásico: {legacy / NUMBER * 1e6:7.2f} µs  "
+            f"compilado: {fast / NUMBER * 1e6:7.2f} µs  "
+            f"x{legacy / fast:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+"""
+Planes de consulta de DatabaseManager: siembra una base de datos sintética en un mongod
+local, ejecuta cada método, captura los comandos que manda el driver y los repite con
+explain("executionStats"). Falla (código de salida 1) si un comando hace COLLSCAN, si un
+$lookup recorre la colección entera, si una consulta acotada ordena en memoria o si los
+documentos/claves examinados por documento devuelto superan el presupuesto. Para cada
+fallo sugiere el índice que falta (igualdad, orden, rango).
+
+La base de datos se borra al empezar y al terminar: nunca apuntar a la de producción.
+
+Uso (desde la raíz del repo, con un mongod en localhost):
+    python -m benchmarks.check_query_plans
+    QUERY_PLAN_MONGO_URI=mongodb://otro:27017 python -m benchmarks.check_query_plans
+"""
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from config import GROUPS_PAGE_SIZE
+from db_manager import DatabaseManager
+from mongo_profiler import query_shape
+
+MONGO_URI = os.environ.get("QUERY_PLAN_MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = "query_plan_check"
+
+GROUPS = 2000
+FIRST_CHAT_ID = -1001000000000
+# Documentos + claves examinados por documento devuelto (un $lookup suma los de la colección unida)
+MAX_EXAMINED_PER_RETURNED = 4.0
+
+_EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# Campos que añade el driver y que explain no admite
+_DRIVER_FIELDS = {
+    "$db", "lsid", "$clusterTime", "txnNumber", "autocommit", "startTransaction",
+    "$readPreference", "readConcern", "writeConcern", "apiVersion", "apiStrict", "apiDeprecationErrors",
+}
+# Partes del explain que no son el plan ejecutado
+_SKIP_KEYS = {"rejectedPlans", "allPlansExecution", "slotBasedPlan", "serverInfo", "command", "parsedQuery", "filter"}
+
+
+class Scenario:
+    """Una llamada a DatabaseManager; budget=None para lecturas completas por diseño (agregados)"""
+    __slots__ = ("name", "run", "budget", "full_reads")
+
+    def __init__(self, name: str, run, budget: Optional[float] = MAX_EXAMINED_PER_RETURNED, full_reads: Tuple[str, ...] = ()):
+        self.name = name
+        self.run = run
+        self.budget = budget
+        # Colecciones que el escenario lee enteras a propósito (COLLSCAN esperado)
+        self.full_reads = full_reads
+
+
+class _CommandRecorder(monitoring.CommandListener):
+    """Guarda los comandos explicables que se envían mientras hay un escenario activo"""
+
+    def __init__(self):
+        self.scenario: Optional[Scenario] = None
+        self.commands: List[Tuple[Scenario, str, Dict[str, Any]]] = []
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if self.scenario is not None and event.database_name == DB_NAME and event.command_name in _EXPLAINABLE:
+            self.commands.append((self.scenario, event.command_name, dict(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def seed(db: DatabaseManager) -> SimpleNamespace:
+    """
+    Grupos (1 de cada 5 inactivo), ajustes y estadísticas para parte de ellos y un árbol
+    raíz + 3 hijos + 1 nieto en 3 de cada 4 chats. Devuelve los ids que usan los escenarios.
+    """
+    started = datetime(2024, 1, 1)
+    groups, settings, stats, nodes = [], [], [], []
+    roots: Dict[int, int] = {}
+    children: Dict[int, int] = {}
+    node_id = 0
+    for i in range(GROUPS):
+        chat_id = FIRST_CHAT_ID - i
+        group = {
+            "chat_id": chat_id, "title": f"Grupo {i}", "type": "supergroup", "added_by": 1000 + i,
+            "added_date": (started + timedelta(minutes=i)).isoformat(), "active": i % 5 != 0, "is_forum": i % 7 == 0,
+        }
+        if i % 50:
+            group["member_count"] = 3 + i % 500
+        groups.append(group)
+        if i % 10 < 7:
+            settings.append({"chat_id": chat_id, "enabled": True, "message": "Hola {mention}", "buttons": [], "parse_mode": "HTML"})
+        if i % 10 < 6:
+            stats.append({"chat_id": chat_id, "welcomes_sent": i % 97, "last_activity": started.isoformat()})
+        if i % 4 == 3:
+            continue
+        node_id += 1
+        root = roots[chat_id] = node_id
+        nodes.append({"node_id": root, "chat_id": chat_id, "parent_id": None, "text": "Bienvenida", "parse_mode": "HTML", "buttons": []})
+        for c in range(3):
+            node_id += 1
+            nodes.append({"node_id": node_id, "chat_id": chat_id, "parent_id": root, "text": f"Sub {c}", "parse_mode": "HTML", "buttons": []})
+        children[chat_id] = node_id
+        node_id += 1
+        nodes.append({"node_id": node_id, "chat_id": chat_id, "parent_id": node_id - 1, "text": "Nieto", "parse_mode": "HTML", "buttons": []})
+
+    await db.db.groups.insert_many(groups)
+    await db.db.welcome_settings.insert_many(settings)
+    await db.db.stats.insert_many(stats)
+    await db.db.welcome_nodes.insert_many(nodes)
+    await db.db.counters.update_one({"_id": "welcome_node_id"}, {"$set": {"seq": node_id}})
+    await db.db.global_settings.insert_many([
+        {"setting_name": "default_parse_mode", "setting_value": "HTML"},
+        {"setting_name": "welcome_enabled", "setting_value": "1"},
+    ])
+    await db.db.premium_emojis.insert_many([
+        {"code": f"emoji{i}_premium", "emoji": "⭐", "emoji_id": str(5368324170671202286 + i)} for i in range(20)
+    ])
+
+    # 1234: activo, con ajustes, estadísticas y árbol; 1239: activo sin árbol; 1238: otro chat con árbol
+    chat_id = FIRST_CHAT_ID - 1234
+    middle = groups[GROUPS // 2]
+    return SimpleNamespace(
+        chat_id=chat_id,
+        root_id=roots[chat_id],
+        child_id=children[chat_id],
+        chat_without_tree=FIRST_CHAT_ID - 1239,
+        other_node_id=children[FIRST_CHAT_ID - 1238],
+        page_key=(middle["added_date"], middle["chat_id"]),
+    )
+
+
+async def _add_and_delete_node(db: DatabaseManager, s: SimpleNamespace):
+    node_id = await db.add_child_node(s.chat_id, s.root_id, "Temporal")
+    await db.delete_node_recursive(node_id)
+
+
+async def _flush_welcome_stats(db: DatabaseManager, s: SimpleNamespace):
+    await db.update_welcome_stats(s.chat_id, 3)
+    await db.stats_buffer.flush()
+
+
+SCENARIOS = [
+    Scenario("get_group_info", lambda db, s: db.get_group_info(s.chat_id)),
+    Scenario("get_group_welcome_thread", lambda db, s: db.get_group_welcome_thread(s.chat_id)),
+    Scenario("get_welcome_settings", lambda db, s: db.get_welcome_settings(s.chat_id)),
+    Scenario("get_group_stats", lambda db, s: db.get_group_stats(s.chat_id)),
+    Scenario("get_welcome_bundle", lambda db, s: db.get_welcome_bundle(s.chat_id)),
+    Scenario("get_root_node", lambda db, s: db.get_root_node(s.chat_id)),
+    Scenario("ensure_root_node (alta)", lambda db, s: db.ensure_root_node(s.chat_without_tree)),
+    Scenario("get_child_nodes", lambda db, s: db.get_child_nodes(s.chat_id, s.root_id)),
+    Scenario("get_node", lambda db, s: db.get_node(s.other_node_id)),
+    Scenario("update_node_text", lambda db, s: db.update_node_text(s.child_id, "Texto nuevo")),
+    Scenario("set_node_image_file_id", lambda db, s: db.set_node_image_file_id(s.child_id, "https://example.org/a.jpg", None)),
+    Scenario("add_child_node + delete_node_recursive", _add_and_delete_node),
+    Scenario("get_active_groups_page", lambda db, s: db.get_active_groups_page(GROUPS_PAGE_SIZE)),
+    Scenario("get_active_groups_page (siguiente)", lambda db, s: db.get_active_groups_page(GROUPS_PAGE_SIZE, after=s.page_key)),
+    Scenario("get_active_groups_page (anterior)", lambda db, s: db.get_active_groups_page(GROUPS_PAGE_SIZE, before=s.page_key)),
+    Scenario("get_all_active_groups", lambda db, s: db.get_all_active_groups()),
+    Scenario("get_active_groups_welcome_page", lambda db, s: db.get_active_groups_welcome_page(GROUPS_PAGE_SIZE)),
+    Scenario("get_active_groups_welcome_page (siguiente)", lambda db, s: db.get_active_groups_welcome_page(GROUPS_PAGE_SIZE, after=s.page_key)),
+    Scenario("get_active_groups_welcome_page (anterior)", lambda db, s: db.get_active_groups_welcome_page(GROUPS_PAGE_SIZE, before=s.page_key)),
+    Scenario("get_active_groups_welcome_status (todos)", lambda db, s: db.get_active_groups_welcome_status()),
+    Scenario("update_group_info", lambda db, s: db.update_group_info(s.chat_id, "Grupo renombrado", 42)),
+    Scenario("toggle_welcome_status", lambda db, s: db.toggle_welcome_status(s.chat_id)),
+    Scenario("update_welcome_stats + flush", _flush_welcome_stats),
+    Scenario("get_general_stats", lambda db, s: db.get_general_stats()),
+    Scenario("get_setting", lambda db, s: db.get_setting("default_parse_mode")),
+    Scenario("get_all_settings", lambda db, s: db.get_all_settings(), full_reads=("global_settings",)),
+    Scenario("get_premium_emojis", lambda db, s: db.get_premium_emojis(), full_reads=("premium_emojis",)),
+    # Reconciliador: totales sobre todas las filas, pero el $lookup del top debe ir por índice
+    Scenario("stats_rollup.rebuild", lambda db, s: db.stats_rollup.rebuild(), budget=None, full_reads=("stats",)),
+]
+
+
+def _walk(node: Any):
+    """Nodos del plan ejecutado (sin planes rechazados ni el comando de entrada)"""
+    if isinstance(node, dict):
+        yield node
+        for key, value in node.items():
+            if key not in _SKIP_KEYS:
+                yield from _walk(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+
+
+def analyze(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """COLLSCAN, $lookup sin índice, SORT en memoria, índices usados y examinados/devueltos"""
+    collscan = in_memory_sort = False
+    lookup_scans, indexes = set(), set()
+    for node in _walk(explain):
+        stage = node.get("stage")
+        if stage == "COLLSCAN":
+            collscan = True
+        elif stage == "SORT":
+            in_memory_sort = True
+        if node.get("indexName"):
+            indexes.add(node["indexName"])
+        indexes.update(node.get("indexesUsed") or ())
+        # $lookup clásico (collectionScans) o empujado al motor SBE (EQ_LOOKUP sin índice)
+        if node.get("collectionScans"):
+            lookup_scans.add(node.get("$lookup", {}).get("from", "?"))
+        if stage == "EQ_LOOKUP" and node.get("strategy") in ("NestedLoopJoin", "HashJoin"):
+            lookup_scans.add(str(node.get("foreignCollection", "?")).split(".", 1)[-1])
+
+    docs = keys = 0
+    stages = explain.get("stages")
+    if stages:
+        # Agregación con etapas fuera del motor de consultas: $cursor + una entrada por etapa
+        for entry in stages:
+            stats = entry["$cursor"].get("executionStats", {}) if "$cursor" in entry else entry
+            docs += stats.get("totalDocsExamined", 0)
+            keys += stats.get("totalKeysExamined", 0)
+        returned = stages[-1].get("nReturned", 0)
+    else:
+        stats = explain.get("executionStats", {})
+        docs, keys = stats.get("totalDocsExamined", 0), stats.get("totalKeysExamined", 0)
+        top = stats.get("executionStages", {})
+        # Escrituras: cuentan los documentos que casan, no los devueltos
+        returned = max(stats.get("nReturned", 0), top.get("nMatched", 0), top.get("nWouldDelete", 0))
+
+    return {
+        "collscan": collscan, "in_memory_sort": in_memory_sort, "lookup_scans": sorted(lookup_scans),
+        "indexes": sorted(indexes), "docs": docs, "keys": keys, "returned": returned,
+        "ratio": max(docs, keys) / max(returned, 1),
+    }
+
+
+def _explain_command(name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    cmd = {k: v for k, v in command.items() if k not in _DRIVER_FIELDS}
+    # explain solo admite una sentencia por update/delete; en un bulk todas tienen la misma forma
+    if name == "update":
+        cmd["updates"] = cmd["updates"][:1]
+    elif name == "delete":
+        cmd["deletes"] = cmd["deletes"][:1]
+    return {"explain": cmd, "verbosity": "executionStats"}
+
+
+def _filter_and_sort(name: str, command: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], bool]:
+    """Filtro, orden y si la consulta busca un único documento"""
+    if name == "aggregate":
+        match, sort, single = {}, {}, False
+        for stage in command.get("pipeline", []):
+            if "$match" in stage and not match:
+                match = stage["$match"]
+            elif "$sort" in stage and not sort:
+                sort = stage["$sort"]
+            elif "$limit" in stage:
+                single = stage["$limit"] == 1
+            else:
+                break
+        return match, sort, single
+    if name == "find":
+        return command.get("filter", {}), command.get("sort", {}), command.get("limit") == 1 or command.get("singleBatch", False)
+    if name == "findAndModify":
+        return command.get("query", {}), command.get("sort", {}), True
+    if name == "update":
+        return command["updates"][0].get("q", {}), {}, not command["updates"][0].get("multi", False)
+    if name == "delete":
+        return command["deletes"][0].get("q", {}), {}, command["deletes"][0].get("limit") == 1
+    return command.get("query", {}), {}, False
+
+
+def _classify(query: Dict[str, Any], equality: List[str], ranges: List[str], nulls: List[str]):
+    for key, value in query.items():
+        if key in ("$and", "$or", "$nor"):
+            for branch in value:
+                _classify(branch, equality, ranges, nulls)
+        elif key.startswith("$"):
+            continue
+        elif isinstance(value, dict) and any(k.startswith("$") for k in value):
+            (equality if set(value) <= {"$eq", "$in"} else ranges).append(key)
+        else:
+            equality.append(key)
+            if value is None:
+                nulls.append(key)
+
+
+def recommend_index(collection: str, name: str, command: Dict[str, Any]) -> Optional[Tuple[List[Tuple[str, int]], Dict[str, Any]]]:
+    """
+    Índice para el filtro según la regla igualdad-orden-rango. Si un campo se compara con
+    None en una búsqueda de un solo documento (el nodo raíz de un chat), índice parcial único
+    sobre el resto de campos de igualdad.
+    """
+    query, sort, single = _filter_and_sort(name, command)
+    equality, ranges, nulls = [], [], []
+    _classify(query, equality, ranges, nulls)
+    if nulls and single:
+        keys = [(f, 1) for f in dict.fromkeys(equality) if f not in nulls and f not in ranges]
+        if keys:
+            return keys, {"unique": True, "partialFilterExpression": {f: {"$type": "null"} for f in nulls}}
+    keys: Dict[str, int] = {}
+    for field in equality:
+        if field not in ranges and field not in sort:
+            keys.setdefault(field, 1)
+    for field, direction in sort.items():
+        keys.setdefault(field, direction)
+    for field in ranges:
+        keys.setdefault(field, 1)
+    return (list(keys.items()), {}) if keys else None
+
+
+def _lookup_indexes(command: Dict[str, Any], collections: List[str]) -> List[Tuple[str, List[Tuple[str, int]]]]:
+    """Índice sobre foreignField (o connectToField) de cada $lookup que recorre su colección"""
+    out = []
+    for stage in command.get("pipeline", []):
+        spec = stage.get("$lookup") or stage.get("$graphLookup")
+        if spec and spec.get("from") in collections:
+            field = spec.get("foreignField") or spec.get("connectToField")
+            if field:
+                out.append((spec["from"], [(field, 1)]))
+    return out
+
+
+def _format_index(collection: str, keys: List[Tuple[str, int]], options: Dict[str, Any]) -> str:
+    text = f"db.{collection}.create_index({keys!r}"
+    for key, value in options.items():
+        text += f", {key}={value!r}"
+    return text + ")"
+
+
+async def check(db: DatabaseManager, recorder: _CommandRecorder) -> int:
+    failures = 0
+    seen = set()
+    index_keys: Dict[str, List[List[Tuple[str, int]]]] = {}
+    for scenario, name, command in recorder.commands:
+        collection = command[name] if isinstance(command.get(name), str) else "?"
+        explain_command = _explain_command(name, command)
+        key = (scenario.name, json.dumps(query_shape(explain_command), default=str, sort_keys=True))
+        if key in seen:
+            continue
+        seen.add(key)
+
+        result = analyze(await db.db.command(explain_command))
+        # Problemas del filtro sobre la propia colección (los de $lookup se sugieren aparte)
+        problems = []
+        if result["collscan"] and collection not in scenario.full_reads:
+            problems.append("COLLSCAN")
+        if scenario.budget is not None:
+            if result["in_memory_sort"]:
+                problems.append("SORT en memoria")
+            if result["ratio"] > scenario.budget:
+                problems.append(f"examinados/devueltos {result['ratio']:.1f} > {scenario.budget:.1f}")
+        own_problems = bool(problems)
+        if result["lookup_scans"]:
+            problems.append(f"$lookup sin índice en {', '.join(result['lookup_scans'])}")
+
+        plan = ", ".join(result["indexes"]) or ("COLLSCAN" if result["collscan"] else "-")
+        print(
+            f"[{'FALLA' if problems else 'OK'}] {scenario.name}: {collection}.{name} [{plan}] "
+            f"docs {result['docs']}, claves {result['keys']}, devueltos {result['returned']}"
+        )
+        if not problems:
+            continue
+        failures += 1
+        print(f"    motivo: {'; '.join(problems)}")
+
+        suggestions = []
+        if own_problems:
+            recommended = recommend_index(collection, name, command)
+            if recommended:
+                suggestions.append((collection, *recommended))
+        for foreign, keys in _lookup_indexes(command, result["lookup_scans"]):
+            suggestions.append((foreign, keys, {}))
+        for target, keys, options in suggestions:
+            if target not in index_keys:
+                info = await db.db[target].index_information()
+                index_keys[target] = [[(f, int(d)) for f, d in spec["key"]] for spec in info.values()]
+            existing = index_keys[target]
+            # Un índice que empieza por las mismas claves ya sirve para la consulta
+            if not options and any(ix[:len(keys)] == keys for ix in existing):
+                print(f"    {target} ya tiene un índice que empieza por {keys!r}: revisar el filtro o el orden")
+            else:
+                print(f"    sugerencia: {_format_index(target, keys, options)}")
+                if options.get("partialFilterExpression"):
+                    fields = ", ".join(options["partialFilterExpression"])
+                    print(f"    (el filtro debe usar {{'$type': 'null'}} en {fields} para que el planificador lo elija)")
+    return failures
+
+
+async def run() -> int:
+    recorder = _CommandRecorder()
+    monitoring.register(recorder)
+    db = DatabaseManager(MONGO_URI, DB_NAME)
+    await db.client.drop_database(DB_NAME)
+    try:
+        await db.initialize_db()
+        s = await seed(db)
+        await db.stats_rollup.rebuild()
+        print(f"{GROUPS} grupos sembrados en {MONGO_URI}/{DB_NAME}\n")
+
+        for scenario in SCENARIOS:
+            recorder.scenario = scenario
+            try:
+                await scenario.run(db, s)
+            finally:
+                recorder.scenario = None
+
+        failures = await check(db, recorder)
+        print(f"\n{failures} comandos fuera de presupuesto" if failures else "\nTodos los planes usan índices dentro del presupuesto")
+        return 1 if failures else 0
+    finally:
+        await db.client.drop_database(DB_NAME)
+        db.client.close()
+
+
+def main():
+    sys.exit(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
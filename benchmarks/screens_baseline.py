@@ -0,0 +1,173 @@
+"""
+Textos originales de los handlers antes de extraerlos a StaticScreen,
+copiados literalmente. bench_screens los usa como referencia.
+"""
+
+BASELINE = {
+    "callbacks.ADMIN_PANEL_SCREEN": """
+:crown_premium: **Panel de Administración Principal** :crown_premium:
+
+:rocket_premium: Desde aquí puedes gestionar todos los aspectos del bot\.
+
+:star_premium: Selecciona una opción para continuar:
+
+:magic_premium: **¡Nuevo\!** Sistema completo de emojis premium integrado
+""",
+    "callbacks.NO_GROUPS_SCREEN": """
+:wow_premium: No hay grupos registrados aún\.
+
+:rocket_premium: Añade el bot a un grupo para comenzar\.
+""",
+    "callbacks.ADD_URL_BUTTON_SCREEN": """
+:plus_premium: **Añadir botón URL** :plus_premium:
+
+:rocket_premium: Envía el texto que tendrá el botón:
+""",
+    "callbacks.ADD_SUBMENU_SCREEN": """
+:gem_premium: **Añadir Submenú** :gem_premium:
+
+:star_premium: 1\\) Envía el texto del botón que abrirá el submenú\\.
+""",
+    "callbacks.NODE_IMAGE_SCREEN": """
+:magic_premium: **Configurar imagen del nodo** :magic_premium:
+
+:rocket_premium: Envía una URL de imagen o directamente una foto desde tu galería\\.
+
+:check_premium: Escribe 'remove' para quitar la imagen\\.
+""",
+    "callbacks.NODE_RENAME_SCREEN": """
+:star_premium: **Editar texto del nodo** :star_premium:
+
+:rocket_premium: Envía el nuevo texto \\(variables: {mention}, {name}, {username}, {group\\_name}\\):
+
+:magic_premium: **¡Puedes usar emojis premium\\!** Ejemplo: `:crown_premium:` `:fire_premium:`
+""",
+    "callbacks.WELCOME_EDIT_SCREEN": """
+:crown_premium: **Editar Mensaje de Bienvenida** :crown_premium:
+
+:rocket_premium: Envía el nuevo mensaje que se mostrará cuando alguien se una al grupo\\.
+
+:star_premium: **Puedes usar estas variables:**
+:check_premium: `{mention}` — menciona al usuario
+:check_premium: `{name}` — nombre del usuario  
+:check_premium: `{username}` — @usuario o nombre si no tiene
+:check_premium: `{group_name}` — nombre del grupo
+
+:magic_premium: **Emojis premium disponibles:**
+`:crown_premium:` `:fire_premium:` `:star_premium:` `:rocket_premium:` `:diamond_premium:`
+
+:gem_premium: **Formatos soportados:** HTML o MarkdownV2\\.
+:lightning_premium: **Sugerencia:** si usas MarkdownV2, recuerda escapar los caracteres especiales\\.
+""",
+    "callbacks.WELCOME_IMAGE_SCREEN": """
+:magic_premium: **Configurar Imagen de Bienvenida \\(Nodo raíz\\)** :magic_premium:
+
+:rocket_premium: Envía una URL de imagen, o directamente una **foto**\\.
+
+:check_premium: Escribe `remove` para quitarla\\.
+""",
+    "callbacks.NO_WELCOMES_SCREEN": """
+:wow_premium: No hay grupos con configuraciones de bienvenida\\.
+
+:rocket_premium: Añade el bot a un grupo para comenzar\\.
+""",
+    "callbacks.WELCOME_TOPIC_SCREEN": """
+:magic_premium: **Configurar tema \\(hilo\\) para bienvenidas** :magic_premium:
+
+:star_premium: **1\\)** En el grupo, abre el tema donde quieras que se envíen las bienvenidas\\.
+
+:rocket_premium: **2\\)** Dentro de ese tema, ejecuta el comando: `/setwelcometopic`
+
+:check_premium: **3\\)** Opcional: para limpiar la configuración, usa `/clearwelcometopic`
+
+:gem_premium: **Nota:** Solo es necesario si el grupo tiene temas habilitados\\.
+""",
+    "commands.START_ADMIN_SCREEN": """
+:crown_premium: **¡Hola Administrador\!** :crown_premium:
+
+:rocket_premium: Bienvenido al panel de control del bot\.
+
+:star_premium: Desde aquí puedes administrar todos los grupos y configuraciones\.
+
+:fire_premium: **¡Nuevo\!** Soporte completo para emojis premium de Telegram
+""",
+    "commands.START_USER_SCREEN": """
+:party_premium: ¡Hola! Soy un bot administrador de grupos premium :diamond_premium:
+
+:rocket_premium: Añádeme a tu grupo para comenzar a usar mis funciones avanzadas :magic_premium:
+""",
+    "commands.START_GROUP_SCREEN": """
+:crown_premium: ¡Hola! Soy tu nuevo bot administrador premium :fire_premium:
+
+:check_premium: Los administradores pueden configurarme usando /admin
+
+:star_premium: ¡Gracias por añadirme al grupo!
+""",
+    "commands.GROUP_ADMIN_PANEL_SCREEN": """
+:crown_premium: **Panel de Administración** :crown_premium:
+
+:rocket_premium: Selecciona una opción para configurar:
+
+:magic_premium: **¡Nuevo\!** Sistema de emojis premium disponible
+""",
+    "commands.PREMIUM_EMOJIS_SCREEN": """
+:crown_premium: **Emojis Premium Disponibles** :crown_premium:
+
+**Emojis de estado:**
+:crown_premium: Corona Premium \- `:crown_premium:`
+:crown_gold: Corona Dorada \- `:crown_gold:`
+:star_premium: Estrella Premium \- `:star_premium:`
+:diamond_premium: Diamante Premium \- `:diamond_premium:`
+:gem_premium: Gema Premium \- `:gem_premium:`
+
+**Emojis de acción:**
+:fire_premium: Fuego Premium \- `:fire_premium:`
+:rocket_premium: Cohete Premium \- `:rocket_premium:`
+:lightning_premium: Rayo Premium \- `:lightning_premium:`
+:magic_premium: Magia Premium \- `:magic_premium:`
+:check_premium: Check Premium \- `:check_premium:`
+
+**Emojis de celebración:**
+:party_premium: Fiesta Premium \- `:party_premium:`
+:trophy_premium: Trofeo Premium \- `:trophy_premium:`
+:heart_premium: Corazón Premium \- `:heart_premium:`
+
+**Emojis de números:**
+:five_premium: Cinco Premium \- `:five_premium:`
+:zero_premium: Cero Premium \- `:zero_premium:`
+:plus_premium: Plus Premium \- `:plus_premium:`
+
+**Emojis diversos:**
+:cocktail_premium: Cóctel Premium \- `:cocktail_premium:`
+:globe_premium: Globo Premium \- `:globe_premium:`
+:free_premium: Gratis Premium \- `:free_premium:`
+:down_arrow_premium: Flecha Abajo \- `:down_arrow_premium:`
+:point_left_premium: Señalar Izq\. \- `:point_left_premium:`
+:tongue_premium: Lengua Premium \- `:tongue_premium:`
+:wow_premium: Sorpresa Premium \- `:wow_premium:`
+
+**Ejemplo de uso en mensajes:**
+¡Bienvenido :crown_premium: {mention} al grupo :fire_premium: {group_name}! :star_premium: Disfruta tu estancia :rocket_premium:
+
+
+:magic_premium: **Los emojis premium solo se muestran en MarkdownV2\!**
+""",
+    "commands.CLEAR_TOPIC_SCREEN": ":check_premium: Se ha limpiado la configuración del tema de bienvenida\\.",
+    "messages.BOT_ADDED_SCREEN": """
+:crown_premium: ¡Hola! Soy tu nuevo bot administrador premium :rocket_premium:
+
+:star_premium: Los administradores pueden configurarme usando /admin
+
+:party_premium: ¡Gracias por añadirme al grupo!
+""",
+    "messages.WELCOME_UPDATED_SCREEN": """
+:check_premium: **Mensaje de bienvenida actualizado\\.**
+
+:star_premium: ¿Deseas añadir botones?
+""",
+    "messages.SUBMENU_CREATED_SCREEN": """
+:check_premium: **Submenú creado\\.**
+
+:star_premium: ¿Deseas añadir botones dentro de este submenú?
+""",
+}
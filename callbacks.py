@@ -1,23 +1,133 @@
-import json
 from datetime import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
 
-from helpers import check_admin_permissions, truncate_text, format_date, format_welcome_message, add_premium_emojis
+from config import GROUPS_PAGE_SIZE, DB_PROFILE_TOP_N
+from mongo_profiler import mongo_profiler
+from helpers import check_admin_permissions, truncate_text, format_date, format_welcome_message, add_premium_emojis, _escape_md_v2
+from screens import StaticScreen
+from scheduler import PRIORITY_NAVIGATION, PRIORITY_ADMIN
+from templates import render_node_text
+from keyboards import buttons_to_list, get_node_keyboard
+from router import CallbackRouter
+
+
+# Pantallas estáticas: se renderizan una vez (ver screens.py)
+ADMIN_PANEL_SCREEN = StaticScreen("""
+:crown_premium: **Panel de Administración Principal** :crown_premium:
+
+:rocket_premium: Desde aquí puedes gestionar todos los aspectos del bot\.
+
+:star_premium: Selecciona una opción para continuar:
+
+:magic_premium: **¡Nuevo\!** Sistema completo de emojis premium integrado
+""", [
+    [("📊 Ver Grupos", "view_groups")],
+    [("🎉 Gestionar Bienvenidas", "manage_welcomes")],
+    [("⚙️ Configuraciones Globales", "global_settings")],
+    [("📈 Estadísticas Generales", "general_stats")],
+    [("ℹ️ Información del Bot", "bot_info")]
+])
+
+NO_GROUPS_SCREEN = StaticScreen("""
+:wow_premium: No hay grupos registrados aún\.
+
+:rocket_premium: Añade el bot a un grupo para comenzar\.
+""", [[("🔙 Volver", "admin_panel")]])
+
+ADD_URL_BUTTON_SCREEN = StaticScreen("""
+:plus_premium: **Añadir botón URL** :plus_premium:
+
+:rocket_premium: Envía el texto que tendrá el botón:
+""")
+
+ADD_SUBMENU_SCREEN = StaticScreen("""
+:gem_premium: **Añadir Submenú** :gem_premium:
+
+:star_premium: 1\\) Envía el texto del botón que abrirá el submenú\\.
+""")
+
+NODE_IMAGE_SCREEN = StaticScreen("""
+:magic_premium: **Configurar imagen del nodo** :magic_premium:
+
+:rocket_premium: Envía una URL de imagen o directamente una foto desde tu galería\\.
+
+:check_premium: Escribe 'remove' para quitar la imagen\\.
+""")
+
+NODE_RENAME_SCREEN = StaticScreen("""
+:star_premium: **Editar texto del nodo** :star_premium:
+
+:rocket_premium: Envía el nuevo texto \\(variables: {mention}, {name}, {username}, {group\\_name}\\):
+
+:magic_premium: **¡Puedes usar emojis premium\\!** Ejemplo: `:crown_premium:` `:fire_premium:`
+""")
+
+WELCOME_EDIT_SCREEN = StaticScreen("""
+:crown_premium: **Editar Mensaje de Bienvenida** :crown_premium:
+
+:rocket_premium: Envía el nuevo mensaje que se mostrará cuando alguien se una al grupo\\.
+
+:star_premium: **Puedes usar estas variables:**
+:check_premium: `{mention}` — menciona al usuario
+:check_premium: `{name}` — nombre del usuario  
+:check_premium: `{username}` — @usuario o nombre si no tiene
+:check_premium: `{group_name}` — nombre del grupo
+
+:magic_premium: **Emojis premium disponibles:**
+`:crown_premium:` `:fire_premium:` `:star_premium:` `:rocket_premium:` `:diamond_premium:`
+
+:gem_premium: **Formatos soportados:** HTML o MarkdownV2\\.
+:lightning_premium: **Sugerencia:** si usas MarkdownV2, recuerda escapar los caracteres especiales\\.
+""")
+
+WELCOME_IMAGE_SCREEN = StaticScreen("""
+:magic_premium: **Configurar Imagen de Bienvenida \\(Nodo raíz\\)** :magic_premium:
+
+:rocket_premium: Envía una URL de imagen, o directamente una **foto**\\.
+
+:check_premium: Escribe `remove` para quitarla\\.
+""")
+
+NO_WELCOMES_SCREEN = StaticScreen("""
+:wow_premium: No hay grupos con configuraciones de bienvenida\\.
+
+:rocket_premium: Añade el bot a un grupo para comenzar\\.
+""", [[("🔙 Volver", "admin_panel")]])
+
+WELCOME_TOPIC_SCREEN = StaticScreen("""
+:magic_premium: **Configurar tema \\(hilo\\) para bienvenidas** :magic_premium:
+
+:star_premium: **1\\)** En el grupo, abre el tema donde quieras que se envíen las bienvenidas\\.
+
+:rocket_premium: **2\\)** Dentro de ese tema, ejecuta el comando: `/setwelcometopic`
+
+:check_premium: **3\\)** Opcional: para limpiar la configuración, usa `/clearwelcometopic`
+
+:gem_premium: **Nota:** Solo es necesario si el grupo tiene temas habilitados\\.
+""")
 
 
 class CallbackHandlers:
-    def __init__(self, db_manager, message_handler):
+    def __init__(self, db_manager, message_handler, scheduler=None):
         self.db = db_manager
         self.message_handler = message_handler
+        # Por defecto comparte el planificador de MessageHandlers para respetar los mismos límites
+        self.scheduler = scheduler or message_handler.scheduler
+        self.router = self._build_router()
 
     def _is_public_callback(self, data: str) -> bool:
         return data.startswith("wb_") or data.startswith("wb_home_")
 
-    async def safe_edit_message_text(self, query, text: str, reply_markup=None, parse_mode=None):
+    @staticmethod
+    def _query_chat_id(query):
+        # Chat del mensaje del callback, para el límite por grupo del planificador (None en mensajes inline)
+        return query.message.chat.id if query.message else None
+
+    async def safe_edit_message_text(self, query, text: str, reply_markup=None, parse_mode=None, priority: int = PRIORITY_ADMIN):
         try:
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            await self.scheduler.call(priority, query.edit_message_text, text, reply_markup=reply_markup, parse_mode=parse_mode, chat_id_hint=self._query_chat_id(query))
         except BadRequest as e:
             msg = str(e).lower()
             if "message is not modified" in msg:
@@ -28,15 +138,15 @@ class CallbackHandlers:
             else:
                 if "can't parse entities" in msg:
                     try:
-                        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=None)
+                        await self.scheduler.call(priority, query.edit_message_text, text, reply_markup=reply_markup, parse_mode=None, chat_id_hint=self._query_chat_id(query))
                         return
                     except:
                         pass
                 raise
 
-    async def safe_edit_message_caption(self, query, caption: str, reply_markup=None, parse_mode=None):
+    async def safe_edit_message_caption(self, query, caption: str, reply_markup=None, parse_mode=None, priority: int = PRIORITY_ADMIN):
         try:
-            await query.edit_message_caption(caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+            await self.scheduler.call(priority, query.edit_message_caption, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode, chat_id_hint=self._query_chat_id(query))
         except BadRequest as e:
             msg = str(e).lower()
             if "message is not modified" in msg:
@@ -47,7 +157,7 @@ class CallbackHandlers:
             else:
                 if "can't parse entities" in msg:
                     try:
-                        await query.edit_message_caption(caption=caption, reply_markup=reply_markup, parse_mode=None)
+                        await self.scheduler.call(priority, query.edit_message_caption, caption=caption, reply_markup=reply_markup, parse_mode=None, chat_id_hint=self._query_chat_id(query))
                         return
                     except:
                         pass
@@ -60,235 +170,174 @@ class CallbackHandlers:
             return "MarkdownV2"
         return "HTML" if pm.upper() == "HTML" else pm
 
-    def _buttons_to_list(self, buttons):
-        """
-        Normaliza el campo 'buttons' para que siempre sea una lista de listas.
-        Acepta: None, str (JSON), list. Cualquier otro tipo → [].
-        """
-        if not buttons:
-            return []
-        if isinstance(buttons, str):
-            try:
-                parsed = json.loads(buttons)
-                return parsed if isinstance(parsed, list) else []
-            except Exception:
-                return []
-        if isinstance(buttons, list):
-            return buttons
-        return []
-
     async def handle_callback_query(self, update, context):
         query = update.callback_query
         await query.answer()
         data = query.data
         user_id = query.from_user.id
 
+        route, kwargs = self.router.resolve(data)
+
         # Permisos para callbacks no públicos
-        if not self._is_public_callback(data):
+        public = route.public if route else self._is_public_callback(data)
+        if not public:
             if not check_admin_permissions(user_id, data):
                 await self.safe_edit_message_text(query, "❌ No tienes permisos para realizar esta acción.")
                 return
 
-        # Navegación pública submenús (modo "libro")
-        if data.startswith("wb_home_"):
-            chat_id = int(data.split("_")[-1])
-            node = await self.db.get_root_node(chat_id)
-            await self.show_node_content(query, node, book_mode=True)
-            return
-        if data.startswith("wb_") and data[3:].isdigit():
-            node_id = int(data.split("_")[1])
-            node = await self.db.get_node(node_id)
-            if node:
-                await self.show_node_content(query, node, book_mode=True)
-            else:
-                await query.answer("Contenido no disponible", show_alert=True)
+        if route is None:
+            self.router.unmatched += 1
             return
+        await self.router.dispatch(route, query, **kwargs)
+
+    def _build_router(self) -> CallbackRouter:
+        router = CallbackRouter()
+        add = router.add
+
+        # Navegación pública submenús (modo "libro")
+        add("wb_home_{chat_id:int}", self.show_root_content, public=True)
+        add("wb_{node_id:int}", self.show_node_by_id, public=True)
 
         # Routing admin
-        if data == "admin_panel":
-            await self.show_admin_panel(query)
-        elif data == "view_groups":
-            await self.show_groups_list(query)
-        elif data == "bot_info":
-            await self.show_bot_info(query)
-        elif data == "manage_welcomes":
-            await self.show_manage_welcomes(query)
-        elif data == "global_settings":
-            await self.show_global_settings(query)
-        elif data == "general_stats":
-            await self.show_general_stats(query)
-        elif data.startswith("config_welcome_"):
-            chat_id = int(data.split("_")[-1])
-            await self.show_welcome_config(query, chat_id)
-        elif data.startswith("group_settings_"):
-            chat_id = int(data.split("_")[-1])
-            await self.show_group_settings(query, chat_id)
-        elif data.startswith("group_stats_"):
-            chat_id = int(data.split("_")[-1])
-            await self.show_group_stats(query, chat_id)
-        elif data.startswith("config_group_"):
-            chat_id = int(data.split("_")[-1])
-            await self.show_group_config(query, chat_id)
+        add("admin_panel", self.show_admin_panel)
+        add("view_groups", self.show_groups_list)
+        add("groups_next_{added_date}_{chat_id:int}", self.show_groups_next)
+        add("groups_prev_{added_date}_{chat_id:int}", self.show_groups_prev)
+        add("bot_info", self.show_bot_info)
+        add("db_profile", self.show_db_profile)
+        add("manage_welcomes", self.show_manage_welcomes)
+        add("welcomes_next_{added_date}_{chat_id:int}", self.show_manage_welcomes_next)
+        add("welcomes_prev_{added_date}_{chat_id:int}", self.show_manage_welcomes_prev)
+        add("global_settings", self.show_global_settings)
+        add("general_stats", self.show_general_stats)
+        add("config_welcome_{chat_id:int}", self.show_welcome_config)
+        add("group_settings_{chat_id:int}", self.show_group_settings)
+        add("group_stats_{chat_id:int}", self.show_group_stats)
+        add("config_group_{chat_id:int}", self.show_group_config)
 
         # Gestor avanzado
-        elif data.startswith("edit_welcome_buttons_"):
-            chat_id = int(data.split("_")[-1])
-            await self.show_node_manager(query, chat_id, None)
-        elif data.startswith("node_mgr_"):
-            parts = data.split("_")
-            # node_mgr_{chat_id}_{node_id}
-            node_id = int(parts[-1])
-            chat_id = int(parts[-2])
-            await self.show_node_manager(query, chat_id, node_id)
-        elif data.startswith("node_add_url_"):
-            node_id = int(data.split("_")[-1])
-            await self.start_add_url_button(query, node_id)
-        elif data.startswith("node_add_sub_"):
-            node_id = int(data.split("_")[-1])
-            await self.start_add_submenu_button(query, node_id)
-        elif data.startswith("node_clear_btns_"):
-            node_id = int(data.split("_")[-1])
-            await self.db.clear_node_buttons(node_id)
-            await query.answer("✅ Botones limpiados")
-            node = await self.db.get_node(node_id)
-            await self.show_node_manager(query, node['chat_id'], node_id)
-        elif data.startswith("node_set_image_"):
-            node_id = int(data.split("_")[-1])
-            await self.start_node_image_edit(query, node_id)
-        elif data.startswith("node_rename_"):
-            node_id = int(data.split("_")[-1])
-            await self.start_node_rename(query, node_id)
-        elif data.startswith("node_list_children_"):
-            parts = data.split("_")
-            # node_list_children_{chat_id}_{node_id}
-            node_id = int(parts[-1])
-            chat_id = int(parts[-2])
-            await self.show_children_list(query, chat_id, node_id)
-        elif data.startswith("node_del_"):
-            node_id = int(data.split("_")[-1])
-            node = await self.db.get_node(node_id)
-            if not node:
-                await query.answer("Nodo no encontrado", show_alert=True)
-            else:
-                parent_id = node['parent_id']
-                chat_id = node['chat_id']
-                await self.db.delete_node_recursive(node_id)
-                await query.answer("🗑️ Submenú eliminado")
-                if parent_id:
-                    await self.show_node_manager(query, chat_id, parent_id)
-                else:
-                    await self.show_node_manager(query, chat_id, None)
+        add("edit_welcome_buttons_{chat_id:int}", self.show_node_manager)
+        add("node_mgr_{chat_id:int}_{node_id:int}", self.show_node_manager)
+        add("node_add_url_{node_id:int}", self.start_add_url_button)
+        add("node_add_sub_{node_id:int}", self.start_add_submenu_button)
+        add("node_clear_btns_{node_id:int}", self.clear_node_buttons)
+        add("node_set_image_{node_id:int}", self.start_node_image_edit)
+        add("node_rename_{node_id:int}", self.start_node_rename)
+        add("node_list_children_{chat_id:int}_{node_id:int}", self.show_children_list)
+        add("node_del_{node_id:int}", self.delete_node)
 
         # Bienvenida
-        elif data.startswith("edit_welcome_message_"):
-            chat_id = int(data.split("_")[-1])
-            await self.start_welcome_message_edit(query, chat_id)
-        elif data.startswith("edit_welcome_image_"):
-            chat_id = int(data.split("_")[-1])
-            await self.start_welcome_image_edit(query, chat_id)
-        elif data.startswith("toggle_welcome_"):
-            chat_id = int(data.split("_")[-1])
-            await self.toggle_welcome_status(query, chat_id)
-        elif data.startswith("test_welcome_"):
-            chat_id = int(data.split("_")[-1])
-            await self.test_welcome_message(query, chat_id)
+        add("edit_welcome_message_{chat_id:int}", self.start_welcome_message_edit)
+        add("edit_welcome_image_{chat_id:int}", self.start_welcome_image_edit)
+        add("toggle_welcome_{chat_id:int}", self.toggle_welcome_status)
+        add("test_welcome_{chat_id:int}", self.test_welcome_message)
 
         # Grupos
-        elif data.startswith("update_group_"):
-            chat_id = int(data.split("_")[-1])
-            await self.update_group_info(query, chat_id)
-        elif data.startswith("deactivate_group_"):
-            chat_id = int(data.split("_")[-1])
-            await self.deactivate_group(query, chat_id)
-        elif data.startswith("refresh_stats_"):
-            chat_id = int(data.split("_")[-1])
-            await self.refresh_group_stats(query, chat_id)
+        add("update_group_{chat_id:int}", self.update_group_info)
+        add("deactivate_group_{chat_id:int}", self.deactivate_group)
+        add("refresh_stats_{chat_id:int}", self.refresh_group_stats)
 
         # Global settings
-        elif data.startswith("gs_lang_"):
-            lang = data.split("_")[-1]
-            await self.db.set_setting('language', lang)
-            await query.answer("Idioma actualizado")
-            await self.show_global_settings(query)
-        elif data.startswith("gs_datefmt_"):
-            code = data.split("_")[-1]
-            mapping = {
-                '1': '%d/%m/%Y %H:%M',
-                '2': '%Y-%m-%d %H:%M',
-                '3': '%d/%m/%Y',
-            }
-            fmt = mapping.get(code, '%d/%m/%Y %H:%M')
-            await self.db.set_setting('date_format', fmt)
-            await query.answer("Formato de fecha actualizado")
-            await self.show_global_settings(query)
-        elif data.startswith("gs_parse_"):
-            mode = data.split("_")[-1]
-            if mode.lower().startswith("markdown"):
-                mode = "MarkdownV2"
-            await self.db.set_setting('default_parse_mode', mode)
-            await query.answer("Parse mode por defecto actualizado")
-            await self.show_global_settings(query)
+        add("gs_lang_{lang}", self.set_global_language)
+        add("gs_datefmt_{code}", self.set_global_date_format)
+        add("gs_parse_{mode}", self.set_global_parse_mode)
 
         # Parse mode del nodo
-        elif data.startswith("node_parse_"):
-            node_id = int(data.split("_")[-1])
-            await self.show_parse_mode_selector(query, node_id)
-        elif data.startswith("node_set_parse_"):
-            parts = data.split("_")
-            # node_set_parse_{node_id}_{mode}
-            node_id = int(parts[-2])
-            mode = parts[-1]
-            if mode.lower().startswith("markdown"):
-                mode = "MarkdownV2"
-            await self.db.update_node_parse_mode(node_id, mode)
-            await query.answer("✅ Parse mode actualizado")
-            node = await self.db.get_node(node_id)
-            await self.show_node_manager(query, node['chat_id'], node_id)
+        add("node_parse_{node_id:int}", self.show_parse_mode_selector)
+        add("node_set_parse_{node_id:int}_{mode}", self.set_node_parse_mode)
 
         # Temas (forums)
-        elif data.startswith("set_welcome_topic_instr_"):
-            chat_id = int(data.split("_")[-1])
-            await self.show_set_welcome_topic_instructions(query, chat_id)
-        elif data.startswith("clear_welcome_topic_"):
-            chat_id = int(data.split("_")[-1])
-            await self.db.clear_group_welcome_thread(chat_id)
-            await query.answer("✅ Tema de bienvenida limpiado")
-            await self.show_group_settings(query, chat_id)
+        add("set_welcome_topic_instr_{chat_id:int}", self.show_set_welcome_topic_instructions)
+        add("clear_welcome_topic_{chat_id:int}", self.clear_welcome_topic)
+
+        # Volver
+        add("back_admin", self.show_admin_panel)
+        add("back_groups", self.show_groups_list)
+        add("back_welcome_{chat_id:int}", self.show_welcome_config)
+        add("back_group_{chat_id:int}", self.show_group_settings)
+        return router
+
+    # Acciones simples enlazadas desde el router
+    async def show_root_content(self, query, chat_id: int):
+        node = await self.db.get_root_node(chat_id)
+        await self.show_node_content(query, node, book_mode=True)
+
+    async def show_node_by_id(self, query, node_id: int):
+        node = await self.db.get_node(node_id)
+        if node:
+            await self.show_node_content(query, node, book_mode=True)
+        else:
+            await query.answer("Contenido no disponible", show_alert=True)
+
+    async def show_groups_next(self, query, added_date: str, chat_id: int):
+        await self.show_groups_list(query, after=(added_date, chat_id))
+
+    async def show_groups_prev(self, query, added_date: str, chat_id: int):
+        await self.show_groups_list(query, before=(added_date, chat_id))
+
+    async def clear_node_buttons(self, query, node_id: int):
+        await self.db.clear_node_buttons(node_id)
+        await query.answer("✅ Botones limpiados")
+        node = await self.db.get_node(node_id)
+        await self.show_node_manager(query, node['chat_id'], node_id)
+
+    async def delete_node(self, query, node_id: int):
+        node = await self.db.get_node(node_id)
+        if not node:
+            await query.answer("Nodo no encontrado", show_alert=True)
+            return
+        parent_id = node['parent_id']
+        chat_id = node['chat_id']
+        await self.db.delete_node_recursive(node_id)
+        await query.answer("🗑️ Submenú eliminado")
+        if parent_id:
+            await self.show_node_manager(query, chat_id, parent_id)
+        else:
+            await self.show_node_manager(query, chat_id, None)
+
+    async def set_global_language(self, query, lang: str):
+        await self.db.set_setting('language', lang)
+        await query.answer("Idioma actualizado")
+        await self.show_global_settings(query)
+
+    async def set_global_date_format(self, query, code: str):
+        mapping = {
+            '1': '%d/%m/%Y %H:%M',
+            '2': '%Y-%m-%d %H:%M',
+            '3': '%d/%m/%Y',
+        }
+        fmt = mapping.get(code, '%d/%m/%Y %H:%M')
+        await self.db.set_setting('date_format', fmt)
+        await query.answer("Formato de fecha actualizado")
+        await self.show_global_settings(query)
+
+    async def set_global_parse_mode(self, query, mode: str):
+        if mode.lower().startswith("markdown"):
+            mode = "MarkdownV2"
+        await self.db.set_setting('default_parse_mode', mode)
+        await query.answer("Parse mode por defecto actualizado")
+        await self.show_global_settings(query)
+
+    async def set_node_parse_mode(self, query, node_id: int, mode: str):
+        if mode.lower().startswith("markdown"):
+            mode = "MarkdownV2"
+        await self.db.update_node_parse_mode(node_id, mode)
+        await query.answer("✅ Parse mode actualizado")
+        node = await self.db.get_node(node_id)
+        await self.show_node_manager(query, node['chat_id'], node_id)
 
-        elif data.startswith("back_"):
-            await self.handle_back_navigation(query, data)
-
-    def build_node_keyboard(self, node: dict):
-        rows = []
-        buttons = self._buttons_to_list(node.get('buttons'))
-
-        for row in buttons:
-            rb = []
-            for b in row:
-                if b.get('type') == 'url' and b.get('url'):
-                    rb.append(InlineKeyboardButton(b.get('text', 'Abrir'), url=b['url']))
-                elif b.get('type') == 'node' and b.get('node_id'):
-                    rb.append(InlineKeyboardButton(b.get('text', 'Ver'), callback_data=f"wb_{b['node_id']}"))
-            if rb:
-                rows.append(rb)
-
-        if node.get('parent_id'):
-            rows.append([
-                InlineKeyboardButton("◀️ Atrás", callback_data=f"wb_{node['parent_id']}"),
-                InlineKeyboardButton("🏠 Inicio", callback_data=f"wb_home_{node['chat_id']}")
-            ])
-        elif rows:
-            rows.append([InlineKeyboardButton("🏠 Inicio", callback_data=f"wb_home_{node['chat_id']}")])
-
-        return InlineKeyboardMarkup(rows) if rows else None
+    async def clear_welcome_topic(self, query, chat_id: int):
+        await self.db.clear_group_welcome_thread(chat_id)
+        await query.answer("✅ Tema de bienvenida limpiado")
+        await self.show_group_settings(query, chat_id)
 
     async def show_node_content(self, query, node: dict, book_mode: bool = True):
         try:
             group_info = await self.db.get_group_info(node['chat_id'])
             group_name = group_info[1] if group_info else (query.message.chat.title if query.message and query.message.chat else "el grupo")
             pmode = self._normalize_parse_mode(node.get('parse_mode') or "HTML")
-            text = format_welcome_message(node['text'] or "", query.from_user, group_name, parse_mode=pmode)
-            km = self.build_node_keyboard(node)
+            text = render_node_text(node, query.from_user, group_name, pmode)
+            km = get_node_keyboard(node)
 
             # Para mensajes nuevos (no modo libro), usar el chat donde se hizo la consulta
             if not book_mode:
@@ -298,16 +347,17 @@ class CallbackHandlers:
                 
                 try:
                     if node.get('image_url'):
-                        await query.bot.send_photo(
+                        await self.message_handler.send_node_photo(
+                            PRIORITY_NAVIGATION, query.bot, node,
                             chat_id=send_chat_id, 
-                            photo=node['image_url'], 
                             caption=text, 
                             reply_markup=km, 
                             parse_mode=pmode, 
                             message_thread_id=message_thread_id
                         )
                     else:
-                        await query.bot.send_message(
+                        await self.scheduler.call(
+                            PRIORITY_NAVIGATION, query.bot.send_message,
                             chat_id=send_chat_id, 
                             text=text, 
                             reply_markup=km, 
@@ -318,16 +368,17 @@ class CallbackHandlers:
                     if "can't parse entities" in str(e).lower():
                         safe_text = format_welcome_message(node['text'] or "", query.from_user, group_name, parse_mode=None)
                         if node.get('image_url'):
-                            await query.bot.send_photo(
+                            await self.message_handler.send_node_photo(
+                                PRIORITY_NAVIGATION, query.bot, node,
                                 chat_id=send_chat_id, 
-                                photo=node['image_url'], 
                                 caption=safe_text, 
                                 reply_markup=km, 
                                 parse_mode=None, 
                                 message_thread_id=message_thread_id
                             )
                         else:
-                            await query.bot.send_message(
+                            await self.scheduler.call(
+                                PRIORITY_NAVIGATION, query.bot.send_message,
                                 chat_id=send_chat_id, 
                                 text=safe_text, 
                                 reply_markup=km, 
@@ -350,13 +401,13 @@ class CallbackHandlers:
             if has_image:
                 if is_message_photo:
                     # Editar caption de la foto existente
-                    await self.safe_edit_message_caption(query, text, reply_markup=km, parse_mode=pmode)
+                    await self.safe_edit_message_caption(query, text, reply_markup=km, parse_mode=pmode, priority=PRIORITY_NAVIGATION)
                 else:
                     # Enviar nueva foto manteniendo el contexto
                     try:
-                        await query.bot.send_photo(
+                        await self.message_handler.send_node_photo(
+                            PRIORITY_NAVIGATION, query.bot, node,
                             chat_id=current_chat_id, 
-                            photo=node['image_url'], 
                             caption=text, 
                             reply_markup=km, 
                             parse_mode=pmode, 
@@ -365,9 +416,9 @@ class CallbackHandlers:
                     except BadRequest as e:
                         if "can't parse entities" in str(e).lower():
                             safe_text = format_welcome_message(node['text'] or "", query.from_user, group_name, parse_mode=None)
-                            await query.bot.send_photo(
+                            await self.message_handler.send_node_photo(
+                                PRIORITY_NAVIGATION, query.bot, node,
                                 chat_id=current_chat_id, 
-                                photo=node['image_url'], 
                                 caption=safe_text, 
                                 reply_markup=km, 
                                 parse_mode=None, 
@@ -379,7 +430,8 @@ class CallbackHandlers:
                 if is_message_photo:
                     # Enviar texto como nuevo mensaje manteniendo el contexto
                     try:
-                        await query.bot.send_message(
+                        await self.scheduler.call(
+                            PRIORITY_NAVIGATION, query.bot.send_message,
                             chat_id=current_chat_id, 
                             text=text, 
                             reply_markup=km, 
@@ -389,7 +441,8 @@ class CallbackHandlers:
                     except BadRequest as e:
                         if "can't parse entities" in str(e).lower():
                             safe_text = format_welcome_message(node['text'] or "", query.from_user, group_name, parse_mode=None)
-                            await query.bot.send_message(
+                            await self.scheduler.call(
+                                PRIORITY_NAVIGATION, query.bot.send_message,
                                 chat_id=current_chat_id, 
                                 text=safe_text, 
                                 reply_markup=km, 
@@ -400,7 +453,7 @@ class CallbackHandlers:
                             raise
                 else:
                     # Editar texto existente
-                    await self.safe_edit_message_text(query, text, reply_markup=km, parse_mode=pmode)
+                    await self.safe_edit_message_text(query, text, reply_markup=km, parse_mode=pmode, priority=PRIORITY_NAVIGATION)
 
         except Exception as e:
             try:
@@ -410,7 +463,6 @@ class CallbackHandlers:
 
     async def test_welcome_message(self, query, chat_id: int):
         # Enviar vista previa al administrador - CORREGIDO para funcionar siempre
-        await self.db.ensure_root_node(chat_id)
         root = await self.db.get_root_node(chat_id)
         if not root:
             await query.answer("❌ No hay configuración de bienvenida")
@@ -419,7 +471,8 @@ class CallbackHandlers:
         try:
             # Intentar crear conversación privada con el admin primero
             try:
-                await query.bot.send_message(
+                await self.scheduler.call(
+                    PRIORITY_ADMIN, query.bot.send_message,
                     chat_id=query.from_user.id,
                     text="🔍 Preparando vista previa..."
                 )
@@ -431,8 +484,8 @@ class CallbackHandlers:
             pmode = self._normalize_parse_mode(root.get('parse_mode') or "HTML")
             group = await self.db.get_group_info(chat_id)
             group_name = group[1] if group else "el grupo"
-            text = format_welcome_message(root['text'] or "", query.from_user, group_name, parse_mode=pmode)
-            km = self.build_node_keyboard(root)
+            text = render_node_text(root, query.from_user, group_name, pmode)
+            km = get_node_keyboard(root)
 
             # Enviar al chat privado con el administrador
             admin_chat_id = query.from_user.id
@@ -446,15 +499,16 @@ class CallbackHandlers:
 
             try:
                 if root.get('image_url'):
-                    await query.bot.send_photo(
+                    await self.message_handler.send_node_photo(
+                        PRIORITY_ADMIN, query.bot, root,
                         chat_id=admin_chat_id, 
-                        photo=root['image_url'], 
                         caption=preview_text, 
                         reply_markup=km, 
                         parse_mode=pmode
                     )
                 else:
-                    await query.bot.send_message(
+                    await self.scheduler.call(
+                        PRIORITY_ADMIN, query.bot.send_message,
                         chat_id=admin_chat_id, 
                         text=preview_text, 
                         reply_markup=km, 
@@ -467,15 +521,16 @@ class CallbackHandlers:
                     safe_preview = f"🧪 Vista previa de bienvenida para: {group_name}\n\n{safe_message}"
                     try:
                         if root.get('image_url'):
-                            await query.bot.send_photo(
+                            await self.message_handler.send_node_photo(
+                                PRIORITY_ADMIN, query.bot, root,
                                 chat_id=admin_chat_id, 
-                                photo=root['image_url'], 
                                 caption=safe_preview, 
                                 reply_markup=km, 
                                 parse_mode=None
                             )
                         else:
-                            await query.bot.send_message(
+                            await self.scheduler.call(
+                                PRIORITY_ADMIN, query.bot.send_message,
                                 chat_id=admin_chat_id, 
                                 text=safe_preview, 
                                 reply_markup=km, 
@@ -490,44 +545,21 @@ class CallbackHandlers:
             await query.answer(f"❌ Error enviando vista previa: {e}", show_alert=True)
 
     async def show_admin_panel(self, query):
-        keyboard = [
-            [InlineKeyboardButton("📊 Ver Grupos", callback_data="view_groups")],
-            [InlineKeyboardButton("🎉 Gestionar Bienvenidas", callback_data="manage_welcomes")],
-            [InlineKeyboardButton("⚙️ Configuraciones Globales", callback_data="global_settings")],
-            [InlineKeyboardButton("📈 Estadísticas Generales", callback_data="general_stats")],
-            [InlineKeyboardButton("ℹ️ Información del Bot", callback_data="bot_info")]
-        ]
-        
-        admin_text = """
-:crown_premium: **Panel de Administración Principal** :crown_premium:
-
-:rocket_premium: Desde aquí puedes gestionar todos los aspectos del bot\.
-
-:star_premium: Selecciona una opción para continuar:
-
-:magic_premium: **¡Nuevo\!** Sistema completo de emojis premium integrado
-"""
-        formatted_text = add_premium_emojis(admin_text, "MarkdownV2")
-        
         await self.safe_edit_message_text(query,
-            formatted_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            ADMIN_PANEL_SCREEN.text,
+            reply_markup=ADMIN_PANEL_SCREEN.markup,
             parse_mode="MarkdownV2"
         )
 
-    async def show_groups_list(self, query):
-        groups = await self.db.get_all_active_groups()
+    async def show_groups_list(self, query, after=None, before=None):
+        groups, has_prev, has_next = await self.db.get_active_groups_page(GROUPS_PAGE_SIZE, after=after, before=before)
+        if not groups and (after or before):
+            # La página pedida quedó vacía (grupos desactivados entre medias): volver a la primera
+            groups, has_prev, has_next = await self.db.get_active_groups_page(GROUPS_PAGE_SIZE)
         if not groups:
-            no_groups_text = """
-:wow_premium: No hay grupos registrados aún\.
-
-:rocket_premium: Añade el bot a un grupo para comenzar\.
-"""
-            formatted_text = add_premium_emojis(no_groups_text, "MarkdownV2")
-            
             await self.safe_edit_message_text(query,
-                formatted_text,
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]),
+                NO_GROUPS_SCREEN.text,
+                reply_markup=NO_GROUPS_SCREEN.markup,
                 parse_mode="MarkdownV2"
             )
             return
@@ -546,13 +578,20 @@ class CallbackHandlers:
                 callback_data=f"config_group_{group[0]}"
             )])
 
+        # Cursores por clave (added_date, chat_id) del primer y último grupo de la página
+        nav = []
+        if has_prev:
+            nav.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"groups_prev_{groups[0][7]}_{groups[0][0]}"))
+        if has_next:
+            nav.append(InlineKeyboardButton("Siguiente ▶️", callback_data=f"groups_next_{groups[-1][7]}_{groups[-1][0]}"))
+        if nav:
+            keyboard.append(nav)
         keyboard.append([InlineKeyboardButton("🔙 Volver al Panel", callback_data="admin_panel")])
         formatted_text = add_premium_emojis(text, "MarkdownV2")
         
         await self.safe_edit_message_text(query, formatted_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="MarkdownV2")
 
     async def show_welcome_config(self, query, chat_id: int):
-        await self.db.ensure_root_node(chat_id)
         welcome_config = await self.db.get_welcome_settings(chat_id)
         group = await self.db.get_group_info(chat_id)
         if not group:
@@ -560,7 +599,7 @@ class CallbackHandlers:
             return
 
         root_node = await self.db.get_root_node(chat_id)
-        buttons = self._buttons_to_list(root_node.get('buttons') if root_node else [])
+        buttons = buttons_to_list(root_node.get('buttons') if root_node else [])
         buttons_count = sum(len(r) for r in buttons)
 
         status = ":check_premium: Activado" if welcome_config and welcome_config[1] else "❌ Desactivado"
@@ -592,14 +631,19 @@ class CallbackHandlers:
         formatted_text = add_premium_emojis(text, "MarkdownV2")
         await self.safe_edit_message_text(query, formatted_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="MarkdownV2")
 
-    async def show_node_manager(self, query, chat_id: int, node_id: int | None):
-        await self.db.ensure_root_node(chat_id)
-        node = await self.db.get_root_node(chat_id) if node_id is None else await self.db.get_node(node_id)
+    async def show_node_manager(self, query, chat_id: int, node_id: int | None = None):
+        tree = await self.db.load_tree(chat_id)
+        node = tree.root if node_id is None else tree.get(node_id)
+        if node is None and node_id is None:
+            # Chat sin nodo raíz todavía: se crea y se recarga el árbol
+            await self.db.get_root_node(chat_id)
+            tree = await self.db.load_tree(chat_id)
+            node = tree.root
         if not node:
             await self.safe_edit_message_text(query, "❌ Nodo no encontrado.")
             return
 
-        buttons = self._buttons_to_list(node.get('buttons'))
+        buttons = buttons_to_list(node.get('buttons'))
         btn_count = sum(len(r) for r in buttons)
         pmode = self._normalize_parse_mode(node.get('parse_mode') or "HTML")
 
@@ -619,7 +663,7 @@ class CallbackHandlers:
         else:
             text += "No hay botones en este nodo\\.\n"
 
-        children = await self.db.get_child_nodes(node['chat_id'], node['id'])
+        children = tree.children_of(node['id'])
         if children:
             text += f"\n**Submenús hijos:** {len(children)}\n"
             for ch in children:
@@ -661,140 +705,80 @@ class CallbackHandlers:
 
     async def start_add_url_button(self, query, node_id: int):
         node = await self.db.get_node(node_id)
-        self.message_handler.waiting_for_input[query.from_user.id] = {
+        await self.message_handler.input_state.set(query.from_user.id, {
             'action': 'button_text',
             'button_type': 'url',
             'node_id': node_id,
             'chat_id': node['chat_id']
-        }
-        
-        url_text = """
-:plus_premium: **Añadir botón URL** :plus_premium:
-
-:rocket_premium: Envía el texto que tendrá el botón:
-"""
-        formatted_text = add_premium_emojis(url_text, "MarkdownV2")
+        })
         
         await self.safe_edit_message_text(query,
-            formatted_text,
+            ADD_URL_BUTTON_SCREEN.text,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancelar", callback_data=f"node_mgr_{node['chat_id']}_{node_id}")]]),
             parse_mode="MarkdownV2"
         )
 
     async def start_add_submenu_button(self, query, node_id: int):
         node = await self.db.get_node(node_id)
-        self.message_handler.waiting_for_input[query.from_user.id] = {
+        await self.message_handler.input_state.set(query.from_user.id, {
             'action': 'button_sub_text',
             'node_id': node_id,
             'chat_id': node['chat_id']
-        }
-        
-        submenu_text = """
-:gem_premium: **Añadir Submenú** :gem_premium:
-
-:star_premium: 1\\) Envía el texto del botón que abrirá el submenú\\.
-"""
-        formatted_text = add_premium_emojis(submenu_text, "MarkdownV2")
+        })
         
         await self.safe_edit_message_text(query,
-            formatted_text,
+            ADD_SUBMENU_SCREEN.text,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancelar", callback_data=f"node_mgr_{node['chat_id']}_{node_id}")]]),
             parse_mode="MarkdownV2"
         )
 
     async def start_node_image_edit(self, query, node_id: int):
         node = await self.db.get_node(node_id)
-        self.message_handler.waiting_for_input[query.from_user.id] = {
+        await self.message_handler.input_state.set(query.from_user.id, {
             'action': 'node_image',
             'node_id': node_id
-        }
-        
-        image_text = """
-:magic_premium: **Configurar imagen del nodo** :magic_premium:
-
-:rocket_premium: Envía una URL de imagen o directamente una foto desde tu galería\\.
-
-:check_premium: Escribe 'remove' para quitar la imagen\\.
-"""
-        formatted_text = add_premium_emojis(image_text, "MarkdownV2")
+        })
         
         await self.safe_edit_message_text(query,
-            formatted_text,
+            NODE_IMAGE_SCREEN.text,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancelar", callback_data=f"node_mgr_{node['chat_id']}_{node_id}")]]),
             parse_mode="MarkdownV2"
         )
 
     async def start_node_rename(self, query, node_id: int):
         node = await self.db.get_node(node_id)
-        self.message_handler.waiting_for_input[query.from_user.id] = {
+        await self.message_handler.input_state.set(query.from_user.id, {
             'action': 'node_rename',
             'node_id': node_id
-        }
-        
-        rename_text = """
-:star_premium: **Editar texto del nodo** :star_premium:
-
-:rocket_premium: Envía el nuevo texto \\(variables: {mention}, {name}, {username}, {group\\_name}\\):
-
-:magic_premium: **¡Puedes usar emojis premium\\!** Ejemplo: `:crown_premium:` `:fire_premium:`
-"""
-        formatted_text = add_premium_emojis(rename_text, "MarkdownV2")
+        })
         
         await self.safe_edit_message_text(query,
-            formatted_text,
+            NODE_RENAME_SCREEN.text,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancelar", callback_data=f"node_mgr_{node['chat_id']}_{node_id}")]]),
             parse_mode="MarkdownV2"
         )
 
     async def start_welcome_message_edit(self, query, chat_id: int):
-        self.message_handler.waiting_for_input[query.from_user.id] = {
+        await self.message_handler.input_state.set(query.from_user.id, {
             'action': 'welcome_message',
             'chat_id': chat_id
-        }
-        
-        welcome_edit_text = """
-:crown_premium: **Editar Mensaje de Bienvenida** :crown_premium:
-
-:rocket_premium: Envía el nuevo mensaje que se mostrará cuando alguien se una al grupo\\.
-
-:star_premium: **Puedes usar estas variables:**
-:check_premium: `{mention}` — menciona al usuario
-:check_premium: `{name}` — nombre del usuario  
-:check_premium: `{username}` — @usuario o nombre si no tiene
-:check_premium: `{group_name}` — nombre del grupo
-
-:magic_premium: **Emojis premium disponibles:**
-`:crown_premium:` `:fire_premium:` `:star_premium:` `:rocket_premium:` `:diamond_premium:`
-
-:gem_premium: **Formatos soportados:** HTML o MarkdownV2\\.
-:lightning_premium: **Sugerencia:** si usas MarkdownV2, recuerda escapar los caracteres especiales\\.
-"""
-        formatted_text = add_premium_emojis(welcome_edit_text, "MarkdownV2")
+        })
         
         await self.safe_edit_message_text(query,
-            formatted_text,
+            WELCOME_EDIT_SCREEN.text,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancelar", callback_data=f"config_welcome_{chat_id}")]]),
             parse_mode="MarkdownV2"
         )
 
     async def start_welcome_image_edit(self, query, chat_id: int):
         root_id = await self.db.ensure_root_node(chat_id)
-        self.message_handler.waiting_for_input[query.from_user.id] = {
+        await self.message_handler.input_state.set(query.from_user.id, {
             'action': 'node_image',
             'node_id': root_id
-        }
-        
-        image_edit_text = """
-:magic_premium: **Configurar Imagen de Bienvenida \\(Nodo raíz\\)** :magic_premium:
-
-:rocket_premium: Envía una URL de imagen, o directamente una **foto**\\.
-
-:check_premium: Escribe `remove` para quitarla\\.
-"""
-        formatted_text = add_premium_emojis(image_edit_text, "MarkdownV2")
+        })
         
         await self.safe_edit_message_text(query,
-            formatted_text,
+            WELCOME_IMAGE_SCREEN.text,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancelar", callback_data=f"config_welcome_{chat_id}")]]),
             parse_mode="MarkdownV2"
         )
@@ -849,23 +833,57 @@ class CallbackHandlers:
 :star_premium: Soporte de temas para hilos específicos
 :crown_premium: **¡NUEVO\\!** Sistema completo de emojis premium
 """
-        keyboard = [[InlineKeyboardButton("🔙 Volver al Panel", callback_data="admin_panel")]]
+        keyboard = [
+            [InlineKeyboardButton("🐢 Consultas lentas", callback_data="db_profile")],
+            [InlineKeyboardButton("🔙 Volver al Panel", callback_data="admin_panel")]
+        ]
         formatted_text = add_premium_emojis(text, "MarkdownV2")
         await self.safe_edit_message_text(query, formatted_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="MarkdownV2")
 
-    async def show_manage_welcomes(self, query):
-        groups = await self.db.get_all_active_groups()
-        if not groups:
-            no_welcomes_text = """
-:wow_premium: No hay grupos con configuraciones de bienvenida\\.
+    async def show_db_profile(self, query):
+        """Formas de consulta más lentas desde el arranque (ver mongo_profiler.py)"""
+        info = mongo_profiler.metrics()
+        text = f"""
+:lightning_premium: **Consultas más lentas** :lightning_premium:
 
-:rocket_premium: Añade el bot a un grupo para comenzar\\.
+:star_premium: Comandos: {info['commands']} \\| lentas: {info['slow']} \\| errores: {info['errors']}
 """
-            formatted_text = add_premium_emojis(no_welcomes_text, "MarkdownV2")
-            
+        rows = mongo_profiler.top_shapes(DB_PROFILE_TOP_N)
+        if not rows:
+            text += "\n:wow_premium: Aún no hay consultas registradas\\.\n"
+        for i, row in enumerate(rows, 1):
+            shape = truncate_text(row['shape'], 120).replace("\\", "\\\\").replace("`", "'")
+            operation = _escape_md_v2(f"{row['collection']}.{row['command']}")
+            detail = _escape_md_v2(
+                f"máx {row['max'] * 1000:.0f} ms, media {row['avg'] * 1000:.1f} ms, "
+                f"{row['count']} veces, {row['returned_avg']:.1f} docs"
+            )
+            text += f"\n{i}\\. *{operation}* {detail}\n"
+            if shape:
+                text += f"`{shape}`\n"
+
+        keyboard = [
+            [InlineKeyboardButton("🔄 Actualizar", callback_data="db_profile")],
+            [InlineKeyboardButton("🔙 Volver", callback_data="bot_info")]
+        ]
+        formatted_text = add_premium_emojis(text, "MarkdownV2")
+        await self.safe_edit_message_text(query, formatted_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="MarkdownV2")
+
+    async def show_manage_welcomes_next(self, query, added_date: str, chat_id: int):
+        await self.show_manage_welcomes(query, after=(added_date, chat_id))
+
+    async def show_manage_welcomes_prev(self, query, added_date: str, chat_id: int):
+        await self.show_manage_welcomes(query, before=(added_date, chat_id))
+
+    async def show_manage_welcomes(self, query, after=None, before=None):
+        groups, has_prev, has_next = await self.db.get_active_groups_welcome_page(GROUPS_PAGE_SIZE, after=after, before=before)
+        if not groups and (after or before):
+            # Igual que show_groups_list: página vacía, volver a la primera
+            groups, has_prev, has_next = await self.db.get_active_groups_welcome_page(GROUPS_PAGE_SIZE)
+        if not groups:
             await self.safe_edit_message_text(query,
-                formatted_text,
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Volver", callback_data="admin_panel")]]),
+                NO_WELCOMES_SCREEN.text,
+                reply_markup=NO_WELCOMES_SCREEN.markup,
                 parse_mode="MarkdownV2"
             )
             return
@@ -873,14 +891,21 @@ class CallbackHandlers:
         text = ":party_premium: **Gestión de Bienvenidas** :party_premium:\n\n"
         keyboard = []
         for group in groups:
-            welcome_config = await self.db.get_welcome_settings(group[0])
-            status = ":check_premium:" if welcome_config and welcome_config[1] else "❌"
-            safe_group_name = group[1].replace('.', '\\.')
+            status = ":check_premium:" if group['enabled'] else "❌"
+            safe_group_name = (group['title'] or "").replace('.', '\\.')
             text += f"{status} {safe_group_name}\n"
             keyboard.append([InlineKeyboardButton(
-                f"{status} {truncate_text(group[1], 25)}",
-                callback_data=f"config_welcome_{group[0]}"
+                f"{status} {truncate_text(group['title'], 25)}",
+                callback_data=f"config_welcome_{group['chat_id']}"
             )])
+
+        nav = []
+        if has_prev:
+            nav.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"welcomes_prev_{groups[0]['added_date']}_{groups[0]['chat_id']}"))
+        if has_next:
+            nav.append(InlineKeyboardButton("Siguiente ▶️", callback_data=f"welcomes_next_{groups[-1]['added_date']}_{groups[-1]['chat_id']}"))
+        if nav:
+            keyboard.append(nav)
         keyboard.append([InlineKeyboardButton("🔙 Volver al Panel", callback_data="admin_panel")])
         formatted_text = add_premium_emojis(text, "MarkdownV2")
         await self.safe_edit_message_text(query, formatted_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="MarkdownV2")
@@ -1023,22 +1048,6 @@ class CallbackHandlers:
         await query.answer("✅ Estadísticas actualizadas")
         await self.show_group_stats(query, chat_id)
 
-    async def handle_back_navigation(self, query, data: str):
-        parts = data.split("_")
-        destination = parts[1] if len(parts) > 1 else ""
-        if destination == "admin":
-            await self.show_admin_panel(query)
-        elif destination == "groups":
-            await self.show_groups_list(query)
-        elif destination == "welcome" and len(parts) > 2:
-            # back_welcome_{chat_id}
-            chat_id = int(parts[-1])
-            await self.show_welcome_config(query, chat_id)
-        elif destination == "group" and len(parts) > 2:
-            # back_group_{chat_id}
-            chat_id = int(parts[-1])
-            await self.show_group_settings(query, chat_id)
-
     async def show_parse_mode_selector(self, query, node_id: int):
         node = await self.db.get_node(node_id)
         if not node:
@@ -1064,19 +1073,7 @@ class CallbackHandlers:
         await self.safe_edit_message_text(query, formatted_text, reply_markup=InlineKeyboardMarkup(kb), parse_mode="MarkdownV2")
 
     async def show_set_welcome_topic_instructions(self, query, chat_id: int):
-        text = """
-:magic_premium: **Configurar tema \\(hilo\\) para bienvenidas** :magic_premium:
-
-:star_premium: **1\\)** En el grupo, abre el tema donde quieras que se envíen las bienvenidas\\.
-
-:rocket_premium: **2\\)** Dentro de ese tema, ejecuta el comando: `/setwelcometopic`
-
-:check_premium: **3\\)** Opcional: para limpiar la configuración, usa `/clearwelcometopic`
-
-:gem_premium: **Nota:** Solo es necesario si el grupo tiene temas habilitados\\.
-"""
         kb = [
             [InlineKeyboardButton("🔙 Volver", callback_data=f"group_settings_{chat_id}")]
         ]
-        formatted_text = add_premium_emojis(text, "MarkdownV2")
-        await self.safe_edit_message_text(query, formatted_text, reply_markup=InlineKeyboardMarkup(kb), parse_mode="MarkdownV2")
+        await self.safe_edit_message_text(query, WELCOME_TOPIC_SCREEN.text, reply_markup=InlineKeyboardMarkup(kb), parse_mode="MarkdownV2")
@@ -3,26 +3,12 @@ from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
 from config import ADMIN_ID
+from emoji_registry import emoji_registry, CODE_RE
 from helpers import is_group_admin, add_premium_emojis
+from screens import StaticScreen
 
-class CommandHandlers:
-    def __init__(self, db_manager):
-        self.db = db_manager
-    
-    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id if update.effective_user else None
-        chat_type = update.effective_chat.type if update.effective_chat else 'private'
-        
-        if chat_type == 'private':
-            if user_id == ADMIN_ID:
-                keyboard = [
-                    [InlineKeyboardButton("🏠 Panel de Administración", callback_data="admin_panel")],
-                    [InlineKeyboardButton("📊 Ver Grupos", callback_data="view_groups")],
-                    [InlineKeyboardButton("ℹ️ Información", callback_data="bot_info")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                welcome_admin_text = """
+# Pantallas estáticas: se renderizan una vez (ver screens.py)
+START_ADMIN_SCREEN = StaticScreen("""
 :crown_premium: **¡Hola Administrador\!** :crown_premium:
 
 :rocket_premium: Bienvenido al panel de control del bot\.
@@ -30,81 +16,35 @@ class CommandHandlers:
 :star_premium: Desde aquí puedes administrar todos los grupos y configuraciones\.
 
 :fire_premium: **¡Nuevo\!** Soporte completo para emojis premium de Telegram
-"""
-                formatted_text = add_premium_emojis(welcome_admin_text, "MarkdownV2")
-                
-                await update.message.reply_text(
-                    formatted_text,
-                    reply_markup=reply_markup,
-                    parse_mode="MarkdownV2"
-                )
-            else:
-                user_text = """
+""", keyboard=[
+    [("🏠 Panel de Administración", "admin_panel")],
+    [("📊 Ver Grupos", "view_groups")],
+    [("ℹ️ Información", "bot_info")]
+])
+
+START_USER_SCREEN = StaticScreen("""
 :party_premium: ¡Hola! Soy un bot administrador de grupos premium :diamond_premium:
 
 :rocket_premium: Añádeme a tu grupo para comenzar a usar mis funciones avanzadas :magic_premium:
-"""
-                formatted_text = add_premium_emojis(user_text, "MarkdownV2")
-                
-                await update.message.reply_text(
-                    formatted_text,
-                    parse_mode="MarkdownV2"
-                )
-        else:
-            group_text = """
+""")
+
+START_GROUP_SCREEN = StaticScreen("""
 :crown_premium: ¡Hola! Soy tu nuevo bot administrador premium :fire_premium:
 
 :check_premium: Los administradores pueden configurarme usando /admin
 
 :star_premium: ¡Gracias por añadirme al grupo!
-"""
-            formatted_text = add_premium_emojis(group_text, "MarkdownV2")
-            
-            await update.message.reply_text(
-                formatted_text,
-                parse_mode="MarkdownV2"
-            )
-    
-    async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id if update.effective_user else None
-        chat_id = update.effective_chat.id
+""")
 
-        is_admin = await is_group_admin(context, chat_id, user_id)
-        
-        if not is_admin:
-            await update.message.reply_text("❌ Solo los administradores pueden usar este comando.")
-            return
-        
-        keyboard = [
-            [InlineKeyboardButton("🎉 Configurar Bienvenida", callback_data=f"config_welcome_{chat_id}")],
-            [InlineKeyboardButton("⚙️ Configuraciones del Grupo", callback_data=f"group_settings_{chat_id}")],
-            [InlineKeyboardButton("📊 Estadísticas", callback_data=f"group_stats_{chat_id}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        admin_panel_text = """
+GROUP_ADMIN_PANEL_SCREEN = StaticScreen("""
 :crown_premium: **Panel de Administración** :crown_premium:
 
 :rocket_premium: Selecciona una opción para configurar:
 
 :magic_premium: **¡Nuevo\!** Sistema de emojis premium disponible
-"""
-        formatted_text = add_premium_emojis(admin_panel_text, "MarkdownV2")
-        
-        await update.message.reply_text(
-            formatted_text,
-            reply_markup=reply_markup,
-            parse_mode="MarkdownV2"
-        )
+""")
 
-    async def premium_emojis_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id if update.effective_user else None
-        
-        if user_id != ADMIN_ID:
-            await update.message.reply_text("❌ Solo el administrador puede ver esta información.")
-            return
-        
-        emoji_demo = """
+PREMIUM_EMOJIS_SCREEN = StaticScreen("""
 :crown_premium: **Emojis Premium Disponibles** :crown_premium:
 
 **Emojis de estado:**
@@ -145,15 +85,114 @@ class CommandHandlers:
 
 
 :magic_premium: **Los emojis premium solo se muestran en MarkdownV2\!**
-"""
+""")
+
+CLEAR_TOPIC_SCREEN = StaticScreen(":check_premium: Se ha limpiado la configuración del tema de bienvenida\\.")
+
+
+class CommandHandlers:
+    def __init__(self, db_manager):
+        self.db = db_manager
+    
+    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id if update.effective_user else None
+        chat_type = update.effective_chat.type if update.effective_chat else 'private'
         
-        formatted_text = add_premium_emojis(emoji_demo, "MarkdownV2")
+        if chat_type == 'private':
+            if user_id == ADMIN_ID:
+                await update.message.reply_text(
+                    START_ADMIN_SCREEN.text,
+                    reply_markup=START_ADMIN_SCREEN.markup,
+                    parse_mode="MarkdownV2"
+                )
+            else:
+                await update.message.reply_text(
+                    START_USER_SCREEN.text,
+                    parse_mode="MarkdownV2"
+                )
+        else:
+            await update.message.reply_text(
+                START_GROUP_SCREEN.text,
+                parse_mode="MarkdownV2"
+            )
+    
+    async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id if update.effective_user else None
+        chat_id = update.effective_chat.id
+
+        is_admin = await is_group_admin(context, chat_id, user_id)
+        
+        if not is_admin:
+            await update.message.reply_text("❌ Solo los administradores pueden usar este comando.")
+            return
+        
+        keyboard = [
+            [InlineKeyboardButton("🎉 Configurar Bienvenida", callback_data=f"config_welcome_{chat_id}")],
+            [InlineKeyboardButton("⚙️ Configuraciones del Grupo", callback_data=f"group_settings_{chat_id}")],
+            [InlineKeyboardButton("📊 Estadísticas", callback_data=f"group_stats_{chat_id}")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
         await update.message.reply_text(
-            formatted_text,
+            GROUP_ADMIN_PANEL_SCREEN.text,
+            reply_markup=reply_markup,
             parse_mode="MarkdownV2"
         )
 
+    async def premium_emojis_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id if update.effective_user else None
+        
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Solo el administrador puede ver esta información.")
+            return
+        
+        await update.message.reply_text(
+            PREMIUM_EMOJIS_SCREEN.text,
+            parse_mode="MarkdownV2"
+        )
+
+    async def set_emoji_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/setemoji :codigo: 👑 [id_custom_emoji] — crea o actualiza un emoji premium sin reiniciar"""
+        user_id = update.effective_user.id if update.effective_user else None
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Solo el administrador puede gestionar emojis premium.")
+            return
+
+        args = context.args or []
+        if len(args) < 2 or not CODE_RE.fullmatch(args[0]):
+            await update.message.reply_text("Uso: /setemoji :codigo: 👑 [id_custom_emoji]")
+            return
+        if len(args) > 2 and not args[2].isdigit():
+            await update.message.reply_text("❌ El id del custom emoji debe ser numérico.")
+            return
+
+        code, emoji = args[0], args[1]
+        emoji_id = args[2] if len(args) > 2 else None
+        await self.db.set_premium_emoji(code, emoji, emoji_id)
+        emoji_registry.load(await self.db.get_premium_emojis())
+        self.db.notify_peers("emojis")
+        await update.message.reply_text(f"✅ Emoji {code} guardado y registro recargado.")
+
+    async def del_emoji_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/delemoji :codigo: — elimina un emoji personalizado (los integrados vuelven a su valor por defecto)"""
+        user_id = update.effective_user.id if update.effective_user else None
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Solo el administrador puede gestionar emojis premium.")
+            return
+
+        args = context.args or []
+        if len(args) != 1 or not CODE_RE.fullmatch(args[0]):
+            await update.message.reply_text("Uso: /delemoji :codigo:")
+            return
+
+        deleted = await self.db.delete_premium_emoji(args[0])
+        emoji_registry.load(await self.db.get_premium_emojis())
+        self.db.notify_peers("emojis")
+        if deleted:
+            await update.message.reply_text(f"✅ Emoji {args[0]} eliminado y registro recargado.")
+        else:
+            await update.message.reply_text(f"ℹ️ {args[0]} no estaba en la base de datos.")
+
     async def set_welcome_topic(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat = update.effective_chat
         user_id = update.effective_user.id if update.effective_user else None
@@ -199,7 +238,4 @@ class CommandHandlers:
 
         await self.db.clear_group_welcome_thread(chat.id)
         
-        clear_text = ":check_premium: Se ha limpiado la configuración del tema de bienvenida\\."
-        formatted_text = add_premium_emojis(clear_text, "MarkdownV2")
-        
-        await update.message.reply_text(formatted_text, parse_mode="MarkdownV2")
+        await update.message.reply_text(CLEAR_TOPIC_SCREEN.text, parse_mode="MarkdownV2")
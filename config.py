@@ -1,4 +1,5 @@
 import logging
+import os
 
 # Configuración de logging
 logging.basicConfig(
@@ -24,6 +25,13 @@ DEFAULT_WELCOME_MESSAGE = """
 :check_premium: **¡Únete a nuestra comunidad premium!** :diamond_premium:
 """
 
+# Resumen en modo raid (muchas altas seguidas); mismas variables que la bienvenida más {count}
+DEFAULT_RAID_DIGEST_MESSAGE = """
+:party_premium: {count} nuevos miembros se han unido a {group_name} :fire_premium:
+
+:star_premium: Bienvenidos {mention}
+"""
+
 # Configuraciones globales
 SETTINGS = {
     'date_format': '%d/%m/%Y %H:%M',
@@ -31,3 +39,71 @@ SETTINGS = {
     'max_buttons_per_welcome': 10,
     'max_message_length': 4096
 }
+
+# Caché de bienvenida por chat (habilitado, nodo raíz, parse mode, imagen, tema)
+WELCOME_CACHE_SIZE = 5000
+WELCOME_CACHE_TTL = 300  # segundos
+
+# Caché del árbol completo de nodos por chat (gestor de submenús y navegación wb_)
+NODE_TREE_CACHE_SIZE = 2000
+NODE_TREE_CACHE_TTL = 600  # segundos
+
+# Caché de administradores por chat (get_chat_administrators)
+ADMIN_CACHE_SIZE = 5000
+ADMIN_CACHE_TTL = 600  # segundos
+
+# Grupos por página en el navegador de grupos del panel
+GROUPS_PAGE_SIZE = 10
+
+# Estado de los flujos de entrada del panel: "memory" (una instancia) o "mongo" (compartido)
+CONVERSATION_STATE_BACKEND = os.environ.get("CONVERSATION_STATE_BACKEND", "memory").lower()
+CONVERSATION_STATE_SIZE = 10000
+CONVERSATION_STATE_TTL = 900  # segundos; un flujo abandonado caduca solo
+
+# Ids de nodos reservados por bloques (un $inc por bloque en lugar de uno por nodo)
+NODE_ID_BLOCK_SIZE = 100
+
+# Perfilador de comandos de MongoDB: consultas a partir de este umbral se registran en el log
+MONGO_SLOW_QUERY_MS = int(os.environ.get("MONGO_SLOW_QUERY_MS", "100"))
+DB_PROFILE_TOP_N = 10  # formas de consulta en la pantalla "Consultas lentas" del panel
+
+# Escritura diferida de estadísticas de bienvenida
+STATS_FLUSH_INTERVAL = 5  # segundos
+STATS_FLUSH_MAX_EVENTS = 500
+
+# Rollup de estadísticas generales (top-K acotado y reconstrucción exacta periódica; 0 = desactivada)
+STATS_ROLLUP_TOP_K = 20
+STATS_ROLLUP_RECONCILE_INTERVAL = 3600  # segundos
+
+# Agrupación de altas: una sola bienvenida por oleada de nuevos miembros
+JOIN_COALESCE_WINDOW_MS = 1500  # 0 desactiva la agrupación
+JOIN_COALESCE_MAX_BATCH = 20
+# Modo raid: si un chat supera JOIN_RAID_THRESHOLD altas en JOIN_RAID_INTERVAL segundos
+JOIN_RAID_THRESHOLD = 30
+JOIN_RAID_INTERVAL = 60  # segundos
+JOIN_RAID_WINDOW_MS = 10000
+RAID_DIGEST_MAX_MENTIONS = 10
+
+# Planificador de envíos salientes a la Bot API
+OUTBOUND_GLOBAL_RATE = 30  # mensajes por segundo
+OUTBOUND_GROUP_RATE_PER_MINUTE = 20
+OUTBOUND_GROUP_BURST = 5
+OUTBOUND_SHED_THRESHOLD = 500  # trabajos en cola a partir de los cuales se descarta lo prescindible
+
+# Recepción de updates: "polling" (por defecto) o "webhook" sobre el servidor aiohttp de salud
+UPDATE_MODE = os.environ.get("UPDATE_MODE", "polling").lower()
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")  # URL pública base, p. ej. https://tu-app.onrender.com
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_QUEUE = 1000  # updates en cola a partir de los cuales se responde 503 y Telegram reintenta
+
+# Procesamiento de updates: chats distintos en paralelo, cada chat en orden (1 = todo secuencial)
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "32"))
+UPDATE_MAX_PENDING = 10000  # updates en proceso o esperando turno de su chat; el resto espera plaza
+
+# Modo multiproceso: un ingress reparte los updates por chat_id entre SHARD_WORKERS procesos (0/1 = desactivado)
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", "0"))
+SHARD_SOCKET = os.environ.get("SHARD_SOCKET", "/tmp/telegram-bot-shards.sock")
+SHARD_READY_TIMEOUT = 60  # segundos esperando a que conecten todos los workers al arrancar
+SHARD_FEED_POLL = 0.05  # segundos entre comprobaciones mientras el worker tiene WEBHOOK_MAX_QUEUE updates pendientes
+SHARD_METRICS_PORT = int(os.environ.get("SHARD_METRICS_PORT", "0"))  # /metrics del worker i en este puerto + i (0 = no)
@@ -0,0 +1,124 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo import ASCENDING
+
+from cache import TTLCache
+from config import logger
+
+
+class ConversationStateStore(ABC):
+    """
+    Estado de los flujos de entrada de varios pasos del panel (texto de botón -> URL,
+    texto de submenú, imagen de nodo...) por usuario. Las entradas caducan por TTL
+    y el número de conversaciones abiertas está acotado.
+    """
+
+    async def initialize(self):
+        pass
+
+    @abstractmethod
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, user_id: int, state: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def update(self, user_id: int, **fields) -> Optional[Dict[str, Any]]:
+        """Avanza un flujo abierto al siguiente paso (renueva el TTL); None si ya caducó"""
+        state = await self.get(user_id)
+        if state is None:
+            return None
+        state = {**state, **fields}
+        await self.set(user_id, state)
+        return state
+
+    @abstractmethod
+    async def delete(self, user_id: int):
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        return {}
+
+
+class MemoryStateStore(ConversationStateStore):
+    """Backend en memoria del proceso: LRU acotado con TTL (una sola instancia del bot)"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 900):
+        self._states = TTLCache(maxsize, ttl)
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        state = self._states.get(user_id)
+        return dict(state) if state is not None else None
+
+    async def set(self, user_id: int, state: Dict[str, Any]):
+        self._states.set(user_id, dict(state))
+
+    async def delete(self, user_id: int):
+        self._states.pop(user_id)
+
+    def metrics(self) -> dict:
+        return {"backend": "memory", "open": len(self._states), "hits": self._states.hits, "misses": self._states.misses}
+
+
+class MongoStateStore(ConversationStateStore):
+    """
+    Backend compartido en la colección 'conversation_state': cualquier instancia del bot
+    puede continuar el flujo. El índice TTL sobre expires_at borra lo abandonado; como el
+    monitor TTL de MongoDB pasa cada ~60 s, las lecturas también filtran por expires_at.
+    El tope se aplica cada trim_every escrituras descartando las que caducan antes (LRU).
+    """
+
+    def __init__(self, collection, maxsize: int = 10000, ttl: float = 900, trim_every: int = 100):
+        self.collection = collection
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.trim_every = trim_every
+        self._writes = 0
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.trimmed = 0
+
+    async def initialize(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        doc = await self.collection.find_one(
+            {"_id": user_id, "expires_at": {"$gt": datetime.utcnow()}}, {"state": 1}
+        )
+        if doc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return doc.get("state") or {}
+
+    async def set(self, user_id: int, state: Dict[str, Any]):
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$set": {"state": dict(state), "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)}},
+            upsert=True
+        )
+        self._writes += 1
+        if self._writes % self.trim_every == 0:
+            await self._trim()
+
+    async def delete(self, user_id: int):
+        await self.collection.delete_one({"_id": user_id})
+
+    async def _trim(self):
+        try:
+            excess = await self.collection.estimated_document_count() - self.maxsize
+            if excess <= 0:
+                return
+            oldest = await self.collection.find({}, {"_id": 1}).sort("expires_at", ASCENDING).limit(excess).to_list(excess)
+            result = await self.collection.delete_many({"_id": {"$in": [d["_id"] for d in oldest]}})
+            self.trimmed += result.deleted_count
+        except Exception as e:
+            logger.warning(f"No se pudo recortar conversation_state: {e}")
+
+    def metrics(self) -> dict:
+        return {"backend": "mongo", "hits": self.hits, "misses": self.misses, "trimmed": self.trimmed}
@@ -1,16 +1,56 @@
+import asyncio
 import json
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import ASCENDING, DESCENDING, ReturnDocument
-
-from config import MONGO_URI, DB_NAME, logger, DEFAULT_WELCOME_MESSAGE
-
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from cache import TTLCache
+from emoji_registry import emoji_registry
+from metrics import db_errors, db_latency, instrument_methods, welcomes_sent
+from mongo_profiler import mongo_profiler
+from config import (
+    MONGO_URI, DB_NAME, logger, DEFAULT_WELCOME_MESSAGE, WELCOME_CACHE_SIZE, WELCOME_CACHE_TTL,
+    NODE_TREE_CACHE_SIZE, NODE_TREE_CACHE_TTL, NODE_ID_BLOCK_SIZE, STATS_FLUSH_INTERVAL, STATS_FLUSH_MAX_EVENTS,
+    STATS_ROLLUP_TOP_K, STATS_ROLLUP_RECONCILE_INTERVAL
+)
+from node_tree import NodeTree
+from stats_buffer import WelcomeStatsBuffer
+from stats_rollup import StatsRollup
+
+@instrument_methods(db_latency, db_errors)
 class DatabaseManager:
-    def __init__(self):
-        self.client = AsyncIOMotorClient(MONGO_URI)
-        self.db = self.client[DB_NAME]
+    def __init__(self, uri: str = MONGO_URI, db_name: str = DB_NAME):
+        # Duración por colección, operación y forma de consulta (ver mongo_profiler.py)
+        self.client = AsyncIOMotorClient(uri, event_listeners=[mongo_profiler])
+        self.db = self.client[db_name]
+        # Caché de bienvenida por chat y mapa nodo raíz -> chat para invalidar
+        self._welcome_cache = TTLCache(WELCOME_CACHE_SIZE, WELCOME_CACHE_TTL)
+        self._welcome_root_index: Dict[int, int] = {}
+        # Generación por chat (sube con cada invalidación) y global para nodos de chat desconocido
+        self._welcome_generation: Dict[int, int] = {}
+        self._welcome_node_generation = 0
+        # Árbol de nodos por chat; la generación sube con cada escritura del chat
+        self._tree_cache = TTLCache(NODE_TREE_CACHE_SIZE, NODE_TREE_CACHE_TTL)
+        self._tree_generation: Dict[int, int] = {}
+        # Global: sube con escrituras de nodos cuyo chat aún no está en el índice
+        self._tree_node_generation = 0
+        self._node_chat_index: Dict[int, int] = {}
+        # Bloques de ids reservados: nombre -> [siguiente, último]
+        self._id_blocks: Dict[str, List[int]] = {}
+        self._id_block_locks: Dict[str, asyncio.Lock] = {}
+        # Modo multiproceso: recibe (tipo, clave) de cada invalidación local para avisar a los demás workers
+        self.invalidation_listener: Optional[Callable[[str, Any], None]] = None
+        # None = sin comprobar; False = despliegue standalone sin transacciones
+        self._transactions_supported: Optional[bool] = None
+        # Contadores de bienvenidas con escritura diferida
+        # Totales de get_general_stats mantenidos incrementalmente
+        self.stats_rollup = StatsRollup(self.db, STATS_ROLLUP_TOP_K, STATS_ROLLUP_RECONCILE_INTERVAL)
+        self.stats_buffer = WelcomeStatsBuffer(
+            self.db.stats, STATS_FLUSH_INTERVAL, STATS_FLUSH_MAX_EVENTS, on_flush=self.stats_rollup.record_welcomes
+        )
 
     async def initialize_db(self):
         # Limpiar documentos con chat_id nulo
@@ -18,32 +58,64 @@ class DatabaseManager:
 
         # Crear índices
         await self.db.groups.create_index("chat_id", unique=True)
-        await self.db.groups.create_index([("active", ASCENDING), ("added_date", DESCENDING)])
+        # chat_id desempata added_date: paginación por clave (added_date, chat_id) sin ordenar en memoria
+        await self.db.groups.create_index([("active", ASCENDING), ("added_date", DESCENDING), ("chat_id", DESCENDING)])
 
         await self.db.welcome_settings.create_index("chat_id", unique=True)
 
         await self.db.welcome_nodes.create_index("node_id", unique=True)
         await self.db.welcome_nodes.create_index([("chat_id", ASCENDING), ("parent_id", ASCENDING)])
+        # Un único nodo raíz por chat: hace atómico el upsert de ensure_root_node
+        try:
+            await self.db.welcome_nodes.create_index(
+                "chat_id",
+                name="unique_root_per_chat",
+                unique=True,
+                partialFilterExpression={"parent_id": {"$type": "null"}}
+            )
+        except OperationFailure as e:
+            logger.warning(f"No se pudo crear el índice único de nodos raíz (¿raíces duplicadas?): {e}")
 
         await self.db.stats.create_index("chat_id", unique=True)
         await self.db.global_settings.create_index("setting_name", unique=True)
+        await self.db.premium_emojis.create_index("code", unique=True)
 
         # Inicializar contador de nodos si no existe
-        existing = await self.db.counters.find_one({"_id": "welcome_node_id"})
-        if not existing:
-            await self.db.counters.insert_one({"_id": "welcome_node_id", "seq": 0})
+        # $setOnInsert: varios workers pueden arrancar a la vez
+        await self.db.counters.update_one(
+            {"_id": "welcome_node_id"}, {"$setOnInsert": {"seq": 0}}, upsert=True
+        )
 
         logger.info("Base de datos MongoDB inicializada correctamente")
 
     # Utilidades internas
-    async def _get_next_sequence(self, name: str) -> int:
+    async def _reserve_sequence_block(self, name: str, size: int) -> Tuple[int, int]:
+        # El $inc es atómico: cada instancia del bot recibe un rango propio sin solapes
         doc = await self.db.counters.find_one_and_update(
             {"_id": name},
-            {"$inc": {"seq": 1}},
+            {"$inc": {"seq": size}},
             upsert=True,
             return_document=ReturnDocument.AFTER
         )
-        return int(doc["seq"])
+        last = int(doc["seq"])
+        return last - size + 1, last
+
+    async def _get_next_sequence(self, name: str, block_size: int = NODE_ID_BLOCK_SIZE) -> int:
+        """
+        Siguiente id de la secuencia, servido desde un bloque reservado en memoria.
+        Los ids son únicos pero no contiguos: al reiniciar se pierde lo que quede del bloque.
+        """
+        block = self._id_blocks.get(name)
+        if block is None or block[0] > block[1]:
+            lock = self._id_block_locks.setdefault(name, asyncio.Lock())
+            async with lock:
+                block = self._id_blocks.get(name)
+                if block is None or block[0] > block[1]:
+                    block = list(await self._reserve_sequence_block(name, block_size))
+                    self._id_blocks[name] = block
+        value = block[0]
+        block[0] += 1
+        return value
 
     def _node_doc_to_dict(self, doc: Dict[str, Any]) -> Dict[str, Any]:
         if not doc:
@@ -54,8 +126,12 @@ class DatabaseManager:
             "parent_id": doc.get("parent_id"),
             "text": doc.get("text"),
             "image_url": doc.get("image_url"),
+            # file_id de Telegram capturado tras el primer envío de una image_url remota
+            "image_file_id": doc.get("image_file_id"),
             "parse_mode": doc.get("parse_mode", "HTML"),
-            "buttons": doc.get("buttons", [])
+            "buttons": doc.get("buttons", []),
+            # Se incrementa en cada escritura; invalida plantillas y teclados cacheados
+            "version": doc.get("version", 0)
         }
 
     def _group_doc_to_tuple(self, doc: Dict[str, Any]) -> Tuple[Any, ...]:
@@ -86,6 +162,169 @@ class DatabaseManager:
             doc.get("parse_mode", "HTML")
         )
 
+    async def _run_in_transaction(self, func):
+        """Ejecuta func(session) dentro de una transacción si el despliegue la soporta; si no, sin sesión"""
+        if self._transactions_supported is not False:
+            try:
+                async with await self.client.start_session() as session:
+                    async with session.start_transaction():
+                        result = await func(session)
+                self._transactions_supported = True
+                return result
+            except OperationFailure as e:
+                # 20 = IllegalOperation: standalone, las transacciones requieren replica set o mongos
+                if e.code != 20:
+                    raise
+                self._transactions_supported = False
+                logger.info("MongoDB sin soporte de transacciones: se usan escrituras individuales")
+        return await func(None)
+
+    # Invalidación entre workers (modo multiproceso, ver sharding.py)
+    def notify_peers(self, kind: str, key: Any = None):
+        if self.invalidation_listener is not None:
+            self.invalidation_listener(kind, key)
+
+    async def apply_remote_invalidation(self, kind: str, key: Any):
+        """Aplica una invalidación publicada por otro worker, sin volver a publicarla"""
+        if kind == "welcome":
+            self._drop_welcome_cache(key)
+        elif kind == "node":
+            self._drop_welcome_node(key)
+        elif kind == "tree":
+            self._drop_tree(key)
+        elif kind == "emojis":
+            emoji_registry.load(await self.get_premium_emojis())
+
+    def cache_stats(self) -> dict:
+        return {"welcome": self._welcome_cache.stats(), "tree": self._tree_cache.stats()}
+
+    # Caché de bienvenida
+    def invalidate_welcome_cache(self, chat_id):
+        self._drop_welcome_cache(chat_id)
+        self.notify_peers("welcome", chat_id)
+
+    def _drop_welcome_cache(self, chat_id):
+        self._welcome_generation[chat_id] = self._welcome_generation.get(chat_id, 0) + 1
+        bundle = self._welcome_cache.pop(chat_id)
+        if bundle and bundle.get("root"):
+            self._welcome_root_index.pop(bundle["root"].get("id"), None)
+
+    def _invalidate_welcome_node(self, node_id: int):
+        # Otro worker puede tener cacheado el nodo aunque este no: se publica siempre
+        self._drop_welcome_node(node_id)
+        self.notify_peers("node", node_id)
+
+    def _drop_welcome_node(self, node_id: int):
+        chat_id = self._welcome_root_index.get(node_id)
+        if chat_id is not None:
+            self._drop_welcome_cache(chat_id)
+        else:
+            # Puede ser la raíz de un bundle que se está cargando y aún no está en el índice
+            self._welcome_node_generation += 1
+        chat_id = self._node_chat_index.get(node_id)
+        if chat_id is not None:
+            self._drop_tree(chat_id)
+        else:
+            # Puede ser un nodo de un árbol que se está cargando y aún no está en el índice
+            self._tree_node_generation += 1
+
+    # Árbol de nodos en memoria
+    def invalidate_tree(self, chat_id: int):
+        self._drop_tree(chat_id)
+        self.notify_peers("tree", chat_id)
+
+    def _drop_tree(self, chat_id: int):
+        self._tree_generation[chat_id] = self._tree_generation.get(chat_id, 0) + 1
+        tree = self._tree_cache.pop(chat_id)
+        if tree:
+            for node_id in tree.node_ids():
+                self._node_chat_index.pop(node_id, None)
+
+    async def load_tree(self, chat_id: int) -> NodeTree:
+        """Todos los nodos del chat en una consulta (índice chat_id+parent_id), cacheados por chat"""
+        tree = self._tree_cache.get(chat_id)
+        if tree is not None:
+            return tree
+
+        generation = self._tree_generation.get(chat_id, 0)
+        node_generation = self._tree_node_generation
+        docs = await self.db.welcome_nodes.find({"chat_id": chat_id}).to_list(None)
+        tree = NodeTree(chat_id, (self._node_doc_to_dict(d) for d in docs), generation)
+        # Si hubo una escritura durante la consulta el árbol ya nace viejo: se usa pero no se cachea
+        if (self._tree_generation.get(chat_id, 0) == generation
+                and self._tree_node_generation == node_generation):
+            self._tree_cache.set(chat_id, tree)
+            for node_id in tree.node_ids():
+                self._node_chat_index[node_id] = chat_id
+        return tree
+
+    async def get_welcome_bundle(self, chat_id) -> Dict[str, Any]:
+        """
+        Devuelve todo lo necesario para enviar una bienvenida:
+        enabled, root, parse_mode, image_url y thread_id. Se cachea por chat.
+        """
+        bundle = self._welcome_cache.get(chat_id)
+        if bundle is not None:
+            return bundle
+
+        generation = (self._welcome_generation.get(chat_id, 0), self._welcome_node_generation)
+        enabled, root, thread_id = await self._load_welcome_bundle(chat_id)
+
+        bundle = {
+            "enabled": enabled,
+            "root": root,
+            "parse_mode": (root.get("parse_mode") if root else None) or "HTML",
+            "image_url": root.get("image_url") if root else None,
+            "thread_id": thread_id
+        }
+        # Igual que load_tree: si se invalidó durante la carga se usa pero no se cachea
+        if (self._welcome_generation.get(chat_id, 0), self._welcome_node_generation) == generation:
+            self._welcome_cache.set(chat_id, bundle)
+            if root:
+                self._welcome_root_index[root["id"]] = chat_id
+        return bundle
+
+    async def _load_welcome_bundle(self, chat_id) -> Tuple[bool, Optional[Dict[str, Any]], Optional[int]]:
+        # Una sola ida y vuelta: groups + welcome_settings + nodo raíz vía $lookup
+        docs = await self.db.groups.aggregate([
+            {"$match": {"chat_id": chat_id}},
+            {"$limit": 1},
+            {"$project": {"_id": 0, "chat_id": 1, "welcome_thread_id": 1}},
+            {"$lookup": {
+                "from": "welcome_settings",
+                "localField": "chat_id",
+                "foreignField": "chat_id",
+                "pipeline": [{"$project": {"_id": 0, "enabled": 1}}],
+                "as": "settings"
+            }},
+            {"$lookup": {
+                "from": "welcome_nodes",
+                "localField": "chat_id",
+                "foreignField": "chat_id",
+                "pipeline": [{"$match": {"parent_id": None}}, {"$limit": 1}],
+                "as": "root"
+            }}
+        ]).to_list(1)
+
+        if docs:
+            doc = docs[0]
+            settings = doc["settings"][0] if doc.get("settings") else None
+            root_doc = doc["root"][0] if doc.get("root") else None
+            thread_id = doc.get("welcome_thread_id")
+        else:
+            # Chat sin documento en groups: solo cuentan sus welcome_settings
+            settings = await self.db.welcome_settings.find_one({"chat_id": chat_id}, {"enabled": 1})
+            root_doc = None
+            thread_id = None
+
+        enabled = bool(settings.get("enabled", True)) if settings else False
+        if not enabled:
+            return False, None, thread_id
+
+        if not root_doc:
+            root_doc = await self._upsert_root_node(chat_id)
+        return True, self._node_doc_to_dict(root_doc), thread_id
+
     # Global settings
     async def get_setting(self, name: str, default=None):
         row = await self.db.global_settings.find_one({"setting_name": name})
@@ -105,23 +344,47 @@ class DatabaseManager:
             out[d["setting_name"]] = d.get("setting_value")
         return out
 
+    # Emojis premium (se fusionan con los integrados en emoji_registry)
+    async def get_premium_emojis(self) -> List[Dict[str, Any]]:
+        return await self.db.premium_emojis.find({}, {"_id": 0, "code": 1, "emoji": 1, "emoji_id": 1}).to_list(None)
+
+    async def set_premium_emoji(self, code: str, emoji: str, emoji_id: Optional[str]):
+        await self.db.premium_emojis.update_one(
+            {"code": code},
+            {"$set": {"emoji": emoji, "emoji_id": emoji_id}},
+            upsert=True
+        )
+
+    async def delete_premium_emoji(self, code: str) -> bool:
+        result = await self.db.premium_emojis.delete_one({"code": code})
+        return result.deleted_count > 0
+
     # Grupos
-    async def add_group(self, chat_id, title, chat_type, added_by, username, name, member_count, is_forum: bool = False):
-        await self.db.groups.update_one(
+    async def _update_group(self, chat_id, fields: Dict[str, Any], upsert: bool = False):
+        # Escribe el grupo y propaga la diferencia (activo, miembros, título) al rollup
+        before = await self.db.groups.find_one_and_update(
             {"chat_id": chat_id},
-            {"$set": {
-                "title": title,
-                "type": chat_type,
-                "added_by": added_by,
-                "added_by_username": username,
-                "added_by_name": name,
-                "member_count": member_count,
-                "added_date": datetime.utcnow().isoformat(),
-                "active": True,
-                "is_forum": bool(is_forum)
-            }},
-            upsert=True
+            {"$set": fields},
+            upsert=upsert,
+            return_document=ReturnDocument.BEFORE
         )
+        if before is None and not upsert:
+            return
+        after = {**(before or {}), **fields, "chat_id": chat_id}
+        await self.stats_rollup.apply_group_change(before, after)
+
+    async def add_group(self, chat_id, title, chat_type, added_by, username, name, member_count, is_forum: bool = False):
+        await self._update_group(chat_id, {
+            "title": title,
+            "type": chat_type,
+            "added_by": added_by,
+            "added_by_username": username,
+            "added_by_name": name,
+            "member_count": member_count,
+            "added_date": datetime.utcnow().isoformat(),
+            "active": True,
+            "is_forum": bool(is_forum)
+        }, upsert=True)
 
         default_parse_mode = await self.get_setting('default_parse_mode', 'HTML')
 
@@ -147,35 +410,114 @@ class DatabaseManager:
         )
 
         await self.ensure_root_node(chat_id)
+        self.invalidate_welcome_cache(chat_id)
 
     async def get_group_info(self, chat_id):
         doc = await self.db.groups.find_one({"chat_id": chat_id})
         return self._group_doc_to_tuple(doc) if doc else None
 
-    async def get_all_active_groups(self):
-        cursor = self.db.groups.find({"active": True}).sort("added_date", DESCENDING)
-        groups = []
+    @staticmethod
+    def _active_groups_keyset(after: Optional[Tuple[str, int]], before: Optional[Tuple[str, int]]) -> Tuple[Dict[str, Any], int]:
+        """Filtro y sentido de recorrido de los grupos activos a partir de una clave (added_date, chat_id)"""
+        query: Dict[str, Any] = {"active": True}
+        if after:
+            query["$or"] = [{"added_date": {"$lt": after[0]}}, {"added_date": after[0], "chat_id": {"$lt": after[1]}}]
+            return query, DESCENDING
+        if before:
+            query["$or"] = [{"added_date": {"$gt": before[0]}}, {"added_date": before[0], "chat_id": {"$gt": before[1]}}]
+            return query, ASCENDING
+        return query, DESCENDING
+
+    async def iter_active_groups(self, after: Optional[Tuple[str, int]] = None, before: Optional[Tuple[str, int]] = None,
+                                 limit: Optional[int] = None, batch_size: int = 100):
+        """
+        Recorre los grupos activos por (added_date, chat_id) descendente sin cargarlos todos.
+        after/before son claves (added_date, chat_id): grupos posteriores/anteriores a esa posición;
+        con before se devuelven en orden ascendente (el llamador los invierte).
+        """
+        query, direction = self._active_groups_keyset(after, before)
+        cursor = self.db.groups.find(query).sort([("added_date", direction), ("chat_id", direction)]).batch_size(batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
         async for doc in cursor:
-            groups.append(self._group_doc_to_tuple(doc))
-        return groups
+            yield self._group_doc_to_tuple(doc)
+
+    async def get_active_groups_page(self, page_size: int, after: Optional[Tuple[str, int]] = None,
+                                     before: Optional[Tuple[str, int]] = None) -> Tuple[List[Tuple[Any, ...]], bool, bool]:
+        """Una página de grupos activos: (grupos, hay_anterior, hay_siguiente). Se pide uno de más para saber si sigue"""
+        groups = [g async for g in self.iter_active_groups(after, before, limit=page_size + 1)]
+        more = len(groups) > page_size
+        groups = groups[:page_size]
+        if before:
+            groups.reverse()
+            return groups, more, True
+        return groups, bool(after), more
+
+    async def get_all_active_groups(self):
+        return [g async for g in self.iter_active_groups()]
+
+    async def get_active_groups_welcome_status(self, limit: Optional[int] = None, after: Optional[Tuple[str, int]] = None,
+                                               before: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+        """
+        chat_id, título, added_date y si la bienvenida está activa para los grupos activos, en
+        una sola agregación ($lookup a welcome_settings) con solo los campos que se muestran.
+        after/before como en iter_active_groups (con before el orden es ascendente).
+        """
+        query, direction = self._active_groups_keyset(after, before)
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": query},
+            {"$sort": {"added_date": direction, "chat_id": direction}},
+        ]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline += [
+            {"$project": {"_id": 0, "chat_id": 1, "title": 1, "added_date": 1}},
+            {"$lookup": {
+                "from": "welcome_settings",
+                "localField": "chat_id",
+                "foreignField": "chat_id",
+                "pipeline": [{"$project": {"_id": 0, "enabled": 1}}],
+                "as": "settings"
+            }}
+        ]
+        out = []
+        async for doc in self.db.groups.aggregate(pipeline):
+            settings = doc.get("settings") or []
+            out.append({
+                "chat_id": doc.get("chat_id"),
+                "title": doc.get("title"),
+                "added_date": doc.get("added_date"),
+                # Igual que get_welcome_settings: sin documento cuenta como desactivada
+                "enabled": bool(settings) and settings[0].get("enabled", True)
+            })
+        return out
+
+    async def get_active_groups_welcome_page(self, page_size: int, after: Optional[Tuple[str, int]] = None,
+                                             before: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict[str, Any]], bool, bool]:
+        """Una página de get_active_groups_welcome_status: (grupos, hay_anterior, hay_siguiente), como get_active_groups_page"""
+        groups = await self.get_active_groups_welcome_status(page_size + 1, after, before)
+        more = len(groups) > page_size
+        groups = groups[:page_size]
+        if before:
+            groups.reverse()
+            return groups, more, True
+        return groups, bool(after), more
 
     async def update_group_info(self, chat_id, title, member_count, is_forum: Optional[bool] = None):
         update = {"title": title, "member_count": member_count}
         if is_forum is not None:
             update["is_forum"] = bool(is_forum)
-        await self.db.groups.update_one(
-            {"chat_id": chat_id},
-            {"$set": update}
-        )
+        await self._update_group(chat_id, update)
 
     async def deactivate_group(self, chat_id):
-        await self.db.groups.update_one({"chat_id": chat_id}, {"$set": {"active": False}})
+        await self._update_group(chat_id, {"active": False})
 
     async def set_group_welcome_thread(self, chat_id: int, thread_id: Optional[int]):
         await self.db.groups.update_one(
             {"chat_id": chat_id},
             {"$set": {"welcome_thread_id": thread_id}}
         )
+        self.invalidate_welcome_cache(chat_id)
 
     async def clear_group_welcome_thread(self, chat_id: int):
         await self.set_group_welcome_thread(chat_id, None)
@@ -203,111 +545,110 @@ class DatabaseManager:
         current = bool(doc.get("enabled")) if doc else True
         new_status = not current
         await self.db.welcome_settings.update_one({"chat_id": chat_id}, {"$set": {"enabled": new_status}})
+        self.invalidate_welcome_cache(chat_id)
         return new_status
 
     # Stats
     async def get_group_stats(self, chat_id):
         doc = await self.db.stats.find_one({"chat_id": chat_id})
+        pending = self.stats_buffer.pending_for(chat_id)
         if not doc:
-            return (chat_id, 0, None)
-        return (doc.get("chat_id"), doc.get("welcomes_sent", 0), doc.get("last_activity"))
+            return (chat_id, pending, None)
+        return (doc.get("chat_id"), doc.get("welcomes_sent", 0) + pending, doc.get("last_activity"))
 
-    async def update_welcome_stats(self, chat_id):
-        await self.db.stats.update_one(
-            {"chat_id": chat_id},
-            {"$inc": {"welcomes_sent": 1}, "$set": {"last_activity": datetime.utcnow().isoformat()}},
-            upsert=True
-        )
+    async def update_welcome_stats(self, chat_id, count: int = 1):
+        welcomes_sent.inc(amount=count)
+        if self.stats_buffer.add(chat_id, count):
+            await self.stats_buffer.flush()
 
     async def get_general_stats(self):
-        stats = {}
-
-        total_groups = await self.db.groups.count_documents({"active": True})
-        inactive_groups = await self.db.groups.count_documents({"active": False})
+        # Una lectura del documento stats_rollup en lugar de recorrer todos los grupos
+        rollup = await self.stats_rollup.read()
+        member_groups = rollup.get("member_groups", 0)
 
-        agg = await self.db.stats.aggregate([
-            {"$group": {"_id": None, "sum": {"$sum": "$welcomes_sent"}}}
-        ]).to_list(1)
-        total_welcomes = agg[0]["sum"] if agg else 0
-
-        agg_avg = await self.db.groups.aggregate([
-            {"$match": {"active": True}},
-            {"$group": {"_id": None, "avg": {"$avg": "$member_count"}}}
-        ]).to_list(1)
-        avg_members = agg_avg[0]["avg"] if agg_avg and agg_avg[0]["avg"] is not None else 0
-
-        top = await self.db.groups.aggregate([
-            {"$match": {"active": True}},
-            {"$lookup": {
-                "from": "stats",
-                "localField": "chat_id",
-                "foreignField": "chat_id",
-                "as": "stats"
-            }},
-            {"$unwind": {"path": "$stats", "preserveNullAndEmptyArrays": True}},
-            {"$addFields": {"welcomes": {"$ifNull": ["$stats.welcomes_sent", 0]}}},
-            {"$sort": {"welcomes": -1}},
-            {"$limit": 5},
-            {"$project": {"title": 1, "welcomes": 1}}
-        ]).to_list(5)
-        top_groups = [(g.get("title"), int(g.get("welcomes", 0))) for g in top]
-
-        stats['total_groups'] = (total_groups,)
-        stats['inactive_groups'] = (inactive_groups,)
-        stats['total_welcomes'] = (total_welcomes,)
-        stats['avg_members'] = (avg_members,)
-        stats['top_groups'] = top_groups
+        stats = {}
+        stats['total_groups'] = (rollup.get("active_groups", 0),)
+        stats['inactive_groups'] = (rollup.get("inactive_groups", 0),)
+        stats['total_welcomes'] = (rollup.get("total_welcomes", 0) + self.stats_buffer.pending_total(),)
+        stats['avg_members'] = (rollup.get("member_sum", 0) / member_groups if member_groups else 0,)
+        stats['top_groups'] = StatsRollup.top_groups(rollup, 5)
         return stats
 
     # Nodos de bienvenida (submenús)
-    async def ensure_root_node(self, chat_id):
-        doc = await self.db.welcome_nodes.find_one({"chat_id": chat_id, "parent_id": None})
-        if doc:
-            return int(doc["node_id"])
-
+    async def _upsert_root_node(self, chat_id) -> Dict[str, Any]:
+        """Crea el nodo raíz de forma atómica; si otro proceso ganó la carrera devuelve el suyo"""
         ws = await self.db.welcome_settings.find_one({"chat_id": chat_id})
         text = ws.get("message") if ws and ws.get("message") else DEFAULT_WELCOME_MESSAGE
         parse_mode = ws.get("parse_mode") if ws and ws.get("parse_mode") else "HTML"
         image_url = ws.get("image_url") if ws else None
 
         new_id = await self._get_next_sequence("welcome_node_id")
-        await self.db.welcome_nodes.insert_one({
-            "node_id": new_id,
-            "chat_id": chat_id,
-            "parent_id": None,
-            "text": text,
-            "image_url": image_url,
-            "parse_mode": parse_mode,
-            "buttons": []
-        })
-        return new_id
+        try:
+            return await self.db.welcome_nodes.find_one_and_update(
+                {"chat_id": chat_id, "parent_id": None},
+                {"$setOnInsert": {
+                    "node_id": new_id,
+                    "text": text,
+                    "image_url": image_url,
+                    "parse_mode": parse_mode,
+                    "buttons": []
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return await self.db.welcome_nodes.find_one({"chat_id": chat_id, "parent_id": None})
+        finally:
+            self.invalidate_tree(chat_id)
+
+    async def ensure_root_node(self, chat_id):
+        doc = await self.db.welcome_nodes.find_one({"chat_id": chat_id, "parent_id": None}, {"node_id": 1})
+        if not doc:
+            doc = await self._upsert_root_node(chat_id)
+        return int(doc["node_id"])
 
     async def get_root_node(self, chat_id):
         doc = await self.db.welcome_nodes.find_one({"chat_id": chat_id, "parent_id": None})
         if not doc:
-            await self.ensure_root_node(chat_id)
-            doc = await self.db.welcome_nodes.find_one({"chat_id": chat_id, "parent_id": None})
+            doc = await self._upsert_root_node(chat_id)
         return self._node_doc_to_dict(doc) if doc else None
 
     async def get_node(self, node_id: int):
+        # Si el árbol de su chat está en memoria no hace falta ir a Mongo
+        chat_id = self._node_chat_index.get(node_id)
+        if chat_id is not None:
+            tree = self._tree_cache.get(chat_id)
+            if tree is not None and node_id in tree:
+                return tree.get(node_id)
         doc = await self.db.welcome_nodes.find_one({"node_id": node_id})
         return self._node_doc_to_dict(doc) if doc else None
 
     async def get_child_nodes(self, chat_id: int, parent_id: int):
-        cursor = self.db.welcome_nodes.find({"chat_id": chat_id, "parent_id": parent_id}).sort("node_id", ASCENDING)
-        out = []
-        async for doc in cursor:
-            out.append(self._node_doc_to_dict(doc))
-        return out
+        tree = await self.load_tree(chat_id)
+        return tree.children_of(parent_id)
 
     async def update_node_text(self, node_id: int, text: str):
-        await self.db.welcome_nodes.update_one({"node_id": node_id}, {"$set": {"text": text}})
+        await self.db.welcome_nodes.update_one({"node_id": node_id}, {"$set": {"text": text}, "$inc": {"version": 1}})
+        self._invalidate_welcome_node(node_id)
 
     async def update_node_image(self, node_id: int, image_url):
-        await self.db.welcome_nodes.update_one({"node_id": node_id}, {"$set": {"image_url": image_url}})
+        # Una URL nueva invalida el file_id capturado para la anterior
+        await self.db.welcome_nodes.update_one(
+            {"node_id": node_id},
+            {"$set": {"image_url": image_url}, "$unset": {"image_file_id": ""}, "$inc": {"version": 1}}
+        )
+        self._invalidate_welcome_node(node_id)
+
+    async def set_node_image_file_id(self, node_id: int, image_url: str, file_id: Optional[str]):
+        """Guarda (o borra con None) el file_id, solo si la imagen del nodo sigue siendo image_url"""
+        update = {"$set": {"image_file_id": file_id}} if file_id else {"$unset": {"image_file_id": ""}}
+        result = await self.db.welcome_nodes.update_one({"node_id": node_id, "image_url": image_url}, update)
+        if result.modified_count:
+            self._invalidate_welcome_node(node_id)
 
     async def update_node_parse_mode(self, node_id: int, parse_mode: str):
-        await self.db.welcome_nodes.update_one({"node_id": node_id}, {"$set": {"parse_mode": parse_mode}})
+        await self.db.welcome_nodes.update_one({"node_id": node_id}, {"$set": {"parse_mode": parse_mode}, "$inc": {"version": 1}})
+        self._invalidate_welcome_node(node_id)
 
     async def add_child_node(self, chat_id: int, parent_id: int, text: str, parse_mode: str = 'HTML', image_url=None):
         new_id = await self._get_next_sequence("welcome_node_id")
@@ -320,22 +661,25 @@ class DatabaseManager:
             "parse_mode": parse_mode,
             "buttons": []
         })
+        self.invalidate_tree(chat_id)
         return new_id
 
     async def get_node_buttons(self, node_id: int):
-        doc = await self.db.welcome_nodes.find_one({"node_id": node_id}, {"buttons": 1})
-        if not doc:
+        node = await self.get_node(node_id)
+        if not node:
             return []
-        buttons = doc.get("buttons") or []
+        buttons = node.get("buttons") or []
         if isinstance(buttons, str):
             try:
                 return json.loads(buttons)
             except:
                 return []
-        return buttons
+        # Copia: el nodo puede venir del árbol cacheado y los llamadores modifican las filas
+        return [list(row) for row in buttons]
 
     async def set_node_buttons(self, node_id: int, buttons):
-        await self.db.welcome_nodes.update_one({"node_id": node_id}, {"$set": {"buttons": buttons}})
+        await self.db.welcome_nodes.update_one({"node_id": node_id}, {"$set": {"buttons": buttons}, "$inc": {"version": 1}})
+        self._invalidate_welcome_node(node_id)
 
     async def clear_node_buttons(self, node_id: int):
         await self.set_node_buttons(node_id, [])
@@ -349,16 +693,70 @@ class DatabaseManager:
                 new_buttons.append(new_row)
         await self.set_node_buttons(parent_id, new_buttons)
 
+    async def _subtree_node_ids(self, chat_id: int, node_id: int, session=None) -> Tuple[Optional[Dict[str, Any]], List[int]]:
+        """
+        Nodo y todos sus descendientes en una sola agregación ($graphLookup sobre parent_id).
+        Restringir por chat_id permite usar el índice (chat_id, parent_id) en cada salto.
+        """
+        docs = await self.db.welcome_nodes.aggregate([
+            {"$match": {"node_id": node_id, "chat_id": chat_id}},
+            {"$graphLookup": {
+                "from": "welcome_nodes",
+                "startWith": "$node_id",
+                "connectFromField": "node_id",
+                "connectToField": "parent_id",
+                "as": "descendants",
+                "restrictSearchWithMatch": {"chat_id": chat_id}
+            }},
+            {"$project": {"_id": 0, "node_id": 1, "chat_id": 1, "parent_id": 1, "descendants.node_id": 1}}
+        ], session=session).to_list(1)
+        if not docs:
+            return None, []
+        doc = docs[0]
+        return doc, [node_id] + [d["node_id"] for d in doc.get("descendants", [])]
+
+    async def _pull_node_button(self, parent_id: int, child_id: int, session=None):
+        """Quita de forma atómica los botones del padre que apuntan a child_id (y las filas que quedan vacías)"""
+        keep = {"$not": [{"$and": [
+            {"$eq": ["$$b.type", "node"]},
+            {"$eq": [{"$convert": {"input": "$$b.node_id", "to": "int", "onError": None, "onNull": None}}, child_id]}
+        ]}]}
+        result = await self.db.welcome_nodes.update_one(
+            {"node_id": parent_id, "buttons": {"$type": "array"}},
+            [{"$set": {
+                "buttons": {"$filter": {
+                    "input": {"$map": {
+                        "input": "$buttons",
+                        "as": "row",
+                        "in": {"$filter": {"input": "$$row", "as": "b", "cond": keep}}
+                    }},
+                    "as": "row",
+                    "cond": {"$gt": [{"$size": "$$row"}, 0]}
+                }},
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+            }}],
+            session=session
+        )
+        return result.matched_count
+
     async def delete_node_recursive(self, node_id: int):
-        node = await self.get_node(node_id)
-        if not node:
+        known = await self.get_node(node_id)
+        if not known or known['parent_id'] is None:
+            return  # no existe o es la raíz: no se borra
+
+        async def _delete(session):
+            node, subtree = await self._subtree_node_ids(known['chat_id'], node_id, session)
+            if not node or node.get("parent_id") is None:
+                return node, 0
+            pulled = await self._pull_node_button(node["parent_id"], node_id, session)
+            await self.db.welcome_nodes.delete_many({"node_id": {"$in": subtree}}, session=session)
+            return node, pulled
+
+        node, pulled = await self._run_in_transaction(_delete)
+        if not node or node.get("parent_id") is None:
             return
-        if node['parent_id'] is None:
-            return  # no borrar raíz
-
-        children = await self.get_child_nodes(node['chat_id'], node_id)
-        for ch in children:
-            await self.delete_node_recursive(ch['id'])
-
-        await self.remove_button_pointing_to_node(node['parent_id'], node_id)
-        await self.db.welcome_nodes.delete_one({"node_id": node_id})
+        if not pulled:
+            # Botones guardados como JSON en texto (formato antiguo): lectura-modificación-escritura
+            await self.remove_button_pointing_to_node(node["parent_id"], node_id)
+        self._invalidate_welcome_node(node["parent_id"])
+        self.invalidate_tree(node["chat_id"])
@@ -0,0 +1,93 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import logger
+
+# Emojis premium integrados: código -> (emoji normal, id de custom emoji o None)
+DEFAULT_PREMIUM_EMOJIS: Dict[str, Tuple[str, Optional[str]]] = {
+    ':crown_premium:': ('👑', '5769547529993588669'),
+    ':crown_gold:': ('👑', '5895592506459950634'),
+    ':plus_premium:': ('➕', '5393194986252542669'),
+    ':five_premium:': ('5️⃣', '5391197405553107640'),
+    ':zero_premium:': ('0️⃣', '5393480373944459905'),
+    ':cocktail_premium:': ('🍸', '5217449524410199951'),
+    ':globe_premium:': ('🌐', '5895665559558689321'),
+    ':free_premium:': ('🆓', '5406756500108501710'),
+    ':down_arrow_premium:': ('⬇️', '5406745015365943482'),
+    ':point_left_premium:': ('👈', '6319056439096644016'),
+    ':tongue_premium:': ('😛', '5413341178894493509'),
+    ':check_premium:': ('✔️', '5206607081334906820'),
+    ':wow_premium:': ('😮', '5391090636961099009'),
+    ':fire_premium:': ('🔥', '5469986291380657891'),
+    ':star_premium:': ('⭐', '5469654991199578830'),
+    ':rocket_premium:': ('🚀', '5469741319743707297'),
+    ':diamond_premium:': ('💎', '5469741319743707298'),
+    ':party_premium:': ('🎉', '5469741319743707299'),
+    ':heart_premium:': ('❤️', '5469741319743707300'),
+    ':lightning_premium:': ('⚡', '5469741319743707301'),
+    ':trophy_premium:': ('🏆', '5469741319743707302'),
+    ':gem_premium:': ('💠', '5469741319743707303'),
+    ':magic_premium:': ('✨', '5469741319743707304'),
+    # Usados en paneles pero sin custom emoji asignado: se muestran como emoji normal
+    ':gear_premium:': ('⚙️', None),
+    ':calendar_premium:': ('📅', None),
+}
+
+# Cualquier cosa con forma de código de emoji (para avisar de códigos desconocidos)
+CODE_RE = re.compile(r":[a-z][a-z0-9_]*:")
+
+
+def _markdown_form(emoji: str, emoji_id: Optional[str]) -> str:
+    return f"![{emoji}](tg://emoji?id={emoji_id})" if emoji_id else emoji
+
+
+class EmojiRegistry:
+    """
+    Registro de emojis premium: valores integrados + colección 'premium_emojis'.
+    Se compila en una sola regex para sustituir todos los códigos en una pasada.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.emojis: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._pattern: Optional[re.Pattern] = None
+        self._markdown: Dict[str, str] = {}
+        self._fallback: Dict[str, str] = {}
+        self.load([])
+
+    def load(self, docs: Iterable[dict]):
+        """Fusiona los documentos de Mongo ({code, emoji, emoji_id}) con los integrados y recompila"""
+        emojis = dict(DEFAULT_PREMIUM_EMOJIS)
+        for doc in docs:
+            code = doc.get("code")
+            if not code or not doc.get("emoji"):
+                continue
+            emojis[code] = (doc["emoji"], doc.get("emoji_id") or None)
+
+        # Alternativas más largas primero para que un código nunca eclipse a otro que lo contiene
+        codes = sorted(emojis, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(c) for c in codes))
+        self._markdown = {c: _markdown_form(e, eid) for c, (e, eid) in emojis.items()}
+        self._fallback = {c: e for c, (e, _) in emojis.items()}
+        self.emojis = emojis
+        self.version += 1
+        logger.info(f"Registro de emojis premium cargado: {len(emojis)} códigos (versión {self.version})")
+
+    def replace(self, text: str, parse_mode: Optional[str] = "MarkdownV2") -> str:
+        if not text or ":" not in text:
+            return text
+        table = self._markdown if parse_mode and parse_mode.lower().startswith("markdown") else self._fallback
+        return self._pattern.sub(lambda m: table[m.group(0)], text)
+
+    def unknown_codes(self, text: str) -> List[str]:
+        """Códigos con forma de emoji premium que no están registrados"""
+        if not text:
+            return []
+        seen = []
+        for code in CODE_RE.findall(text):
+            if code not in self.emojis and code not in seen:
+                seen.append(code)
+        return seen
+
+
+emoji_registry = EmojiRegistry()
@@ -0,0 +1,68 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from cache import TTLCache
+
+
+def buttons_to_list(buttons) -> List[list]:
+    """
+    Normaliza el campo 'buttons' para que siempre sea una lista de listas.
+    Acepta: None, str (JSON), list. Cualquier otro tipo → [].
+    """
+    if not buttons:
+        return []
+    if isinstance(buttons, str):
+        try:
+            parsed = json.loads(buttons)
+            return parsed if isinstance(parsed, list) else []
+        except Exception:
+            return []
+    if isinstance(buttons, list):
+        return buttons
+    return []
+
+
+def build_node_keyboard(node: Dict[str, Any]) -> Optional[InlineKeyboardMarkup]:
+    rows = []
+    for row in buttons_to_list(node.get('buttons')):
+        rb = []
+        for b in row:
+            if b.get('type') == 'url' and b.get('url'):
+                rb.append(InlineKeyboardButton(b.get('text', 'Abrir'), url=b['url']))
+            elif b.get('type') == 'node' and b.get('node_id'):
+                rb.append(InlineKeyboardButton(b.get('text', 'Ver'), callback_data=f"wb_{b['node_id']}"))
+        if rb:
+            rows.append(rb)
+
+    if node.get('parent_id'):
+        rows.append([
+            InlineKeyboardButton("◀️ Atrás", callback_data=f"wb_{node['parent_id']}"),
+            InlineKeyboardButton("🏠 Inicio", callback_data=f"wb_home_{node['chat_id']}")
+        ])
+    elif rows:
+        rows.append([InlineKeyboardButton("🏠 Inicio", callback_data=f"wb_home_{node['chat_id']}")])
+
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
+# Teclados por (node_id, versión): la versión sube con cada escritura del nodo,
+# así que el mismo objeto (inmutable) se reutiliza hasta que cambian sus botones
+_keyboard_cache = TTLCache(maxsize=4096, ttl=24 * 3600)
+_MISSING = object()
+
+
+def get_node_keyboard(node: Dict[str, Any]) -> Optional[InlineKeyboardMarkup]:
+    if node.get('id') is None:
+        return build_node_keyboard(node)
+    key = (node['id'], node.get('version', 0))
+    markup = _keyboard_cache.get(key, _MISSING)
+    if markup is _MISSING:
+        markup = build_node_keyboard(node)
+        _keyboard_cache.set(key, markup)
+    return markup
+
+
+def cache_stats() -> dict:
+    return _keyboard_cache.stats()
@@ -1,15 +1,36 @@
 import asyncio
+import hmac
+import multiprocessing
+import secrets
 import aiohttp
 import aiohttp.web
 from datetime import datetime
+from telegram import Update
 from telegram.constants import ParseMode
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ChatMemberHandler, MessageHandler, filters, ContextTypes
 
-from config import BOT_TOKEN, logger, ADMIN_ID
+from config import (
+    BOT_TOKEN, logger, ADMIN_ID, OUTBOUND_GLOBAL_RATE, OUTBOUND_GROUP_RATE_PER_MINUTE,
+    OUTBOUND_GROUP_BURST, OUTBOUND_SHED_THRESHOLD, UPDATE_MODE, WEBHOOK_URL, WEBHOOK_PATH,
+    WEBHOOK_SECRET, WEBHOOK_MAX_QUEUE, CONVERSATION_STATE_BACKEND, CONVERSATION_STATE_SIZE,
+    CONVERSATION_STATE_TTL, UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, SHARD_WORKERS, SHARD_SOCKET,
+    SHARD_READY_TIMEOUT, SHARD_METRICS_PORT
+)
 from db_manager import DatabaseManager
 from commands import CommandHandlers
 from messages import MessageHandlers
 from callbacks import CallbackHandlers
+from conversation_state import MemoryStateStore, MongoStateStore
+from update_processor import ChatOrderedUpdateProcessor
+from sharding import ShardIngress, run_worker_feed
+from scheduler import OutboundScheduler, PRIORITY_NOTIFICATION
+from emoji_registry import emoji_registry
+from admin_cache import admin_cache
+from mongo_profiler import mongo_profiler
+from screens import prerender_all
+from metrics import registry, observed, InstrumentedRequest
+import keyboards
+import templates
 
 class KeepAliveService:
     def __init__(self, url: str = None, interval: int = 840):  # 14 minutos
@@ -51,16 +72,72 @@ async def health_check(request):
         "service": "telegram-bot-premium"
     })
 
-async def setup_health_server():
-    """Configura un servidor HTTP simple para health checks"""
+async def metrics_endpoint(request):
+    return aiohttp.web.Response(
+        body=registry.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+def application_update_sink(application: Application):
+    """(submit, backlog) para entregar el JSON de un update a application.update_queue"""
+    processor = application.update_processor
+
+    async def submit(data: dict):
+        update = Update.de_json(data, application.bot)
+        if update:
+            await application.update_queue.put(update)
+
+    def backlog() -> int:
+        # En modo concurrente la cola se vacía al instante; lo pendiente está en el procesador
+        pending = application.update_queue.qsize()
+        if isinstance(processor, ChatOrderedUpdateProcessor):
+            pending += processor.backlog()
+        return pending
+
+    return submit, backlog
+
+def make_webhook_handler(secret_token: str, submit, backlog):
+    """Endpoint de updates de Telegram: valida el secreto y entrega el JSON a submit"""
+    async def webhook(request):
+        received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(received, secret_token):
+            return aiohttp.web.Response(status=403)
+
+        # Contrapresión: si la cola está llena Telegram reintentará más tarde
+        if backlog() >= WEBHOOK_MAX_QUEUE:
+            logger.warning("Cola de updates llena, se rechaza webhook con 503")
+            return aiohttp.web.Response(status=503)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return aiohttp.web.Response(status=400)
+        if not isinstance(data, dict):
+            return aiohttp.web.Response(status=400)
+
+        # Un JSON que no es un Update válido no debe dar 500: Telegram lo reintentaría sin fin
+        try:
+            await submit(data)
+        except Exception as e:
+            logger.error(f"Update de webhook no válido (update_id={data.get('update_id')}): {e}")
+            return aiohttp.web.Response(status=400)
+        return aiohttp.web.Response()
+
+    return webhook
+
+async def setup_health_server(webhook_handler=None, port: int = None):
+    """Configura un servidor HTTP simple para health checks y /metrics (y el webhook si se indica)"""
     app = aiohttp.web.Application()
     app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics_endpoint)
+    if webhook_handler is not None:
+        app.router.add_post(WEBHOOK_PATH, webhook_handler)
 
     runner = aiohttp.web.AppRunner(app)
     await runner.setup()
 
     import os
-    port = int(os.environ.get('PORT', 8080))
+    port = port or int(os.environ.get('PORT', 8080))
 
     site = aiohttp.web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
@@ -68,22 +145,70 @@ async def setup_health_server():
 
     return runner
 
+def webhook_secret() -> str:
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    logger.warning("WEBHOOK_SECRET no configurado: se usa un secreto aleatorio (solo válido para una instancia)")
+    return secrets.token_urlsafe(32)
+
 class TelegramBot:
-    def __init__(self):
+    def __init__(self, worker_id: int = None, worker_count: int = 1):
         self.application = None
+        # Modo multiproceso: este proceso es un worker alimentado por el ingress (ver sharding.py)
+        self.worker_id = worker_id
         self.db = DatabaseManager()
+        if worker_id is not None and worker_id > 0:
+            # Una sola reconstrucción periódica del rollup: la del worker 0
+            self.db.stats_rollup.reconcile_interval = 0
         self.keep_alive = KeepAliveService()
         self.health_server = None
+        self.update_processor = None
+        self.scheduler = OutboundScheduler(
+            # El límite global de Telegram es por bot: se reparte entre los workers
+            global_rate=OUTBOUND_GLOBAL_RATE / worker_count,
+            group_rate_per_minute=OUTBOUND_GROUP_RATE_PER_MINUTE,
+            group_burst=OUTBOUND_GROUP_BURST,
+            shed_threshold=OUTBOUND_SHED_THRESHOLD
+        )
+        # Con varias instancias el estado de los flujos del panel debe compartirse en Mongo
+        if CONVERSATION_STATE_BACKEND == "mongo":
+            self.input_state = MongoStateStore(self.db.db.conversation_state, CONVERSATION_STATE_SIZE, CONVERSATION_STATE_TTL)
+        else:
+            self.input_state = MemoryStateStore(CONVERSATION_STATE_SIZE, CONVERSATION_STATE_TTL)
         
         self.command_handler = CommandHandlers(self.db)
-        self.message_handler = MessageHandlers(self.db)
-        self.callback_handler = CallbackHandlers(self.db, self.message_handler)
+        self.message_handler = MessageHandlers(self.db, self.scheduler, self.input_state)
+        self.callback_handler = CallbackHandlers(self.db, self.message_handler, self.scheduler)
+
+    def register_metrics(self):
+        """Componentes cuyo metrics() se vuelca como gauges en /metrics (se leen al hacer scrape)"""
+        application = self.application
+        registry.register_collector("updates", lambda: {
+            "queue_depth": application.update_queue.qsize(),
+            **(self.update_processor.metrics() if self.update_processor else {})
+        })
+        registry.register_collector("scheduler", self.scheduler.metrics)
+        registry.register_collector("stats_buffer", self.db.stats_buffer.metrics)
+        registry.register_collector("stats_rollup", self.db.stats_rollup.metrics)
+        registry.register_collector("admin_cache", admin_cache.metrics)
+        registry.register_collector("mongo", mongo_profiler.metrics)
+        registry.register_collector("input_state", self.input_state.metrics)
+        registry.register_collector("callback_router", lambda: {
+            k: v for k, v in self.callback_handler.router.metrics().items() if k != "routes"
+        })
+        registry.register_collector("cache", lambda: {
+            **self.db.cache_stats(),
+            "keyboard": keyboards.cache_stats(),
+            "template": templates.cache_stats()
+        })
 
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error en el bot: {context.error}")
         if update and hasattr(update, 'effective_user'):
             try:
-                await context.bot.send_message(
+                await self.scheduler.call(
+                    PRIORITY_NOTIFICATION, context.bot.send_message,
+                    droppable=True,
                     chat_id=ADMIN_ID,
                     text=f"❌ **Error en el bot:**\n\n`{str(context.error)}`",
                     parse_mode=ParseMode.MARKDOWN
@@ -93,33 +218,64 @@ class TelegramBot:
 
     async def run(self):
         await self.db.initialize_db()
+        await self.input_state.initialize()
+        emoji_registry.load(await self.db.get_premium_emojis())
+        prerender_all()
 
-        # Inicia el servidor de salud
-        self.health_server = await setup_health_server()
+        worker_mode = self.worker_id is not None
+        webhook_mode = UPDATE_MODE == "webhook" and not worker_mode
+        # Mide cada llamada a la Bot API por método (mismo tamaño de pool que el de PTB por defecto)
+        builder = Application.builder().token(BOT_TOKEN).request(InstrumentedRequest(connection_pool_size=256))
+        if UPDATE_CONCURRENCY > 1:
+            # Un send_photo lento en un grupo no debe frenar al resto; dentro de cada chat se mantiene el orden
+            self.update_processor = ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_PENDING)
+            builder = builder.concurrent_updates(self.update_processor)
+        if webhook_mode or worker_mode:
+            # Sin Updater: los updates llegan por el servidor aiohttp (o el ingress) a application.update_queue
+            builder = builder.updater(None)
+        self.application = builder.build()
 
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        # Inicia el servidor de salud (y el endpoint de webhook en modo webhook); en los workers lo sirve el ingress
+        secret_token = None
+        if webhook_mode:
+            secret_token = webhook_secret()
+            self.health_server = await setup_health_server(
+                make_webhook_handler(secret_token, *application_update_sink(self.application))
+            )
+        elif not worker_mode:
+            self.health_server = await setup_health_server()
+        elif SHARD_METRICS_PORT:
+            # Cada worker expone sus propias métricas en un puerto consecutivo
+            self.health_server = await setup_health_server(port=SHARD_METRICS_PORT + self.worker_id)
+        self.register_metrics()
 
         # Comandos
-        self.application.add_handler(CommandHandler("start", self.command_handler.start))
-        self.application.add_handler(CommandHandler("admin", self.command_handler.admin_command))
-        self.application.add_handler(CommandHandler("premiumemojis", self.command_handler.premium_emojis_command))
-        self.application.add_handler(CommandHandler("setwelcometopic", self.command_handler.set_welcome_topic))
-        self.application.add_handler(CommandHandler("clearwelcometopic", self.command_handler.clear_welcome_topic))
+        self.application.add_handler(CommandHandler("start", observed(self.command_handler.start)))
+        self.application.add_handler(CommandHandler("admin", observed(self.command_handler.admin_command)))
+        self.application.add_handler(CommandHandler("premiumemojis", observed(self.command_handler.premium_emojis_command)))
+        self.application.add_handler(CommandHandler("setemoji", observed(self.command_handler.set_emoji_command)))
+        self.application.add_handler(CommandHandler("delemoji", observed(self.command_handler.del_emoji_command)))
+        self.application.add_handler(CommandHandler("setwelcometopic", observed(self.command_handler.set_welcome_topic)))
+        self.application.add_handler(CommandHandler("clearwelcometopic", observed(self.command_handler.clear_welcome_topic)))
 
         # Mensajes y callbacks
         self.application.add_handler(MessageHandler(
             filters.StatusUpdate.NEW_CHAT_MEMBERS, 
-            self.message_handler.handle_new_chat_member
+            observed(self.message_handler.handle_new_chat_member)
         ))
         self.application.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND, 
-            self.message_handler.handle_text_input
+            observed(self.message_handler.handle_text_input)
         ))
         self.application.add_handler(MessageHandler(
             filters.PHOTO,
-            self.message_handler.handle_photo_input
+            observed(self.message_handler.handle_photo_input)
+        ))
+        self.application.add_handler(CallbackQueryHandler(observed(self.callback_handler.handle_callback_query)))
+        self.application.add_handler(ChatMemberHandler(
+            observed(self.message_handler.handle_chat_member_update),
+            ChatMemberHandler.ANY_CHAT_MEMBER
         ))
-        self.application.add_handler(CallbackQueryHandler(self.callback_handler.handle_callback_query))
 
         # Agrega el manejador de errores
         self.application.add_error_handler(self.error_handler)
@@ -127,28 +283,112 @@ class TelegramBot:
         logger.info("🚀 Iniciando bot premium con soporte para emojis...")
         await self.application.initialize()
         await self.application.start()
-        await self.application.updater.start_polling()
 
-        # Inicia el keep-alive en segundo plano
-        keep_alive_task = asyncio.create_task(self.keep_alive.start())
+        keep_alive_task = None
+        feed_task = None
+        if worker_mode:
+            _, backlog = application_update_sink(self.application)
+            feed_task = asyncio.create_task(run_worker_feed(
+                self.application, self.db, SHARD_SOCKET, self.worker_id, backlog, WEBHOOK_MAX_QUEUE
+            ))
+            logger.info(f"Worker {self.worker_id} conectado al ingress")
+        elif webhook_mode:
+            await self.application.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"🔗 Webhook configurado en {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            # ALL_TYPES incluye chat_member, que Telegram no envía por defecto (caché de administradores)
+            await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            # El keep-alive solo hace falta con polling; con webhook el tráfico entrante mantiene vivo el servicio
+            keep_alive_task = asyncio.create_task(self.keep_alive.start())
+
+        # Inicia el vaciado de estadísticas en segundo plano
+        stats_flush_task = asyncio.create_task(self.db.stats_buffer.start())
+        # Reconstrucción exacta periódica del rollup de estadísticas generales
+        stats_rollup_task = asyncio.create_task(self.db.stats_rollup.start())
 
         try:
-            await asyncio.Event().wait()
+            # Un worker termina cuando el ingress cierra su conexión
+            await (feed_task if feed_task else asyncio.Event().wait())
         except KeyboardInterrupt:
             logger.info("Deteniendo bot...")
         finally:
             self.keep_alive.stop()
-            if not keep_alive_task.done():
+            if keep_alive_task and not keep_alive_task.done():
                 keep_alive_task.cancel()
+            if feed_task and not feed_task.done():
+                feed_task.cancel()
+
+            # Oleadas de altas aún en su ventana: se envían antes de vaciar estadísticas y parar el planificador
+            await self.message_handler.flush_pending_joins()
+
+            if not stats_flush_task.done():
+                stats_flush_task.cancel()
+            await self.db.stats_rollup.stop()
+            if not stats_rollup_task.done():
+                stats_rollup_task.cancel()
+            await self.db.stats_buffer.stop()
+            await self.scheduler.stop()
 
             if self.health_server:
                 await self.health_server.cleanup()
 
-            await self.application.updater.stop()
+            if self.application.updater:
+                await self.application.updater.stop()
             await self.application.stop()
             await self.application.shutdown()
 
+def run_worker(worker_id: int, worker_count: int):
+    """Proceso worker del modo multiproceso: un TelegramBot completo con sus propias cachés"""
+    asyncio.run(TelegramBot(worker_id, worker_count).run())
+
+async def run_sharded():
+    """Ingress del modo multiproceso: recibe los updates y los reparte por chat_id entre los workers"""
+    ctx = multiprocessing.get_context("spawn")
+    ingress = ShardIngress(
+        BOT_TOKEN, SHARD_WORKERS, SHARD_SOCKET,
+        spawn=lambda i: ctx.Process(target=run_worker, args=(i, SHARD_WORKERS), name=f"bot-worker-{i}", daemon=True)
+    )
+    await ingress.start()
+    await ingress.wait_ready(SHARD_READY_TIMEOUT)
+    registry.register_collector("ingress", ingress.metrics)
+
+    keep_alive = KeepAliveService()
+    keep_alive_task = None
+    if UPDATE_MODE == "webhook":
+        secret_token = webhook_secret()
+        health_server = await setup_health_server(make_webhook_handler(secret_token, ingress.route, ingress.backlog))
+        await ingress.api(
+            "setWebhook",
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES
+        )
+        logger.info(f"🔗 Webhook configurado en {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        source = asyncio.Event().wait()
+    else:
+        health_server = await setup_health_server()
+        keep_alive_task = asyncio.create_task(keep_alive.start())
+        source = ingress.poll()
+
+    try:
+        await source
+    except KeyboardInterrupt:
+        logger.info("Deteniendo ingress...")
+    finally:
+        keep_alive.stop()
+        if keep_alive_task and not keep_alive_task.done():
+            keep_alive_task.cancel()
+        await health_server.cleanup()
+        await ingress.stop()
+
 async def main():
+    if SHARD_WORKERS > 1:
+        await run_sharded()
+        return
     bot = TelegramBot()
     await bot.run()
 
@@ -1,42 +1,60 @@
-import json
+import asyncio
+import time
+from collections import deque
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
 
-from config import ADMIN_ID, logger
-from helpers import format_welcome_message, add_premium_emojis
+from config import (
+    ADMIN_ID, logger, DEFAULT_RAID_DIGEST_MESSAGE, JOIN_COALESCE_WINDOW_MS, JOIN_COALESCE_MAX_BATCH,
+    JOIN_RAID_THRESHOLD, JOIN_RAID_INTERVAL, JOIN_RAID_WINDOW_MS, RAID_DIGEST_MAX_MENTIONS,
+    CONVERSATION_STATE_SIZE, CONVERSATION_STATE_TTL
+)
+from conversation_state import MemoryStateStore
+from helpers import format_welcome_message, add_premium_emojis, is_remote_url, check_admin_permissions
+from screens import StaticScreen
+from templates import get_text_template, render_node_text
+from keyboards import get_node_keyboard
+from emoji_registry import emoji_registry
+from admin_cache import admin_cache
+from scheduler import OutboundScheduler, PRIORITY_WELCOME, PRIORITY_ADMIN, PRIORITY_NOTIFICATION
+
+
+# Pantallas estáticas: se renderizan una vez (ver screens.py)
+BOT_ADDED_SCREEN = StaticScreen("""
+:crown_premium: ¡Hola! Soy tu nuevo bot administrador premium :rocket_premium:
+
+:star_premium: Los administradores pueden configurarme usando /admin
+
+:party_premium: ¡Gracias por añadirme al grupo!
+""")
+
+WELCOME_UPDATED_SCREEN = StaticScreen("""
+:check_premium: **Mensaje de bienvenida actualizado\\.**
+
+:star_premium: ¿Deseas añadir botones?
+""")
+
+SUBMENU_CREATED_SCREEN = StaticScreen("""
+:check_premium: **Submenú creado\\.**
+
+:star_premium: ¿Deseas añadir botones dentro de este submenú?
+""")
 
 
 class MessageHandlers:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, scheduler=None, input_state=None):
         self.db = db_manager
-        self.waiting_for_input = {}
-
-    def _build_keyboard_from_node(self, node: dict):
-        rows = []
-        try:
-            buttons = json.loads(node.get('buttons') or '[]') if isinstance(node.get('buttons'), str) else (node.get('buttons') or [])
-        except:
-            buttons = []
-        for row in buttons:
-            rb = []
-            for b in row:
-                if b.get('type') == 'url' and b.get('url'):
-                    rb.append(InlineKeyboardButton(b.get('text', 'Abrir'), url=b['url']))
-                elif b.get('type') == 'node' and b.get('node_id'):
-                    rb.append(InlineKeyboardButton(b.get('text', 'Ver'), callback_data=f"wb_{b['node_id']}"))
-            if rb:
-                rows.append(rb)
-        if node.get('parent_id'):
-            rows.append([
-                InlineKeyboardButton("◀️ Atrás", callback_data=f"wb_{node['parent_id']}"),
-                InlineKeyboardButton("🏠 Inicio", callback_data=f"wb_home_{node['chat_id']}")
-            ])
-        elif rows:
-            rows.append([InlineKeyboardButton("🏠 Inicio", callback_data=f"wb_home_{node['chat_id']}")])
-        return InlineKeyboardMarkup(rows) if rows else None
+        self.scheduler = scheduler or OutboundScheduler()
+        # Flujos de entrada de varios pasos abiertos por usuario (ver conversation_state.py)
+        self.input_state = input_state or MemoryStateStore(CONVERSATION_STATE_SIZE, CONVERSATION_STATE_TTL)
+        # Oleadas de altas pendientes por chat y marcas de tiempo para detectar raids
+        self._join_batches = {}
+        self._join_times = {}
+        self._join_times_swept = time.monotonic()
+        self._background_tasks = set()
 
     def _normalize_parse_mode(self, pm: str | None) -> str:
         if not pm:
@@ -54,6 +72,14 @@ class MessageHandlers:
         if update.message.new_chat_members:
             await self.send_welcome_message(update, context)
 
+    async def handle_chat_member_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # Mantiene al día la caché de administradores sin volver a pedir la lista completa
+        if update.chat_member:
+            admin_cache.apply_chat_member_update(update.chat_member)
+        if update.my_chat_member:
+            # Cambió el estado del propio bot en el chat: puede haber perdido acceso a la lista
+            admin_cache.invalidate(update.my_chat_member.chat.id)
+
     async def bot_added_to_group(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat = update.effective_chat
         user = update.effective_user
@@ -103,7 +129,8 @@ class MessageHandlers:
         formatted_notification = add_premium_emojis(notification_text, "MarkdownV2")
 
         try:
-            await context.bot.send_message(
+            await self.scheduler.call(
+                PRIORITY_NOTIFICATION, context.bot.send_message,
                 chat_id=ADMIN_ID,
                 text=formatted_notification,
                 reply_markup=reply_markup,
@@ -112,101 +139,218 @@ class MessageHandlers:
         except Exception as e:
             logger.error(f"Error enviando notificación al admin: {e}")
 
-        welcome_group_text = """
-:crown_premium: ¡Hola! Soy tu nuevo bot administrador premium :rocket_premium:
-
-:star_premium: Los administradores pueden configurarme usando /admin
-
-:party_premium: ¡Gracias por añadirme al grupo!
-"""
-        formatted_welcome = add_premium_emojis(welcome_group_text, "MarkdownV2")
-
-        await update.message.reply_text(
-            formatted_welcome,
-            parse_mode="MarkdownV2"
+        await self.scheduler.call(
+            PRIORITY_WELCOME, update.message.reply_text,
+            BOT_ADDED_SCREEN.text,
+            parse_mode="MarkdownV2",
+            chat_id_hint=update.effective_chat.id
         )
 
     async def send_welcome_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = update.effective_chat.id
         chat_title = update.effective_chat.title or "el grupo"
-        welcome_config = await self.db.get_welcome_settings(chat_id)
-        if not welcome_config or not welcome_config[1]:
+        members = [m for m in update.message.new_chat_members if m.id != context.bot.id]
+        if not members:
             return
 
-        await self.db.ensure_root_node(chat_id)
-        root = await self.db.get_root_node(chat_id)
-        pmode = self._normalize_parse_mode(root.get('parse_mode') or "HTML")
+        bundle = await self.db.get_welcome_bundle(chat_id)
+        if not bundle['enabled'] or not bundle['root']:
+            return
 
-        # Configuración de thread_id mejorada
-        configured_thread_id = await self.db.get_group_welcome_thread(chat_id)
         event_thread_id = getattr(update.message, "message_thread_id", None) if update.message else None
+
+        if JOIN_COALESCE_WINDOW_MS <= 0:
+            await self._flush_join_batch(context.bot, chat_id, {
+                'users': members, 'title': chat_title, 'thread_id': event_thread_id, 'raid': False
+            })
+            return
+
+        self._enqueue_join(context.bot, chat_id, chat_title, event_thread_id, members)
+
+    def _register_join_rate(self, chat_id: int, count: int) -> bool:
+        # Ventana deslizante de altas por chat; devuelve True si el chat está en modo raid
+        now = time.monotonic()
+        times = self._join_times.setdefault(chat_id, deque())
+        times.extend([now] * count)
+        while times and now - times[0] > JOIN_RAID_INTERVAL:
+            times.popleft()
+        raid = len(times) >= JOIN_RAID_THRESHOLD
+        # Como mucho una vez por intervalo: se olvidan los chats sin altas recientes
+        if now - self._join_times_swept > JOIN_RAID_INTERVAL:
+            self._join_times_swept = now
+            for other in list(self._join_times):
+                other_times = self._join_times[other]
+                while other_times and now - other_times[0] > JOIN_RAID_INTERVAL:
+                    other_times.popleft()
+                if not other_times:
+                    del self._join_times[other]
+        return raid
+
+    def _enqueue_join(self, bot, chat_id: int, chat_title: str, thread_id, members: list):
+        raid = self._register_join_rate(chat_id, len(members))
+        batch = self._join_batches.get(chat_id)
+        if batch is None:
+            batch = {'users': [], 'title': chat_title, 'thread_id': thread_id, 'raid': raid, 'bot': bot}
+            self._join_batches[chat_id] = batch
+            window = (JOIN_RAID_WINDOW_MS if raid else JOIN_COALESCE_WINDOW_MS) / 1000
+            batch['timer'] = self._spawn(self._flush_join_batch_later(bot, chat_id, batch, window))
+        batch['users'].extend(members)
+        batch['raid'] = batch['raid'] or raid
+
+        # Fuera de modo raid, una oleada grande se envía sin esperar a que cierre la ventana
+        if not batch['raid'] and len(batch['users']) >= JOIN_COALESCE_MAX_BATCH:
+            self._join_batches.pop(chat_id, None)
+            self._spawn(self._flush_join_batch(bot, chat_id, batch))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def flush_pending_joins(self):
+        """Al parar: envía ya las oleadas que esperan su ventana y espera los envíos en curso"""
+        batches, self._join_batches = self._join_batches, {}
+        for batch in batches.values():
+            batch['timer'].cancel()
+        for chat_id, batch in batches.items():
+            await self._flush_join_batch(batch['bot'], chat_id, batch)
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    async def _flush_join_batch_later(self, bot, chat_id: int, batch: dict, delay: float):
+        await asyncio.sleep(delay)
+        # Puede haberse enviado ya por tamaño
+        if self._join_batches.get(chat_id) is batch:
+            del self._join_batches[chat_id]
+            await self._flush_join_batch(bot, chat_id, batch)
+
+    async def _flush_join_batch(self, bot, chat_id: int, batch: dict):
+        users = batch['users']
+        if not users:
+            return
+        try:
+            bundle = await self.db.get_welcome_bundle(chat_id)
+            if not bundle['enabled'] or not bundle['root']:
+                return
+            await self._deliver_welcome(bot, chat_id, bundle, users, batch['title'], batch['thread_id'], batch['raid'])
+        except Exception as e:
+            logger.error(f"Error enviando mensaje de bienvenida: {e}")
+
+    async def _deliver_welcome(self, bot, chat_id: int, bundle: dict, users: list, chat_title: str, event_thread_id, raid: bool):
+        root = bundle['root']
+        pmode = self._normalize_parse_mode(bundle['parse_mode'])
+
+        # Configuración de thread_id mejorada
+        configured_thread_id = bundle['thread_id']
         message_thread_id = configured_thread_id if configured_thread_id is not None else event_thread_id
 
-        for new_member in update.message.new_chat_members:
-            if new_member.id == context.bot.id:
-                continue
-            message = format_welcome_message(root['text'] or "", new_member, chat_title, parse_mode=pmode)
-            reply_markup = self._build_keyboard_from_node(root)
+        if raid:
+            template = DEFAULT_RAID_DIGEST_MESSAGE.replace("{count}", str(len(users)))
+            mentioned = users[:RAID_DIGEST_MAX_MENTIONS]
+            message = get_text_template(template, pmode).render(mentioned, chat_title)
+        else:
+            template = root['text'] or ""
+            mentioned = users
+            message = render_node_text(root, mentioned, chat_title, pmode)
+        reply_markup = get_node_keyboard(root)
 
+        try:
+            if root.get('image_url'):
+                sent_message = await self.send_node_photo(
+                    PRIORITY_WELCOME, bot, root,
+                    chat_id=chat_id,
+                    caption=message,
+                    reply_markup=reply_markup,
+                    parse_mode=pmode,
+                    message_thread_id=message_thread_id
+                )
+                logger.info(f"Mensaje de bienvenida con imagen enviado. Chat: {chat_id}, Message ID: {sent_message.message_id}, Thread: {message_thread_id}, Miembros: {len(users)}")
+            else:
+                sent_message = await self.scheduler.call(
+                    PRIORITY_WELCOME, bot.send_message,
+                    chat_id=chat_id,
+                    text=message,
+                    reply_markup=reply_markup,
+                    parse_mode=pmode,
+                    message_thread_id=message_thread_id
+                )
+                logger.info(f"Mensaje de bienvenida sin imagen enviado. Chat: {chat_id}, Message ID: {sent_message.message_id}, Thread: {message_thread_id}, Miembros: {len(users)}")
+
+            await self.db.update_welcome_stats(chat_id, len(users))
+        except BadRequest as e:
+            low = str(e).lower()
+            if "can't parse entities" in low:
+                safe_message = format_welcome_message(template, mentioned, chat_title, parse_mode=None)
+                try:
+                    if root.get('image_url'):
+                        await self.send_node_photo(
+                            PRIORITY_WELCOME, bot, root,
+                            chat_id=chat_id,
+                            caption=safe_message,
+                            reply_markup=reply_markup,
+                            parse_mode=None,
+                            message_thread_id=message_thread_id
+                        )
+                    else:
+                        await self.scheduler.call(
+                            PRIORITY_WELCOME, bot.send_message,
+                            chat_id=chat_id,
+                            text=safe_message,
+                            reply_markup=reply_markup,
+                            parse_mode=None,
+                            message_thread_id=message_thread_id
+                        )
+                    await self.db.update_welcome_stats(chat_id, len(users))
+                    logger.info(f"Mensaje de bienvenida enviado sin formato (fallback). Chat: {chat_id}")
+                except Exception as e2:
+                    logger.error(f"Error fallback bienvenida: {e2}")
+            else:
+                logger.error(f"Error enviando bienvenida: {e}")
+        except Exception as e:
+            logger.error(f"Error enviando mensaje de bienvenida: {e}")
+
+    async def send_node_photo(self, priority: int, bot, node: dict, **kwargs):
+        """
+        Envía la imagen de un nodo. Si es una URL, guarda el file_id de Telegram tras el
+        primer envío y lo reutiliza después, sin que Telegram vuelva a descargar la URL.
+        """
+        image_url = node['image_url']
+        file_id = node.get('image_file_id')
+        if file_id:
             try:
-                if root.get('image_url'):
-                    sent_message = await context.bot.send_photo(
-                        chat_id=chat_id,
-                        photo=root['image_url'],
-                        caption=message,
-                        reply_markup=reply_markup,
-                        parse_mode=pmode,
-                        message_thread_id=message_thread_id
-                    )
-                    logger.info(f"Mensaje de bienvenida con imagen enviado. Chat: {chat_id}, Message ID: {sent_message.message_id}, Thread: {message_thread_id}")
-                else:
-                    sent_message = await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=message,
-                        reply_markup=reply_markup,
-                        parse_mode=pmode,
-                        message_thread_id=message_thread_id
-                    )
-                    logger.info(f"Mensaje de bienvenida sin imagen enviado. Chat: {chat_id}, Message ID: {sent_message.message_id}, Thread: {message_thread_id}")
-                    
-                await self.db.update_welcome_stats(chat_id)
+                return await self.scheduler.call(priority, bot.send_photo, photo=file_id, **kwargs)
             except BadRequest as e:
-                low = str(e).lower()
-                if "can't parse entities" in low:
-                    safe_message = format_welcome_message(root['text'] or "", new_member, chat_title, parse_mode=None)
-                    try:
-                        if root.get('image_url'):
-                            await context.bot.send_photo(
-                                chat_id=chat_id,
-                                photo=root['image_url'],
-                                caption=safe_message,
-                                reply_markup=reply_markup,
-                                parse_mode=None,
-                                message_thread_id=message_thread_id
-                            )
-                        else:
-                            await context.bot.send_message(
-                                chat_id=chat_id,
-                                text=safe_message,
-                                reply_markup=reply_markup,
-                                parse_mode=None,
-                                message_thread_id=message_thread_id
-                            )
-                        await self.db.update_welcome_stats(chat_id)
-                        logger.info(f"Mensaje de bienvenida enviado sin formato (fallback). Chat: {chat_id}")
-                    except Exception as e2:
-                        logger.error(f"Error fallback bienvenida: {e2}")
-                else:
-                    logger.error(f"Error enviando bienvenida: {e}")
-            except Exception as e:
-                logger.error(f"Error enviando mensaje de bienvenida: {e}")
+                if "file" not in str(e).lower():
+                    raise
+                # file_id caducado o de otro bot: se descarta y se vuelve a la URL
+                logger.warning(f"file_id cacheado inválido para el nodo {node.get('id')}: {e}")
+                await self.db.set_node_image_file_id(node['id'], image_url, None)
+
+        sent_message = await self.scheduler.call(priority, bot.send_photo, photo=image_url, **kwargs)
+        if is_remote_url(image_url) and sent_message and sent_message.photo:
+            await self.db.set_node_image_file_id(node['id'], image_url, sent_message.photo[-1].file_id)
+        return sent_message
+
+    async def _warn_unknown_emojis(self, update: Update, text: str):
+        # Avisar al guardar, no al renderizar: los códigos desconocidos se mostrarían tal cual
+        unknown = emoji_registry.unknown_codes(text)
+        if unknown:
+            await self.scheduler.call(
+                PRIORITY_ADMIN, update.message.reply_text,
+                f"⚠️ Códigos de emoji no reconocidos: {', '.join(unknown)}\n"
+                "Se mostrarán como texto. Revisa /premiumemojis o regístralos con /setemoji.",
+                chat_id_hint=update.effective_chat.id
+            )
 
     async def handle_text_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id if update.effective_user else None
-        if not user_id or user_id not in self.waiting_for_input:
+        # Solo los administradores abren flujos: el resto de mensajes de grupo no consulta el almacén
+        if not user_id or not check_admin_permissions(user_id):
+            return
+        data = await self.input_state.get(user_id)
+        if data is None:
             return
-
-        data = self.waiting_for_input[user_id]
         action = data['action']
 
         if action == "welcome_message":
@@ -215,48 +359,42 @@ class MessageHandlers:
             await self.db.update_welcome_message(chat_id, new_text)
             root_id = await self.db.ensure_root_node(chat_id)
             await self.db.update_node_text(root_id, new_text)
+            await self._warn_unknown_emojis(update, new_text)
             
-            success_text = """
-:check_premium: **Mensaje de bienvenida actualizado\\.**
-
-:star_premium: ¿Deseas añadir botones?
-"""
-            formatted_text = add_premium_emojis(success_text, "MarkdownV2")
-            
-            await update.message.reply_text(
-                formatted_text,
+            await self.scheduler.call(
+                PRIORITY_ADMIN, update.message.reply_text,
+                WELCOME_UPDATED_SCREEN.text,
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("➕ Botón URL", callback_data=f"node_add_url_{root_id}")],
                     [InlineKeyboardButton("➕ Submenú", callback_data=f"node_add_sub_{root_id}")],
                     [InlineKeyboardButton("No por ahora", callback_data=f"config_welcome_{chat_id}")]
                 ]),
-                parse_mode="MarkdownV2"
+                parse_mode="MarkdownV2",
+                chat_id_hint=update.effective_chat.id
             )
-            del self.waiting_for_input[user_id]
+            await self.input_state.delete(user_id)
 
         elif action == "button_text" and data.get('button_type') == 'url':
-            self.waiting_for_input[user_id]['button_text'] = update.message.text
-            self.waiting_for_input[user_id]['action'] = 'button_url'
-            await update.message.reply_text("Ahora envía la URL del botón (o 'cancel' para cancelar):")
+            await self.input_state.update(user_id, button_text=update.message.text, action='button_url')
+            await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "Ahora envía la URL del botón (o 'cancel' para cancelar):", chat_id_hint=update.effective_chat.id)
 
         elif action == "button_url":
             node_id = data['node_id']
             button_text = data.get('button_text', 'Abrir')
             button_url = update.message.text.strip()
             if button_url.lower() == 'cancel':
-                await update.message.reply_text("❌ Cancelado.")
-                del self.waiting_for_input[user_id]
+                await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "❌ Cancelado.", chat_id_hint=update.effective_chat.id)
+                await self.input_state.delete(user_id)
                 return
             rows = await self.db.get_node_buttons(node_id)
             rows.append([{"text": button_text, "type": "url", "url": button_url}])
             await self.db.set_node_buttons(node_id, rows)
-            await update.message.reply_text("✅ Botón URL añadido.")
-            del self.waiting_for_input[user_id]
+            await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "✅ Botón URL añadido.", chat_id_hint=update.effective_chat.id)
+            await self.input_state.delete(user_id)
 
         elif action == "button_sub_text":
-            self.waiting_for_input[user_id]['submenu_button_text'] = update.message.text
-            self.waiting_for_input[user_id]['action'] = 'child_node_text'
-            await update.message.reply_text("Ahora envía el texto que se mostrará al abrir el submenú:")
+            await self.input_state.update(user_id, submenu_button_text=update.message.text, action='child_node_text')
+            await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "Ahora envía el texto que se mostrará al abrir el submenú:", chat_id_hint=update.effective_chat.id)
 
         elif action == "child_node_text":
             parent_node_id = data['node_id']
@@ -266,61 +404,58 @@ class MessageHandlers:
             parent_node = await self.db.get_node(parent_node_id)
             chat_id = parent_node['chat_id']
             child_id = await self.db.add_child_node(chat_id, parent_node_id, child_text, parent_node.get('parse_mode') or 'HTML')
+            await self._warn_unknown_emojis(update, child_text)
 
             rows = await self.db.get_node_buttons(parent_node_id)
             rows.append([{"text": btn_text, "type": "node", "node_id": child_id}])
             await self.db.set_node_buttons(parent_node_id, rows)
 
-            submenu_created_text = """
-:check_premium: **Submenú creado\\.**
-
-:star_premium: ¿Deseas añadir botones dentro de este submenú?
-"""
-            formatted_text = add_premium_emojis(submenu_created_text, "MarkdownV2")
-
-            await update.message.reply_text(
-                formatted_text,
+            await self.scheduler.call(
+                PRIORITY_ADMIN, update.message.reply_text,
+                SUBMENU_CREATED_SCREEN.text,
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("➕ Botón URL (hijo)", callback_data=f"node_add_url_{child_id}")],
                     [InlineKeyboardButton("➕ Submenú (hijo)", callback_data=f"node_add_sub_{child_id}")],
                     [InlineKeyboardButton("Listo", callback_data=f"node_mgr_{chat_id}_{parent_node_id}")]
                 ]),
-                parse_mode="MarkdownV2"
+                parse_mode="MarkdownV2",
+                chat_id_hint=update.effective_chat.id
             )
-            del self.waiting_for_input[user_id]
+            await self.input_state.delete(user_id)
 
         elif action == "node_image":
             node_id = data['node_id']
             image_input = update.message.text.strip()
             if image_input.lower() == 'remove':
                 await self.db.update_node_image(node_id, None)
-                await update.message.reply_text("✅ Imagen eliminada.")
+                await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "✅ Imagen eliminada.", chat_id_hint=update.effective_chat.id)
             else:
                 await self.db.update_node_image(node_id, image_input)
-                await update.message.reply_text("✅ Imagen actualizada.")
-            del self.waiting_for_input[user_id]
+                await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "✅ Imagen actualizada.", chat_id_hint=update.effective_chat.id)
+            await self.input_state.delete(user_id)
 
         elif action == "node_rename":
             node_id = data['node_id']
             await self.db.update_node_text(node_id, update.message.text)
-            await update.message.reply_text("✅ Texto del nodo actualizado.")
-            del self.waiting_for_input[user_id]
+            await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "✅ Texto del nodo actualizado.", chat_id_hint=update.effective_chat.id)
+            await self._warn_unknown_emojis(update, update.message.text)
+            await self.input_state.delete(user_id)
 
     async def handle_photo_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id if update.effective_user else None
-        if not user_id or user_id not in self.waiting_for_input:
+        if not user_id or not check_admin_permissions(user_id):
             return
-        data = self.waiting_for_input[user_id]
-        if data.get('action') != 'node_image':
+        data = await self.input_state.get(user_id)
+        if data is None or data.get('action') != 'node_image':
             return
 
         node_id = data['node_id']
         try:
             file_id = update.message.photo[-1].file_id
             await self.db.update_node_image(node_id, file_id)
-            await update.message.reply_text("✅ Imagen actualizada.")
+            await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "✅ Imagen actualizada.", chat_id_hint=update.effective_chat.id)
         except Exception as e:
             logger.error(f"Error guardando imagen de nodo: {e}")
-            await update.message.reply_text("❌ No se pudo guardar la imagen.")
+            await self.scheduler.call(PRIORITY_ADMIN, update.message.reply_text, "❌ No se pudo guardar la imagen.", chat_id_hint=update.effective_chat.id)
         finally:
-            del self.waiting_for_input[user_id]
+            await self.input_state.delete(user_id)
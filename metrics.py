@@ -0,0 +1,219 @@
+import bisect
+import functools
+import inspect
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram.request import HTTPXRequest
+
+# Buckets de latencia en segundos: de 1 ms a 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # bisect_left: una observación igual al límite cuenta en ese bucket (le = "menor o igual")
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    """
+    Histograma con buckets fijos y una etiqueta; observar es un bisect y tres sumas.
+    Se crean etiquetas desde hilos (listener de Motor): altas y render van con candado.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self.children: Dict[str, _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> _HistogramChild:
+        child = self.children.get(value)
+        if child is None:
+            with self._lock:
+                child = self.children.get(value)
+                if child is None:
+                    child = self.children[value] = _HistogramChild(self.buckets)
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            children = sorted(self.children.items())
+        for value, child in children:
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{_fmt(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {_fmt(child.sum)}")
+            lines.append(f"{self.name}_count{{{label}}} {child.count}")
+        return lines
+
+
+class Counter:
+    """Contador monótono, con una etiqueta opcional"""
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.values: Dict[Optional[str], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: Optional[str] = None, amount: float = 1):
+        with self._lock:
+            self.values[value] = self.values.get(value, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self.values.items(), key=lambda kv: str(kv[0]))
+        if not values and self.label is None:
+            lines.append(f"{self.name} 0")
+        for value, total in values:
+            if self.label is None:
+                lines.append(f"{self.name} {_fmt(total)}")
+            else:
+                lines.append(f'{self.name}{{{self.label}="{_escape(value)}"}} {_fmt(total)}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas en formato de texto de Prometheus. Además de histogramas y
+    contadores propios, vuelca como gauges los metrics() de los componentes registrados
+    (planificador, buffers, cachés...), que se leen solo al hacer scrape.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+    def histogram(self, name: str, help_text: str, label: str) -> Histogram:
+        metric = Histogram(name, help_text, label)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, label: Optional[str] = None) -> Counter:
+        metric = Counter(name, help_text, label)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, prefix: str, collect: Callable[[], dict]):
+        self._collectors = [(p, c) for p, c in self._collectors if p != prefix]
+        self._collectors.append((prefix, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for key, value in values.items():
+                name = _NAME_RE.sub("_", f"bot_{prefix}_{key}")
+                if isinstance(value, dict):
+                    samples = [(f'{{key="{_escape(k)}"}}', v) for k, v in value.items() if isinstance(v, (int, float))]
+                elif isinstance(value, (int, float)):
+                    samples = [("", value)]
+                else:
+                    continue
+                if samples:
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.extend(f"{name}{labels} {_fmt(v)}" for labels, v in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_latency = registry.histogram("bot_handler_seconds", "Duración de los handlers de updates y rutas de callback", "handler")
+handler_errors = registry.counter("bot_handler_errors_total", "Excepciones en handlers de updates y rutas de callback", "handler")
+api_latency = registry.histogram("bot_api_request_seconds", "Duración de las peticiones a la Bot API por método", "method")
+api_errors = registry.counter("bot_api_errors_total", "Peticiones a la Bot API fallidas o con código de error", "method")
+db_latency = registry.histogram("bot_db_seconds", "Duración de los métodos de DatabaseManager", "method")
+db_errors = registry.counter("bot_db_errors_total", "Excepciones en métodos de DatabaseManager", "method")
+welcomes_sent = registry.counter("bot_welcomes_sent_total", "Miembros a los que se ha dado la bienvenida")
+
+
+def _timed(func: Callable, name: str, histogram: Histogram, errors: Counter) -> Callable:
+    child = histogram.labels(name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            errors.inc(name)
+            raise
+        finally:
+            child.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def observed(callback: Callable, name: Optional[str] = None) -> Callable:
+    """Envuelve el callback de un handler de PTB: 'CommandHandlers.start', 'MessageHandlers.handle_text_input'..."""
+    if name is None:
+        owner = getattr(callback, "__self__", None)
+        name = f"{type(owner).__name__}.{callback.__name__}" if owner is not None else callback.__name__
+    return _timed(callback, name, handler_latency, handler_errors)
+
+
+def instrument_methods(histogram: Histogram, errors: Counter):
+    """Decorador de clase: mide cada método async público definido en la clase"""
+    def decorate(cls):
+        for attr, func in list(vars(cls).items()):
+            if not attr.startswith("_") and inspect.iscoroutinefunction(func):
+                setattr(cls, attr, _timed(func, f"{cls.__name__}.{attr}", histogram, errors))
+        return cls
+    return decorate
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest que mide cada llamada a la Bot API por método (sendMessage, sendPhoto...)"""
+
+    async def do_request(self, url: str, method: str, request_data=None, **kwargs) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **kwargs)
+        except Exception:
+            api_errors.inc(endpoint)
+            raise
+        finally:
+            api_latency.labels(endpoint).observe(time.perf_counter() - started)
+        if code >= 400:
+            api_errors.inc(endpoint)
+        return code, payload
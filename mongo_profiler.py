@@ -0,0 +1,178 @@
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from config import logger, MONGO_SLOW_QUERY_MS
+from metrics import registry
+
+# Dónde está el filtro en cada comando (para la forma de la consulta)
+_FILTER_PATHS = {
+    "find": ("filter",),
+    "count": ("query",),
+    "distinct": ("query",),
+    "findAndModify": ("query",),
+    "update": ("updates", 0, "q"),
+    "delete": ("deletes", 0, "q"),
+}
+# Comandos internos del driver que no interesan
+_IGNORED = {"isMaster", "ismaster", "hello", "ping", "saslStart", "saslContinue", "endSessions", "buildInfo"}
+
+
+def query_shape(value: Any) -> Any:
+    """Forma de un filtro: se conservan campos y operadores, los valores pasan a 1"""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $and/$or/$in: la forma no depende de cuántos elementos haya
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return 1
+
+
+def _command_filter(name: str, command: Dict[str, Any]) -> Any:
+    if name == "aggregate":
+        # Forma del pipeline: los operadores de cada etapa y el $match completo
+        return [
+            {op: query_shape(arg)} if op == "$match" else op
+            for stage in command.get("pipeline", []) for op, arg in stage.items()
+        ]
+    path = _FILTER_PATHS.get(name)
+    if path is None:
+        return None
+    value: Any = command
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return query_shape(value)
+
+
+def _returned(name: str, reply: Dict[str, Any]) -> Optional[int]:
+    """Documentos devueltos o afectados según la respuesta del comando"""
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if name == "findAndModify":
+        return 1 if reply.get("value") is not None else 0
+    if "n" in reply:
+        return int(reply["n"])
+    return None
+
+
+class _ShapeStats:
+    __slots__ = ("collection", "command", "shape", "count", "total", "max", "returned", "errors")
+
+    def __init__(self, collection: str, command: str, shape: str):
+        self.collection = collection
+        self.command = command
+        self.shape = shape
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.returned = 0
+        self.errors = 0
+
+
+class MongoProfiler(monitoring.CommandListener):
+    """
+    Perfilador basado en la monitorización de comandos de pymongo: duración por colección
+    y operación, por forma de consulta, documentos devueltos y log de consultas lentas.
+    Motor ejecuta pymongo en hilos, así que los agregados se protegen con un candado.
+    Los documentos examinados no vienen en la respuesta de los comandos (solo en explain).
+    """
+
+    def __init__(self, slow_ms: float = 100, max_shapes: int = 500):
+        self.slow_ms = slow_ms
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str, str]] = {}
+        self._shapes: Dict[Tuple[str, str, str], _ShapeStats] = {}
+        self._latency = registry.histogram("bot_mongo_command_seconds", "Duración de los comandos de MongoDB por colección y operación", "operation")
+
+        # Métricas
+        self.commands = 0
+        self.errors = 0
+        self.slow = 0
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        name = event.command_name
+        if name in _IGNORED:
+            return
+        # getMore lleva el id del cursor en su clave; la colección va aparte
+        collection = event.command.get("collection" if name == "getMore" else name)
+        collection = collection if isinstance(collection, str) else event.database_name
+        shape = _command_filter(name, event.command)
+        key = (collection, name, json.dumps(shape, default=str) if shape is not None else "")
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = key
+
+    def _finish(self, event, reply: Optional[Dict[str, Any]]):
+        with self._lock:
+            key = self._pending.pop((event.connection_id, event.request_id), None)
+            if key is None:
+                return
+            seconds = event.duration_micros / 1e6
+            stats = self._shapes.get(key)
+            if stats is None:
+                if len(self._shapes) >= self.max_shapes:
+                    # Tope de formas distintas: se descarta la menos costosa
+                    cheapest = min(self._shapes, key=lambda k: self._shapes[k].total)
+                    del self._shapes[cheapest]
+                stats = self._shapes[key] = _ShapeStats(*key)
+            stats.count += 1
+            stats.total += seconds
+            if seconds > stats.max:
+                stats.max = seconds
+            self.commands += 1
+            if reply is None:
+                stats.errors += 1
+                self.errors += 1
+            else:
+                returned = _returned(key[1], reply)
+                if returned is not None:
+                    stats.returned += returned
+            self._latency.labels(f"{key[0]}.{key[1]}").observe(seconds)
+            slow = seconds * 1000 >= self.slow_ms
+            if slow:
+                self.slow += 1
+        if slow:
+            logger.warning(f"🐢 Consulta lenta ({seconds * 1000:.0f} ms) {key[0]}.{key[1]} {key[2]}")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, event.reply)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, None)
+
+    def top_shapes(self, limit: int = 10, by: str = "max") -> List[Dict[str, Any]]:
+        """Formas de consulta más lentas desde el arranque (by: 'max', 'total' o 'avg')"""
+        with self._lock:
+            rows = [
+                {
+                    "collection": s.collection,
+                    "command": s.command,
+                    "shape": s.shape,
+                    "count": s.count,
+                    "avg": s.total / s.count if s.count else 0.0,
+                    "max": s.max,
+                    "total": s.total,
+                    "returned_avg": s.returned / s.count if s.count else 0.0,
+                    "errors": s.errors
+                }
+                for s in self._shapes.values()
+            ]
+        rows.sort(key=lambda r: r[by], reverse=True)
+        return rows[:limit]
+
+    def metrics(self) -> dict:
+        return {"commands": self.commands, "errors": self.errors, "slow": self.slow, "shapes": len(self._shapes)}
+
+
+mongo_profiler = MongoProfiler(MONGO_SLOW_QUERY_MS)
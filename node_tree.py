@@ -0,0 +1,63 @@
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+class NodeTree:
+    """
+    Árbol de nodos de bienvenida de un chat, cargado en una sola consulta.
+    Es inmutable: cualquier escritura invalida el árbol cacheado y se vuelve a cargar.
+    """
+
+    __slots__ = ("chat_id", "generation", "root_id", "_nodes", "_children")
+
+    def __init__(self, chat_id: int, nodes: Iterable[Dict[str, Any]], generation: int = 0):
+        self.chat_id = chat_id
+        self.generation = generation
+        self.root_id: Optional[int] = None
+        by_id: Dict[int, Mapping[str, Any]] = {}
+        children: Dict[int, List[int]] = {}
+        for node in nodes:
+            by_id[node["id"]] = MappingProxyType(node)
+            if node["parent_id"] is None:
+                self.root_id = node["id"]
+            else:
+                children.setdefault(node["parent_id"], []).append(node["id"])
+        self._nodes = MappingProxyType(by_id)
+        self._children = MappingProxyType({pid: tuple(sorted(ids)) for pid, ids in children.items()})
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node_id: int) -> bool:
+        return node_id in self._nodes
+
+    def node_ids(self) -> Tuple[int, ...]:
+        return tuple(self._nodes)
+
+    def get(self, node_id: int) -> Optional[Mapping[str, Any]]:
+        return self._nodes.get(node_id)
+
+    @property
+    def root(self) -> Optional[Mapping[str, Any]]:
+        return self._nodes.get(self.root_id) if self.root_id is not None else None
+
+    def parent_of(self, node_id: int) -> Optional[Mapping[str, Any]]:
+        node = self._nodes.get(node_id)
+        return self._nodes.get(node["parent_id"]) if node and node["parent_id"] is not None else None
+
+    def children_of(self, node_id: int) -> List[Mapping[str, Any]]:
+        return [self._nodes[cid] for cid in self._children.get(node_id, ())]
+
+    def subtree_ids(self, node_id: int) -> List[int]:
+        """node_id y todos sus descendientes (sin recursión; tolera ciclos)"""
+        if node_id not in self._nodes:
+            return []
+        out, seen, stack = [], {node_id}, [node_id]
+        while stack:
+            current = stack.pop()
+            out.append(current)
+            for cid in self._children.get(current, ()):
+                if cid not in seen:
+                    seen.add(cid)
+                    stack.append(cid)
+        return out
@@ -0,0 +1,136 @@
+import re
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import handler_errors, handler_latency
+
+# Conversores de argumentos tipados en los patrones: "node_mgr_{chat_id:int}_{node_id:int}"
+_CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    "str": str,
+    "int": int,
+}
+# Un argumento {nombre:tipo} es un solo token aunque el nombre lleve '_'
+_PATTERN_TOKEN_RE = re.compile(r"\{[^}]*\}|[^_]+")
+
+
+class Route:
+    __slots__ = ("pattern", "handler", "public", "params", "hits", "errors", "total_time", "max_time", "latency")
+
+    def __init__(self, pattern: str, handler: Callable[..., Awaitable[Any]], public: bool,
+                 params: List[Tuple[str, Callable[[str], Any]]]):
+        self.pattern = pattern
+        self.handler = handler
+        self.public = public
+        self.params = params
+        self.hits = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.latency = handler_latency.labels(f"callback:{pattern}")
+
+    def convert(self, values: List[str]) -> Optional[Dict[str, Any]]:
+        try:
+            return {name: conv(value) for (name, conv), value in zip(self.params, values)}
+        except ValueError:
+            return None
+
+
+class _TrieNode:
+    __slots__ = ("children", "routes")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Rutas que terminan sus literales en este nodo, por número de argumentos
+        self.routes: Dict[int, Route] = {}
+
+
+class CallbackRouter:
+    """
+    Router declarativo de callback_data. Los patrones son tokens separados por '_':
+    primero literales y después argumentos tipados. La búsqueda recorre un trie de
+    literales y gana la ruta más específica, así que el orden de registro no importa
+    (wb_home_{chat_id} y wb_{node_id} conviven sin depender de cuál se compruebe antes).
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self._root = _TrieNode()
+        self.routes: List[Route] = []
+        self.unmatched = 0
+        # Caché de callback_data ya resuelta: los mismos botones se pulsan una y otra vez
+        self.resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def add(self, pattern: str, handler: Callable[..., Awaitable[Any]], public: bool = False) -> Route:
+        literals, params = [], []
+        for token in _PATTERN_TOKEN_RE.findall(pattern):
+            if token.startswith("{") and token.endswith("}"):
+                name, _, kind = token[1:-1].partition(":")
+                params.append((name, _CONVERTERS[kind or "str"]))
+            elif params:
+                raise ValueError(f"Patrón inválido '{pattern}': los literales van antes que los argumentos")
+            else:
+                literals.append(token)
+
+        node = self._root
+        for literal in literals:
+            node = node.children.setdefault(literal, _TrieNode())
+        if len(params) in node.routes:
+            raise ValueError(f"Ruta duplicada: '{pattern}'")
+        route = Route(pattern, handler, public, params)
+        node.routes[len(params)] = route
+        self.routes.append(route)
+        self.resolve.cache_clear()
+        return route
+
+    def _resolve(self, data: str) -> Tuple[Optional[Route], Optional[Dict[str, Any]]]:
+        tokens = data.split("_")
+        # Candidatos de más a menos específico (más literales consumidos primero)
+        candidates = []
+        node = self._root
+        for depth, token in enumerate(tokens):
+            node = node.children.get(token)
+            if node is None:
+                break
+            if node.routes:
+                candidates.append((depth + 1, node))
+        for consumed, node in reversed(candidates):
+            route = node.routes.get(len(tokens) - consumed)
+            if route is None:
+                continue
+            kwargs = route.convert(tokens[consumed:])
+            if kwargs is not None:
+                return route, kwargs
+        return None, None
+
+    async def dispatch(self, route: Route, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await route.handler(*args, **kwargs)
+        except Exception:
+            route.errors += 1
+            handler_errors.inc(f"callback:{route.pattern}")
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            route.latency.observe(elapsed)
+            route.hits += 1
+            route.total_time += elapsed
+            if elapsed > route.max_time:
+                route.max_time = elapsed
+
+    def metrics(self) -> dict:
+        info = self.resolve.cache_info()
+        return {
+            "routes": {
+                r.pattern: {
+                    "hits": r.hits,
+                    "errors": r.errors,
+                    "avg_seconds": r.total_time / r.hits if r.hits else 0.0,
+                    "max_seconds": r.max_time
+                }
+                for r in self.routes if r.hits
+            },
+            "unmatched": self.unmatched,
+            "resolve_cache_hits": info.hits,
+            "resolve_cache_misses": info.misses
+        }
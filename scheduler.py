@@ -0,0 +1,277 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from telegram.error import RetryAfter
+
+from config import logger
+
+# Clases de prioridad (menor número = se atiende antes)
+PRIORITY_NAVIGATION = 0   # navegación pública wb_
+PRIORITY_WELCOME = 1      # bienvenidas
+PRIORITY_ADMIN = 2        # paneles de administración
+PRIORITY_NOTIFICATION = 3 # notificaciones al admin
+
+PRIORITY_NAMES = {
+    PRIORITY_NAVIGATION: "navigation",
+    PRIORITY_WELCOME: "welcome",
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_NOTIFICATION: "notification"
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens por segundo
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos hasta que haya un token disponible (0 si ya lo hay)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("priority", "method", "args", "kwargs", "chat_key", "group_id", "future", "enqueued", "retries")
+
+    def __init__(self, priority, method, args, kwargs, chat_key, group_id, future):
+        self.priority = priority
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        # Chat destino (orden de envío) y grupo al que se aplica el límite por grupo
+        self.chat_key = chat_key
+        self.group_id = group_id
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.retries = 0
+
+
+class OutboundScheduler:
+    """
+    Planificador central de llamadas salientes a la Bot API.
+    Limita el ritmo global y por grupo con token buckets, atiende primero
+    las prioridades altas y descarta trabajo prescindible bajo presión.
+    Cada prioridad tiene una cola por chat que se atiende por turnos: un grupo
+    estrangulado se salta entero y no retrasa a los demás. Los envíos a un mismo
+    chat se ejecutan de uno en uno y en orden.
+    """
+
+    MAX_GROUP_BUCKETS = 10000
+
+    def __init__(self, global_rate: float = 30, group_rate_per_minute: float = 20,
+                 group_burst: float = 5, shed_threshold: int = 500, max_retries: int = 2):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_rate = group_rate_per_minute / 60
+        self.group_burst = group_burst
+        self.shed_threshold = shed_threshold
+        self.max_retries = max_retries
+
+        # prioridad -> chat -> cola FIFO; el orden del dict es el turno entre chats
+        self._queues: Dict[int, Dict[Any, deque]] = {p: {} for p in PRIORITY_NAMES}
+        self._pending = 0
+        self._group_buckets: Dict[int, TokenBucket] = {}
+        # chat -> [candado, envíos en curso o esperando]; serializa los envíos a un mismo chat
+        self._chat_locks: Dict[Any, list] = {}
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight = set()
+
+        # Métricas
+        self.sent = {p: 0 for p in PRIORITY_NAMES}
+        self.shed = {p: 0 for p in PRIORITY_NAMES}
+        self.retry_after_count = 0
+        self.max_wait = {p: 0.0 for p in PRIORITY_NAMES}
+
+    def pending(self) -> int:
+        return self._pending
+
+    async def call(self, priority: int, method, *args, droppable: bool = False,
+                   chat_id_hint: Optional[int] = None, **kwargs) -> Any:
+        """
+        Encola method(*args, **kwargs) y espera su resultado.
+        Si el destino es un grupo también aplica el límite por grupo: chat_id_hint, o el
+        'chat_id' de kwargs si no se indica. Los métodos ligados a un mensaje o callback
+        (reply_text, edit_message_*) no llevan chat_id, así que sus llamadores pasan el hint.
+        Con droppable=True la llamada se descarta (devuelve None) si la cola está saturada.
+        """
+        if droppable and self.pending() >= self.shed_threshold:
+            self.shed[priority] += 1
+            logger.warning(f"Cola saliente saturada, se descarta envío de prioridad {PRIORITY_NAMES.get(priority)}")
+            return None
+
+        chat_id = chat_id_hint if chat_id_hint is not None else kwargs.get("chat_id")
+        chat_key = chat_id if isinstance(chat_id, int) else None
+        group_id = chat_key if chat_key is not None and chat_key < 0 else None
+        future = asyncio.get_running_loop().create_future()
+        lanes = self._queues[priority]
+        lane = lanes.get(chat_key)
+        if lane is None:
+            lane = lanes[chat_key] = deque()
+        lane.append(_Job(priority, method, args, kwargs, chat_key, group_id, future))
+        self._pending += 1
+        self._ensure_worker()
+        self._wakeup.set()
+        return await future
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def _group_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._group_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._group_buckets) >= self.MAX_GROUP_BUCKETS:
+                now = time.monotonic()
+                for cid in [c for c, b in self._group_buckets.items() if b.is_full(now)]:
+                    del self._group_buckets[cid]
+            bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._group_buckets[chat_id] = bucket
+        return bucket
+
+    def _next_job(self):
+        # Devuelve (job, espera): el primer trabajo listo por prioridad o cuánto esperar
+        now = time.monotonic()
+        if now < self._paused_until:
+            return None, self._paused_until - now
+        wait = self.global_bucket.wait_time(now)
+        if wait > 0:
+            return None, wait
+
+        min_wait = None
+        for priority in sorted(self._queues):
+            lanes = self._queues[priority]
+            # Se devuelve en cuanto se toca el dict, así que se puede iterar sin copia
+            for chat_key, lane in lanes.items():
+                job = lane[0]
+                if job.future.done():
+                    # El llamador se canceló; no tiene sentido enviarlo
+                    self._pop(lanes, chat_key, lane)
+                    return None, 0.0
+                if job.group_id is not None:
+                    bucket = self._group_bucket(job.group_id)
+                    job_wait = bucket.wait_time(now)
+                    if job_wait > 0:
+                        # Grupo estrangulado: se salta su cola entera
+                        min_wait = job_wait if min_wait is None else min(min_wait, job_wait)
+                        continue
+                    bucket.take()
+                self._pop(lanes, chat_key, lane)
+                self.global_bucket.take()
+                return job, 0.0
+        return None, min_wait
+
+    def _pop(self, lanes: Dict[Any, deque], chat_key, lane: deque):
+        # Saca la cabeza de la cola del chat y, si le quedan trabajos, lo pasa al final del turno
+        lane.popleft()
+        self._pending -= 1
+        del lanes[chat_key]
+        if lane:
+            lanes[chat_key] = lane
+
+    async def _run(self):
+        while True:
+            job, wait = self._next_job()
+            if job is not None:
+                task = asyncio.create_task(self._execute(job))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+                continue
+            if wait == 0.0:
+                continue
+
+            self._wakeup.clear()
+            if wait is None:
+                if not self.pending():
+                    await self._wakeup.wait()
+                    continue
+                wait = 0.05
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job: _Job):
+        if job.chat_key is None:
+            await self._send(job)
+            return
+        # Las tareas se crean en orden de cola y asyncio.Lock atiende por orden de llegada
+        entry = self._chat_locks.get(job.chat_key)
+        if entry is None:
+            entry = self._chat_locks[job.chat_key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._send(job)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[job.chat_key]
+
+    async def _send(self, job: _Job):
+        waited = time.monotonic() - job.enqueued
+        if waited > self.max_wait[job.priority]:
+            self.max_wait[job.priority] = waited
+        while True:
+            try:
+                result = await job.method(*job.args, **job.kwargs)
+                break
+            except RetryAfter as e:
+                self.retry_after_count += 1
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                logger.warning(f"Flood control de Telegram: pausa de {retry_after}s")
+                if job.retries >= self.max_retries or job.future.done():
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    return
+                # Se reintenta aquí, con el candado del chat, para no adelantar envíos posteriores
+                job.retries += 1
+                await asyncio.sleep(max(0.0, self._paused_until - time.monotonic()))
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+        self.sent[job.priority] += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+    async def stop(self):
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+        for lanes in self._queues.values():
+            for lane in lanes.values():
+                for job in lane:
+                    if not job.future.done():
+                        job.future.cancel()
+            lanes.clear()
+        self._pending = 0
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": {PRIORITY_NAMES[p]: sum(len(lane) for lane in lanes.values()) for p, lanes in self._queues.items()},
+            "queued_chats": sum(len(lanes) for lanes in self._queues.values()),
+            "inflight": len(self._inflight),
+            "sent": {PRIORITY_NAMES[p]: n for p, n in self.sent.items()},
+            "shed": {PRIORITY_NAMES[p]: n for p, n in self.shed.items()},
+            "max_wait_seconds": {PRIORITY_NAMES[p]: w for p, w in self.max_wait.items()},
+            "retry_after": self.retry_after_count,
+            "group_buckets": len(self._group_buckets)
+        }
@@ -0,0 +1,52 @@
+from typing import List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from emoji_registry import emoji_registry
+from helpers import add_premium_emojis
+
+
+class StaticScreen:
+    """
+    Pantalla de texto constante (y teclado opcional) renderizada una sola vez.
+    El texto se vuelve a renderizar solo si cambia la versión del registro de emojis;
+    el InlineKeyboardMarkup se construye al importar y se reutiliza tal cual.
+    """
+
+    __slots__ = ("template", "parse_mode", "_text", "_version", "_markup")
+
+    def __init__(self, template: str, keyboard: Optional[Sequence[Sequence[Tuple[str, str]]]] = None,
+                 parse_mode: str = "MarkdownV2"):
+        self.template = template
+        self.parse_mode = parse_mode
+        self._text = None
+        self._version = None
+        self._markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(label, callback_data=data) for label, data in row]
+            for row in keyboard
+        ]) if keyboard else None
+        _registry.append(self)
+
+    def render(self) -> str:
+        """Render en vivo (sin caché)"""
+        return add_premium_emojis(self.template, self.parse_mode)
+
+    @property
+    def text(self) -> str:
+        if self._version != emoji_registry.version:
+            self._text = self.render()
+            self._version = emoji_registry.version
+        return self._text
+
+    @property
+    def markup(self) -> Optional[InlineKeyboardMarkup]:
+        return self._markup
+
+
+_registry: List[StaticScreen] = []
+
+
+def prerender_all():
+    """Renderiza todas las pantallas estáticas (p. ej. tras cargar el registro de emojis)"""
+    for screen in _registry:
+        screen.text
@@ -0,0 +1,320 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import aiohttp
+from telegram import Update
+
+from config import logger, SHARD_FEED_POLL
+
+# Líneas de hasta 4 MiB entre ingress y workers (el límite por defecto de asyncio es 64 KiB)
+_STREAM_LIMIT = 4 * 1024 * 1024
+
+# Campos del update que llevan el chat, con el mismo criterio que Update.effective_chat
+_CHAT_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member", "chat_join_request",
+)
+
+
+def shard_key(data: Dict[str, Any]) -> int:
+    """chat_id del update en JSON crudo; si no tiene chat, el usuario (su chat privado tiene el mismo id)"""
+    for field in _CHAT_FIELDS:
+        obj = data.get(field)
+        if obj and "chat" in obj:
+            return obj["chat"]["id"]
+    callback = data.get("callback_query")
+    if callback and callback.get("message") and "chat" in callback["message"]:
+        return callback["message"]["chat"]["id"]
+    for obj in data.values():
+        if isinstance(obj, dict) and "from" in obj:
+            return obj["from"]["id"]
+    return data.get("update_id", 0)
+
+
+class HashRing:
+    """Hash consistente con nodos virtuales: al caer un worker solo se reparten sus chats"""
+
+    def __init__(self, replicas: int = 64):
+        self.replicas = replicas
+        self.nodes: Set[int] = set()
+        self._points: List[int] = []
+        self._owners: List[int] = []
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def _rebuild(self):
+        points = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in self.nodes for replica in range(self.replicas)
+        )
+        self._points = [p for p, _ in points]
+        self._owners = [n for _, n in points]
+
+    def add(self, node: int):
+        if node not in self.nodes:
+            self.nodes.add(node)
+            self._rebuild()
+
+    def remove(self, node: int):
+        if node in self.nodes:
+            self.nodes.discard(node)
+            self._rebuild()
+
+    def get(self, key: Any) -> Optional[int]:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, self._hash(str(key))) % len(self._points)
+        return self._owners[i]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+class ShardIngress:
+    """
+    Proceso de entrada del modo multiproceso: recibe los updates (polling o webhook) como
+    JSON crudo, sin construir objetos de telegram, y los reparte por hash consistente de
+    chat_id entre N workers conectados por un socket unix. Cada chat va siempre al mismo
+    worker y en orden. Si un worker cae se saca del anillo (sus chats pasan a los demás)
+    y se relanza; al volver a conectar recupera su parte.
+
+    Los workers también publican invalidaciones de caché por el socket y el ingress las
+    reenvía al resto, porque un admin puede editar desde su chat privado la bienvenida de
+    un grupo que atiende otro worker.
+    """
+
+    def __init__(self, token: str, worker_count: int, socket_path: str, spawn: Callable[[int], Any],
+                 supervise_interval: float = 1.0):
+        self.token = token
+        self.worker_count = worker_count
+        self.socket_path = socket_path
+        self.spawn = spawn
+        self.supervise_interval = supervise_interval
+        self.ring = HashRing()
+        self.running = False
+
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._processes: Dict[int, Any] = {}
+        self._available = asyncio.Event()
+        self._all_connected = asyncio.Event()
+        self._server = None
+        self._supervisor = None
+        self._session = None
+        self._inflight = 0
+
+        # Métricas
+        self.routed: Dict[int, int] = {}
+        self.rerouted = 0
+        self.restarts = 0
+        self.invalidations = 0
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_worker, path=self.socket_path, limit=_STREAM_LIMIT)
+        self._session = aiohttp.ClientSession()
+        self.running = True
+        for worker_id in range(self.worker_count):
+            self._spawn(worker_id)
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info(f"🧩 Ingress iniciado con {self.worker_count} workers en {self.socket_path}")
+
+    async def wait_ready(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._all_connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Solo {len(self.ring)}/{self.worker_count} workers conectados tras {timeout}s; se continúa")
+
+    def _spawn(self, worker_id: int):
+        process = self.spawn(worker_id)
+        process.start()
+        self._processes[worker_id] = process
+
+    async def _supervise(self):
+        while self.running:
+            await asyncio.sleep(self.supervise_interval)
+            for worker_id, process in list(self._processes.items()):
+                if self.running and not process.is_alive():
+                    logger.error(f"Worker {worker_id} terminó (código {process.exitcode}); se relanza")
+                    self._drop_worker(worker_id)
+                    self.restarts += 1
+                    self._spawn(worker_id)
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            worker_id = int(json.loads(await reader.readline())["hello"])
+        except (ValueError, KeyError, TypeError):
+            writer.close()
+            return
+
+        self._writers[worker_id] = writer
+        self.ring.add(worker_id)
+        self._available.set()
+        if len(self.ring) == self.worker_count:
+            self._all_connected.set()
+        logger.info(f"Worker {worker_id} conectado ({len(self.ring)}/{self.worker_count})")
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if b'"invalidate"' in line:
+                    self.invalidations += 1
+                    await self._broadcast(line, exclude=worker_id)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            if self._writers.get(worker_id) is writer:
+                logger.warning(f"Worker {worker_id} desconectado; sus chats pasan al resto")
+                self._drop_worker(worker_id)
+
+    def _drop_worker(self, worker_id: int):
+        writer = self._writers.pop(worker_id, None)
+        self.ring.remove(worker_id)
+        self._all_connected.clear()
+        if not self._writers:
+            self._available.clear()
+        if writer:
+            writer.close()
+
+    async def _broadcast(self, line: bytes, exclude: int):
+        for worker_id, writer in list(self._writers.items()):
+            if worker_id == exclude:
+                continue
+            try:
+                writer.write(line)
+                await writer.drain()
+            except ConnectionError:
+                self._drop_worker(worker_id)
+
+    async def route(self, data: Dict[str, Any]):
+        """Entrega el update al worker dueño de su chat; si el envío falla, al siguiente del anillo"""
+        line = (json.dumps({"update": data}) + "\n").encode()
+        key = shard_key(data)
+        self._inflight += 1
+        try:
+            while True:
+                await self._available.wait()
+                worker_id = self.ring.get(key)
+                writer = self._writers.get(worker_id)
+                if writer is None:
+                    self.ring.remove(worker_id)
+                    continue
+                try:
+                    writer.write(line)
+                    await writer.drain()
+                    self.routed[worker_id] = self.routed.get(worker_id, 0) + 1
+                    return
+                except ConnectionError:
+                    self.rerouted += 1
+                    self._drop_worker(worker_id)
+        finally:
+            self._inflight -= 1
+
+    def backlog(self) -> int:
+        """Updates recibidos que esperan un worker disponible o espacio en su socket"""
+        return self._inflight
+
+    async def api(self, method: str, **params) -> Any:
+        params = {k: v for k, v in params.items() if v is not None}
+        timeout = aiohttp.ClientTimeout(total=params.get("timeout", 0) + 15)
+        async with self._session.post(f"https://api.telegram.org/bot{self.token}/{method}", json=params, timeout=timeout) as resp:
+            body = await resp.json()
+        if not body.get("ok"):
+            raise RuntimeError(f"{method}: {body.get('description')}")
+        return body["result"]
+
+    async def poll(self, timeout: int = 30):
+        """getUpdates en bucle; el offset avanza cuando el update ya está en el socket de su worker"""
+        await self.api("deleteWebhook")
+        offset = None
+        while self.running:
+            try:
+                updates = await self.api("getUpdates", offset=offset, timeout=timeout, allowed_updates=Update.ALL_TYPES)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en getUpdates: {e}")
+                await asyncio.sleep(2)
+                continue
+            for data in updates:
+                await self.route(data)
+                offset = data["update_id"] + 1
+
+    async def stop(self):
+        self.running = False
+        if self._supervisor:
+            self._supervisor.cancel()
+        if self._server:
+            self._server.close()
+        for worker_id in list(self._writers):
+            self._drop_worker(worker_id)
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 10)
+        if self._session:
+            await self._session.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.worker_count,
+            "connected": len(self.ring),
+            "routed": dict(self.routed),
+            "rerouted": self.rerouted,
+            "restarts": self.restarts,
+            "invalidations": self.invalidations,
+            "backlog": self._inflight
+        }
+
+
+async def run_worker_feed(application, db, socket_path: str, worker_id: int,
+                          backlog: Callable[[], int], max_backlog: int):
+    """
+    Lado worker: se registra en el ingress, mete los updates recibidos en la cola de la
+    Application y aplica las invalidaciones de caché de los demás workers.
+    Mientras backlog() >= max_backlog deja de leer: el socket se llena, el drain() del
+    ingress espera y este acaba respondiendo 503. Termina cuando el ingress cierra la conexión.
+    """
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=_STREAM_LIMIT)
+    writer.write((json.dumps({"hello": worker_id}) + "\n").encode())
+    await writer.drain()
+
+    def publish(kind: str, key: Any):
+        writer.write((json.dumps({"invalidate": [kind, key]}) + "\n").encode())
+
+    db.invalidation_listener = publish
+    try:
+        while True:
+            while backlog() >= max_backlog:
+                await asyncio.sleep(SHARD_FEED_POLL)
+            line = await reader.readline()
+            if not line:
+                logger.warning(f"Worker {worker_id}: el ingress cerró la conexión")
+                break
+            msg = json.loads(line)
+            if "update" in msg:
+                try:
+                    update = Update.de_json(msg["update"], application.bot)
+                except Exception as e:
+                    # Un update mal formado no debe cortar la conexión con el ingress
+                    logger.error(f"Worker {worker_id}: update no válido descartado: {e}")
+                    continue
+                if update:
+                    await application.update_queue.put(update)
+            elif "invalidate" in msg:
+                kind, key = msg["invalidate"]
+                await db.apply_remote_invalidation(kind, key)
+    finally:
+        db.invalidation_listener = None
+        writer.close()
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import logger
+
+
+class WelcomeStatsBuffer:
+    """
+    Acumula en memoria los incrementos de welcomes_sent y last_activity por chat
+    y los escribe en 'stats' con un solo bulk_write cada N segundos o M eventos
+    """
+
+    def __init__(self, collection, flush_interval: float = 5.0, max_events: int = 500,
+                 on_flush: Optional[Callable[[Dict[int, int]], Awaitable[None]]] = None):
+        self.collection = collection
+        # Se llama con los incrementos ya escritos (p. ej. para mantener stats_rollup)
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self.running = False
+
+        self._counts: Dict[int, int] = {}
+        self._last_activity: Dict[int, str] = {}
+        self._events = 0
+        self._oldest_pending: Optional[float] = None
+        self._flush_lock = asyncio.Lock()
+        self._inflight: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.flushes = 0
+        self.flushed_events = 0
+        self.flush_errors = 0
+        self.last_flush_duration = 0.0
+
+    def add(self, chat_id: int, count: int = 1) -> bool:
+        """Registra bienvenidas; devuelve True si se alcanzó el umbral de eventos"""
+        self._counts[chat_id] = self._counts.get(chat_id, 0) + count
+        self._last_activity[chat_id] = datetime.utcnow().isoformat()
+        self._events += count
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        return self._events >= self.max_events
+
+    def pending_for(self, chat_id: int) -> int:
+        return self._counts.get(chat_id, 0)
+
+    def pending_total(self) -> int:
+        return sum(self._counts.values())
+
+    def flush_lag(self) -> float:
+        """Segundos que lleva sin escribirse el incremento pendiente más antiguo"""
+        if self._oldest_pending is None:
+            return 0.0
+        return time.monotonic() - self._oldest_pending
+
+    async def flush(self):
+        async with self._flush_lock:
+            # Una escritura cuyo flush() se canceló sigue en curso: se espera antes del siguiente lote
+            if self._inflight is not None:
+                await asyncio.shield(self._inflight)
+            if not self._counts:
+                return
+
+            # Intercambio sin await de por medio: lo que llegue durante la escritura va al siguiente lote
+            counts, self._counts = self._counts, {}
+            activity, self._last_activity = self._last_activity, {}
+            events, self._events = self._events, 0
+            oldest, self._oldest_pending = self._oldest_pending, None
+
+            # Tarea propia: cancelar flush() no interrumpe un bulk_write que puede estar ya aplicado
+            self._inflight = asyncio.create_task(self._write_batch(counts, activity, events, oldest))
+            await asyncio.shield(self._inflight)
+
+    async def _write_batch(self, counts: Dict[int, int], activity: Dict[int, str], events: int, oldest: float):
+        ops = [
+            UpdateOne(
+                {"chat_id": chat_id},
+                {"$inc": {"welcomes_sent": inc}, "$max": {"last_activity": activity[chat_id]}},
+                upsert=True
+            )
+            for chat_id, inc in counts.items()
+        ]
+
+        started = time.monotonic()
+        try:
+            try:
+                await self.collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # Sin orden el resto de operaciones sí se aplicó: solo se reencolan las fallidas
+                chat_ids = list(counts)
+                failed = {chat_ids[err["index"]]: counts[chat_ids[err["index"]]] for err in e.details.get("writeErrors", [])}
+                self.flush_errors += 1
+                logger.error(f"Error escribiendo estadísticas de bienvenida en {len(failed)} chats: {e}")
+                if failed:
+                    self._requeue(failed, activity, sum(failed.values()), oldest)
+                    events -= sum(failed.values())
+                    counts = {chat_id: inc for chat_id, inc in counts.items() if chat_id not in failed}
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Error escribiendo estadísticas de bienvenida: {e}")
+                self._requeue(counts, activity, events, oldest)
+                return
+
+            self.last_flush_duration = time.monotonic() - started
+            self.flushes += 1
+            self.flushed_events += events
+
+            if self.on_flush and counts:
+                try:
+                    await self.on_flush(counts)
+                except Exception as e:
+                    # El lote ya está escrito: no se reencola, el reconciliador corregirá el rollup
+                    logger.error(f"Error en on_flush de estadísticas: {e}")
+        finally:
+            self._inflight = None
+
+    def _requeue(self, counts: Dict[int, int], activity: Dict[int, str], events: int, oldest: float):
+        # Reincorpora un lote no escrito para el siguiente intento
+        for chat_id, inc in counts.items():
+            self._counts[chat_id] = self._counts.get(chat_id, 0) + inc
+            self._last_activity.setdefault(chat_id, activity[chat_id])
+        self._events += events
+        self._oldest_pending = min(oldest, self._oldest_pending or oldest)
+
+    async def start(self):
+        """Bucle de vaciado periódico"""
+        self.running = True
+        while self.running:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self):
+        """Detiene el bucle y escribe lo pendiente (flush espera antes la escritura en curso, aunque se cancelara)"""
+        self.running = False
+        await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "pending_chats": len(self._counts),
+            "pending_events": self._events,
+            "flush_lag_seconds": self.flush_lag(),
+            "flushes": self.flushes,
+            "flushed_events": self.flushed_events,
+            "flush_errors": self.flush_errors,
+            "last_flush_duration_seconds": self.last_flush_duration
+        }
@@ -0,0 +1,188 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from config import logger
+
+ROLLUP_ID = "global"
+
+
+def _group_contribution(doc: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    # Lo que aporta un documento de 'groups' a los contadores del rollup
+    if not doc:
+        return {"active_groups": 0, "inactive_groups": 0, "member_sum": 0, "member_groups": 0}
+    active = doc.get("active", True)
+    members = doc.get("member_count")
+    counted = active and isinstance(members, (int, float))
+    return {
+        "active_groups": 1 if active else 0,
+        "inactive_groups": 0 if active else 1,
+        "member_sum": int(members) if counted else 0,
+        "member_groups": 1 if counted else 0
+    }
+
+
+class StatsRollup:
+    """
+    Documento 'stats_rollup' con los totales de get_general_stats mantenidos de forma
+    incremental (altas/bajas de grupos y vaciados de estadísticas) y un top-K acotado.
+    rebuild() lo recalcula exacto; el reconciliador opcional lo hace periódicamente.
+    """
+
+    def __init__(self, db, top_k: int = 20, reconcile_interval: float = 0):
+        self.db = db
+        self.collection = db.stats_rollup
+        self.top_k = top_k
+        self.reconcile_interval = reconcile_interval
+        self.running = False
+
+        # Métricas
+        self.rebuilds = 0
+        self.last_rebuild_duration = 0.0
+
+    async def read(self) -> Dict[str, Any]:
+        doc = await self.collection.find_one({"_id": ROLLUP_ID})
+        # Sin reconstrucción previa los incrementos no parten de una base exacta
+        if doc is None or "rebuilt_at" not in doc:
+            doc = await self.rebuild()
+        return doc
+
+    async def apply_group_change(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """Aplica la diferencia entre el estado anterior y el nuevo de un grupo"""
+        old, new = _group_contribution(before), _group_contribution(after)
+        inc = {k: new[k] - old[k] for k in new if new[k] != old[k]}
+        if inc:
+            await self.collection.update_one({"_id": ROLLUP_ID}, {"$inc": inc}, upsert=True)
+
+        if after is None:
+            return
+        chat_id = after.get("chat_id")
+        if not after.get("active", True):
+            await self.collection.update_one({"_id": ROLLUP_ID}, {"$pull": {"top": {"chat_id": chat_id}}})
+        elif before and before.get("title") != after.get("title"):
+            await self.collection.update_one(
+                {"_id": ROLLUP_ID},
+                {"$set": {"top.$[entry].title": after.get("title")}},
+                array_filters=[{"entry.chat_id": chat_id}]
+            )
+
+    async def record_welcomes(self, counts: Dict[int, int]):
+        """Se llama tras cada vaciado del buffer de estadísticas con los incrementos escritos"""
+        if not counts:
+            return
+        await self.collection.update_one(
+            {"_id": ROLLUP_ID},
+            {"$inc": {"total_welcomes": sum(counts.values())}, "$set": {"updated_at": datetime.utcnow().isoformat()}},
+            upsert=True
+        )
+
+        # Candidatos al top: los chats del lote con su total ya escrito
+        chat_ids = list(counts)
+        totals = {
+            d["chat_id"]: int(d.get("welcomes_sent", 0))
+            for d in await self.db.stats.find({"chat_id": {"$in": chat_ids}}, {"_id": 0, "chat_id": 1, "welcomes_sent": 1}).to_list(None)
+        }
+        groups = await self.db.groups.find(
+            {"chat_id": {"$in": chat_ids}, "active": True}, {"_id": 0, "chat_id": 1, "title": 1}
+        ).to_list(None)
+        entries = [
+            {"chat_id": g["chat_id"], "title": g.get("title"), "welcomes": totals.get(g["chat_id"], 0)}
+            for g in groups
+        ]
+        if not entries:
+            return
+        # $pull y $push no pueden ir en la misma actualización sobre 'top'
+        await self.collection.update_one({"_id": ROLLUP_ID}, {"$pull": {"top": {"chat_id": {"$in": chat_ids}}}})
+        await self.collection.update_one(
+            {"_id": ROLLUP_ID},
+            {"$push": {"top": {"$each": entries, "$sort": {"welcomes": -1}, "$slice": self.top_k}}}
+        )
+
+    async def rebuild(self) -> Dict[str, Any]:
+        """Recalcula el rollup completo con las consultas exactas sobre 'groups' y 'stats'"""
+        started = asyncio.get_running_loop().time()
+
+        active_groups = await self.db.groups.count_documents({"active": True})
+        inactive_groups = await self.db.groups.count_documents({"active": False})
+
+        agg = await self.db.stats.aggregate([
+            {"$group": {"_id": None, "sum": {"$sum": "$welcomes_sent"}}}
+        ]).to_list(1)
+        total_welcomes = agg[0]["sum"] if agg else 0
+
+        agg_members = await self.db.groups.aggregate([
+            {"$match": {"active": True, "member_count": {"$type": "number"}}},
+            {"$group": {"_id": None, "sum": {"$sum": "$member_count"}, "count": {"$sum": 1}}}
+        ]).to_list(1)
+        member_sum = int(agg_members[0]["sum"]) if agg_members else 0
+        member_groups = agg_members[0]["count"] if agg_members else 0
+
+        top = await self.db.groups.aggregate([
+            {"$match": {"active": True}},
+            {"$lookup": {
+                "from": "stats",
+                "localField": "chat_id",
+                "foreignField": "chat_id",
+                "as": "stats"
+            }},
+            {"$unwind": {"path": "$stats", "preserveNullAndEmptyArrays": True}},
+            {"$addFields": {"welcomes": {"$ifNull": ["$stats.welcomes_sent", 0]}}},
+            {"$sort": {"welcomes": -1}},
+            {"$limit": self.top_k},
+            {"$project": {"_id": 0, "chat_id": 1, "title": 1, "welcomes": 1}}
+        ]).to_list(self.top_k)
+
+        now = datetime.utcnow().isoformat()
+        doc = {
+            "active_groups": active_groups,
+            "inactive_groups": inactive_groups,
+            "total_welcomes": total_welcomes,
+            "member_sum": member_sum,
+            "member_groups": member_groups,
+            "top": [{"chat_id": g.get("chat_id"), "title": g.get("title"), "welcomes": int(g.get("welcomes", 0))} for g in top],
+            "updated_at": now,
+            "rebuilt_at": now
+        }
+        doc = await self.collection.find_one_and_update(
+            {"_id": ROLLUP_ID}, {"$set": doc}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+        self.rebuilds += 1
+        self.last_rebuild_duration = asyncio.get_running_loop().time() - started
+        return doc
+
+    async def start(self):
+        """Reconciliador: reconstruye el rollup exacto cada reconcile_interval segundos"""
+        if not self.reconcile_interval:
+            return
+        self.running = True
+        while self.running:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Error reconstruyendo stats_rollup: {e}")
+
+    async def stop(self):
+        self.running = False
+
+    @staticmethod
+    def top_groups(doc: Dict[str, Any], limit: int = 5) -> List[tuple]:
+        # Las escrituras concurrentes de varias instancias pueden duplicar una entrada: se queda la mayor
+        seen, out = set(), []
+        for entry in sorted(doc.get("top", []), key=lambda e: e.get("welcomes", 0), reverse=True):
+            if entry.get("chat_id") in seen:
+                continue
+            seen.add(entry.get("chat_id"))
+            out.append((entry.get("title"), int(entry.get("welcomes", 0))))
+            if len(out) >= limit:
+                break
+        return out
+
+    def metrics(self) -> dict:
+        return {
+            "rebuilds": self.rebuilds,
+            "last_rebuild_duration_seconds": self.last_rebuild_duration
+        }
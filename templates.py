@@ -0,0 +1,114 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Union
+
+from cache import TTLCache
+from emoji_registry import emoji_registry
+from helpers import add_premium_emojis, format_welcome_message, _user_placeholders, _escape_md_v2, _escape_html
+
+_SLOTS = ("mention", "name", "username", "group_name")
+_SLOT_INDEX = {name: i for i, name in enumerate(_SLOTS)}
+_SLOT_RE = re.compile(r"\{(mention|name|username|group_name)\}")
+
+# Plantillas donde un código de emoji o un placeholder podría formarse al unir texto y valor
+# (p. ej. ":fire_{name}:" o "{{name}}"); esas se renderizan por la ruta clásica
+_UNSAFE_RE = re.compile(
+    r":[\w{}]*\{(?:mention|name|username|group_name)\}[\w{}]*:"
+    r"|\{[\w{}]*\{(?:mention|name|username|group_name)\}"
+    r"|\{(?:mention|name|username|group_name)\}[\w{}]*\}"
+)
+# Un valor con estos caracteres podría reactivar placeholders o emojis al sustituirse
+_UNSAFE_VALUE_RE = re.compile(r"[{}:]")
+
+
+@lru_cache(maxsize=1024)
+def _escape_group(group_name: str, pm: str) -> str:
+    if pm.lower().startswith("markdown"):
+        return _escape_md_v2(group_name)
+    if pm.upper() == "HTML":
+        return _escape_html(group_name)
+    return group_name
+
+
+class CompiledTemplate:
+    """
+    Texto de nodo precompilado para un parse_mode: segmentos literales con los
+    emojis premium ya expandidos y huecos para los placeholders.
+    Renderizar es un único join; la salida es idéntica a format_welcome_message.
+    """
+
+    __slots__ = ("source", "parse_mode", "pm", "literals", "slots", "safe")
+
+    def __init__(self, source: str, parse_mode: Optional[str]):
+        self.source = source or ""
+        self.parse_mode = parse_mode
+        self.pm = (parse_mode or "HTML").strip()
+        emoji_mode = self.pm if (self.pm.lower().startswith("markdown") or self.pm.upper() == "HTML") else None
+
+        self.literals: List[str] = []
+        self.slots: List[int] = []
+        pos = 0
+        for m in _SLOT_RE.finditer(self.source):
+            self.literals.append(add_premium_emojis(self.source[pos:m.start()], emoji_mode))
+            self.slots.append(_SLOT_INDEX[m.group(1)])
+            pos = m.end()
+        self.literals.append(add_premium_emojis(self.source[pos:], emoji_mode))
+        self.safe = not _UNSAFE_RE.search(self.source)
+
+    def render(self, user, group_name: str) -> str:
+        if not self.slots:
+            return self.literals[0]
+        if not self.safe:
+            return format_welcome_message(self.source, user, group_name, parse_mode=self.parse_mode)
+
+        if isinstance(user, (list, tuple)):
+            values = [_user_placeholders(u, self.pm) for u in user]
+            mention = ", ".join(v[0] for v in values)
+            name = ", ".join(v[1] for v in values)
+            username = ", ".join(v[2] for v in values)
+        else:
+            mention, name, username = _user_placeholders(user, self.pm)
+        group_e = _escape_group(group_name or "", self.pm)
+
+        # La parte controlada por el usuario de la mención es el nombre; basta revisar estos tres
+        if _UNSAFE_VALUE_RE.search(name) or _UNSAFE_VALUE_RE.search(username) or _UNSAFE_VALUE_RE.search(group_e):
+            return format_welcome_message(self.source, user, group_name, parse_mode=self.parse_mode)
+
+        values = (mention, name, username, group_e)
+        literals = self.literals
+        out = [literals[0]]
+        for i, slot in enumerate(self.slots, 1):
+            out.append(values[slot])
+            out.append(literals[i])
+        return "".join(out)
+
+
+# Caché de plantillas compiladas: por (node_id, versión, parse_mode) o por texto.
+# La versión del registro de emojis forma parte de la clave: recargarlo recompila
+_template_cache = TTLCache(maxsize=4096, ttl=24 * 3600)
+
+
+def get_node_template(node: Dict[str, Any], parse_mode: Optional[str]) -> CompiledTemplate:
+    key = ("node", node.get("id"), node.get("version", 0), parse_mode, emoji_registry.version)
+    compiled = _template_cache.get(key)
+    if compiled is None or compiled.source != (node.get("text") or ""):
+        compiled = CompiledTemplate(node.get("text") or "", parse_mode)
+        _template_cache.set(key, compiled)
+    return compiled
+
+
+def get_text_template(text: str, parse_mode: Optional[str]) -> CompiledTemplate:
+    key = ("text", text, parse_mode, emoji_registry.version)
+    compiled = _template_cache.get(key)
+    if compiled is None:
+        compiled = CompiledTemplate(text, parse_mode)
+        _template_cache.set(key, compiled)
+    return compiled
+
+
+def render_node_text(node: Dict[str, Any], user: Union[Any, list], group_name: str, parse_mode: Optional[str]) -> str:
+    return get_node_template(node, parse_mode).render(user, group_name)
+
+
+def cache_stats() -> dict:
+    return _template_cache.stats()
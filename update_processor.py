@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class _ChatSlot:
+    __slots__ = ("lock", "waiting")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Procesa en paralelo updates de chats distintos (hasta 'concurrency' a la vez) y en
+    estricto orden de llegada los de un mismo chat, con un candado FIFO por chat.
+    Así un send_photo lento en un grupo no frena al resto, y dentro de un chat no hay
+    carreras (ensure_root_node, set_node_buttons...).
+
+    El semáforo de BaseUpdateProcessor se toma antes de do_process_update; si limitara la
+    concurrencia, los updates en espera del candado de un chat con mucho tráfico ocuparían
+    todas las plazas. Por eso ese semáforo solo acota los updates pendientes (max_pending)
+    y el límite real se aplica dentro, una vez obtenido el turno del chat.
+    """
+
+    __slots__ = ("concurrency", "_running", "_chats", "_inflight", "processed", "max_wait", "max_queue_depth")
+
+    def __init__(self, concurrency: int = 32, max_pending: int = 10000):
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self._running = asyncio.BoundedSemaphore(concurrency)
+        self._chats: Dict[Hashable, _ChatSlot] = {}
+        self._inflight = 0
+
+        # Métricas
+        self.processed = 0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        # Callbacks de mensajes inline y similares: se ordenan por usuario
+        if update.effective_user:
+            return ("user", update.effective_user.id)
+        return None
+
+    def backlog(self) -> int:
+        """Updates aceptados que aún no han terminado (en espera o en curso)"""
+        return self._inflight
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        self._inflight += 1
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            self._inflight -= 1
+
+    async def _process_in_order(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        key = self._chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            self.processed += 1
+            return
+
+        slot = self._chats.get(key)
+        if slot is None:
+            slot = self._chats[key] = _ChatSlot()
+        slot.waiting += 1
+        if slot.waiting > self.max_queue_depth:
+            self.max_queue_depth = slot.waiting
+        queued_at = time.monotonic()
+        try:
+            async with slot.lock:
+                async with self._running:
+                    wait = time.monotonic() - queued_at
+                    if wait > self.max_wait:
+                        self.max_wait = wait
+                    await coroutine
+            self.processed += 1
+        finally:
+            slot.waiting -= 1
+            if slot.waiting == 0:
+                self._chats.pop(key, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def metrics(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "active_chats": len(self._chats),
+            "backlog": self._inflight,
+            "max_wait_seconds": self.max_wait,
+            "max_queue_depth": self.max_queue_depth
+        }